@@ -0,0 +1,8 @@
+"""
+    Offline benchmark suite: a seeded synthetic corpus covering every format
+    detect_and_load_text() handles, a stub llama-server, and a runner that
+    writes machine-readable results for compare.py.
+
+    python -m benchmarks.run --size small --out bench/base.json
+    python -m benchmarks.compare bench/base.json bench/new.json
+"""
@@ -0,0 +1,172 @@
+"""
+    Cleaner throughput and golden check. Seeded book-like texts (wrapped lines,
+    ALL CAPS headers, front matter, page breaks) with Unicode, mojibake, HTML
+    and OCR noise mixed in go through data.filter and through the reference
+    pipeline it replaced (ftfy + NFKC + map + five regex passes + map again).
+    The map is the template plus OCR fixes of the kind update_ocr_fixes()
+    writes, aimed at caps headers, line ends and boilerplate, where the order
+    of the map and the structural passes shows. Outputs must be identical;
+    throughput is reported in MB/s for both.
+
+    python -m benchmarks.cleaning --size medium          # exit 1 on any difference
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import unicodedata
+from pathlib import Path
+from time import perf_counter
+
+from benchmarks.corpus import _document, _wrap
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+
+# Texts per size and paragraphs per text.
+SIZES = {
+    "small": (6, 120),
+    "medium": (16, 400),
+    "large": (40, 1200),
+}
+
+NOISE = [
+    "“quoted”", "‘single’", "it’s", "—", "–", "…", "ﬁnal", "ﬂow", "café", "naïve", "Müller",
+    "Ελληνικά", "кириллица", "ＷＩＤＥ", "\xa0", "\xad", "cafÃ©", "&amp;", "&eacute;", "<i>", "</i>",
+    "\x07", "fa9ade", "medireval", "sub- sequent", "Hermetic A rcanum", "AutJuw", "½", "x²",
+]
+
+FRONT_MATTER = [
+    "Edited by {name}", "Translated by {name}", "TRANſLATED BY {name}", "EDİTED BY {name}",
+    "© 19{n} {name}", "MDCCLXX{n}", "PENES NOS", "All rights reserved.",
+]
+
+# User OCR fixes on top of the template: lowercasing a header word keeps the
+# header line, others change what the line-break and boilerplate passes see.
+GOLDEN_RULES = {
+    r"\bWHALE\b": "whale",
+    r"\bCHAPTER\b": "Chapter",
+    r"\bEdlted\b": "Edited",
+    r"\bend,\b": "end.",
+    r"\bMr\b": "Mr.",
+    r"\bfoot- note\b": "footnote",
+    r"-\n(?=[a-z])": "",
+}
+
+GOLDEN_CASES = [
+    "Intro line.\nCHAPTER ONE THE WHALE\nCall me Ishmael.",
+    "THE WHALE AND THE SEA\nsome text\n\nCHAPTER XII\nMore.",
+    "Edlted by J. Smith\nthe text goes on,\nand on until the end,\nthen stops.",
+    "A long sen-\ntence broken by hyphen-\nation and a foot-\n note.",
+    "Mr\nSmith came. Mr Jones left.\r\nTHE END OF THE WHALE",
+    "ﬁne WHALE\nWHALE WHALE WHALE WHALE\n© 1851 ",
+]
+
+def golden_map() -> dict:
+    from data.jsonhandler import DEFAULT_STRUCTURE
+    norm_map = json.loads(json.dumps(DEFAULT_STRUCTURE))
+    norm_map["ocr_artifacts"].update(GOLDEN_RULES)
+    return norm_map
+
+# ========== Golden Corpus ==========
+def golden_texts(size: str = "small", seed: int = 1234) -> list[str]:
+    """Same size and seed, same texts."""
+    rng = random.Random(seed)
+    count, paragraphs = SIZES[size]
+    texts = []
+    for n in range(count):
+        title, body, _ = _document(rng, paragraphs, set())
+        name = " ".join(rng.choices(body[0].split(), k=2)).title()
+        lines = [title.upper() + rng.choice(["", " WHALE", " THE WHALE"]), ""]
+        lines += [rng.choice(FRONT_MATTER).format(name=name, n=rng.randint(10, 99)) for _ in range(3)] + [""]
+        ascii_only = n % 3 == 0 # a third of the books stay plain ASCII (the fast path)
+        for p in body:
+            if not ascii_only and rng.random() < 0.3:
+                words = p.split(" ")
+                for _ in range(rng.randint(1, 3)):
+                    words.insert(rng.randrange(len(words)), rng.choice(NOISE))
+                p = " ".join(words)
+            lines += _wrap(p, rng.choice([60, 80, 100])) + [""]
+            roll = rng.random()
+            if roll < 0.04:
+                lines += [f"CHAPTER {rng.choice(['I', 'IV', 'XII', 'XLII'])}. {title.upper()}"
+                          + rng.choice(["", " WHALE"]), ""]
+            elif roll < 0.08:
+                lines += ["\f"]
+            elif roll < 0.10:
+                lines += [" ".join(_wrap(" ".join(body), 10**9))] # one very long line
+        text = "\n".join(lines)
+        if not ascii_only: # line ends the OCR fixes act on
+            text = text.replace("ed\n", "ed,\n", 3).replace("th\n", "th-\n", 3).replace(" the\n", " Mr\n", 2)
+        if n % 4 == 1:
+            text = text.replace("\n", "\r\n")
+        texts.append(text)
+    return texts + GOLDEN_CASES
+
+# ========== Reference Pipeline ==========
+def reference_clean(raw: str, norm_map: dict) -> str:
+    """process_text_for_chunking() of a non-.txt file before the single-pass cleaner."""
+    import ftfy
+
+    def apply_normalization(text):
+        for cat in ["ligatures", "punctuation"]:
+            for bad, good in norm_map.get(cat, {}).items():
+                text = text.replace(bad, good)
+        for pattern, repl in norm_map.get("ocr_artifacts", {}).items():
+            text = re.sub(pattern, repl, text)
+        return text
+
+    text = apply_normalization(unicodedata.normalize("NFKC", ftfy.fix_text(raw)))
+    text = text.strip()
+    text = re.sub(r"\n\s*\n", "\n", text)
+    text = re.sub(r"(?<![.?!])\n(?![A-Z])", " ", text)
+    text = re.sub(r"^[A-Z\s\.\'\"]{10,}$", "", text, flags=re.MULTILINE)
+    text = re.sub(r"(?:Edited by|Translated by|PENES NOS|MDC.*|©.*)", "", text, flags=re.IGNORECASE)
+    text = re.sub(r" {2,}", " ", text)
+    return apply_normalization(text)
+
+# ========== Runner ==========
+def run_cleaning(size: str = "small", seed: int = 1234) -> dict:
+    """Throughput of data.filter.clean_text and the reference, and how many outputs differ."""
+    if str(SRC_DIR) not in sys.path:
+        sys.path.insert(0, str(SRC_DIR))
+    from data.filter import clean_text
+    from data.jsonhandler import Normalizer
+
+    texts = golden_texts(size, seed)
+    total_mb = sum(len(text.encode("utf-8")) for text in texts) / 2**20
+    norm_map = golden_map()
+    normalize = Normalizer(norm_map)
+    clean = lambda text: normalize(clean_text(text, normalize)) # as process_text_for_chunking()
+    clean(texts[0][:10000]) # warm-up: ftfy loads its tables on first use
+    reference_clean(texts[0][:10000], norm_map)
+
+    start = perf_counter()
+    cleaned = [clean(text) for text in texts]
+    seconds = perf_counter() - start
+    start = perf_counter()
+    expected = [reference_clean(text, norm_map) for text in texts]
+    reference_seconds = perf_counter() - start
+
+    return {
+        "clean_mb_per_sec": round(total_mb / seconds, 3),
+        "clean_reference_mb_per_sec": round(total_mb / reference_seconds, 3),
+        "clean_mismatches": sum(a != b for a, b in zip(cleaned, expected)),
+        "clean_texts": len(texts),
+        "clean_mb": round(total_mb, 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Cleaner throughput and golden check")
+    parser.add_argument("--size", choices=SIZES, default="small", help="Golden corpus size")
+    parser.add_argument("--seed", type=int, default=1234, help="Golden corpus seed")
+    args = parser.parse_args()
+
+    results = run_cleaning(args.size, args.seed)
+    print(json.dumps(results, indent=2))
+    if results["clean_mismatches"]:
+        print(f"[Fail] {results['clean_mismatches']} of {results['clean_texts']} texts differ from the reference")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
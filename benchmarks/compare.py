@@ -0,0 +1,70 @@
+"""
+    Compare two benchmark result files and exit non-zero on regressions.
+
+    python -m benchmarks.compare base.json new.json --threshold 10
+"""
+import argparse
+import json
+import sys
+
+# Metrics where a larger value is better; everything else (seconds, ms, MB) is lower-is-better.
+HIGHER_IS_BETTER = ("_per_sec", "recall_at_")
+# Bookkeeping values that are not performance.
+IGNORED = {"index_vectors", "clean_texts", "clean_mb", "clean_mismatches"}
+
+def higher_is_better(name: str) -> bool:
+    return any(marker in name for marker in HIGHER_IS_BETTER)
+
+def compare(base: dict, new: dict, threshold: float) -> tuple[list, list]:
+    rows, regressions = [], []
+    for name in sorted(set(base["results"]) & set(new["results"]) - IGNORED):
+        old, cur = base["results"][name], new["results"][name]
+        if not old or cur is None:
+            continue
+        change = (cur - old) / abs(old) * 100
+        worse = -change if higher_is_better(name) else change
+        status = "REGRESSION" if worse > threshold else "improved" if worse < -threshold else ""
+        rows.append((name, old, cur, change, status))
+        if status == "REGRESSION":
+            regressions.append(name)
+    return rows, regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Percent change counted as a regression")
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    for key in ("size", "seed", "k", "embedding"):
+        if base["meta"].get(key) != new["meta"].get(key):
+            print(f"[Warn] {key} differs: {base['meta'].get(key)} vs {new['meta'].get(key)}")
+
+    rows, regressions = compare(base, new, args.threshold)
+    width = max((len(r[0]) for r in rows), default=10)
+    print(f"{'metric':<{width}}  {'base':>12}  {'new':>12}  {'change':>8}")
+    for name, old, cur, change, status in rows:
+        print(f"{name:<{width}}  {old:>12.3f}  {cur:>12.3f}  {change:>+7.1f}%  {status}")
+
+    for fmt, stats in new.get("formats", {}).items():
+        before = base.get("formats", {}).get(fmt, {})
+        if before.get("loaded") is not None and stats["loaded"] < before["loaded"]:
+            print(f"[Regression] {fmt}: {before['loaded']} -> {stats['loaded']} files loaded")
+            regressions.append(f"formats.{fmt}.loaded")
+
+    if new["results"].get("clean_mismatches"):
+        print(f"[Regression] cleaner output differs from the reference on {new['results']['clean_mismatches']} texts")
+        regressions.append("clean_mismatches")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold}%: {', '.join(regressions)}")
+        sys.exit(1)
+    print("\nNo regressions.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+    Seeded synthetic corpus. Every file is built from a fixed word list plus a
+    few planted "facts" - sentences carrying two made-up marker words - whose
+    source file is known, so recall@k can be measured without labelled data.
+    Same seed and size, byte-identical corpus.
+"""
+import json
+import random
+import zipfile
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+WORDS = """
+    the of and to in is was for on that with as by at from this be are or an it
+    which not have has had were but all their one can more other time new some
+    these may such two first also into only after over would most where when then
+    water system house paper river market engine garden letter window winter
+    summer island station office forest mountain village road bridge city school
+    church castle harbour kitchen library museum theatre factory machine battery
+    signal circuit voltage current copper iron steel glass stone timber cotton
+    wool grain bread salt sugar coffee tea wine apple orange lemon carrot onion
+    pepper butter cheese honey flour recipe oven kettle spoon basket bottle
+    record report survey table chart figure volume chapter section index method
+    theory model sample result value measure method process network protocol
+    server client query answer reason question history science nature culture
+    language music painting colour light sound heat pressure weather climate
+    ocean coast valley desert plain field farm animal horse sheep bird fish tree
+    flower seed root leaf branch north south east west early late long short
+    great small large old young high low open close simple common public private
+    local national ancient modern careful quiet bright dark heavy light strong
+""".split()
+
+SYLLABLES = ["ka", "lo", "mi", "ven", "tor", "quil", "zar", "pex", "dru", "sol",
+             "nyx", "ber", "vo", "th", "ix", "mar", "gul", "fen", "orr", "yst"]
+
+# Files per format and paragraphs per file.
+SIZES = {
+    "small": (3, 8),
+    "medium": (12, 40),
+    "large": (40, 160),
+}
+
+FORMATS = ["txt", "pdf", "epub", "html", "rtf", "atom", "wordpress", "blogspot"]
+
+EXTENSIONS = {"wordpress": ".xml", "blogspot": ".xml"}
+
+FACTS_PER_FILE = 2
+
+# ========== Text ==========
+def _sentence(rng, n=None):
+    words = rng.choices(WORDS, k=n or rng.randint(8, 18))
+    return " ".join(words).capitalize() + "."
+
+def _paragraph(rng):
+    return " ".join(_sentence(rng) for _ in range(rng.randint(3, 6)))
+
+def _marker(rng, used):
+    while True:
+        word = "".join(rng.choices(SYLLABLES, k=4))
+        if word not in used:
+            used.add(word)
+            return word
+
+def _document(rng, paragraphs, used):
+    """ Returns (title, paragraphs, facts). Facts are planted into random paragraphs. """
+    title = " ".join(rng.choices(WORDS[40:], k=3)).title()
+    body = [_paragraph(rng) for _ in range(paragraphs)]
+    facts = []
+    for _ in range(FACTS_PER_FILE):
+        a, b = _marker(rng, used), _marker(rng, used)
+        context = rng.choices(WORDS[40:], k=4)
+        fact = f"The {a} {context[0]} {context[1]} is kept near the {b} {context[2]} {context[3]}."
+        slot = rng.randrange(len(body))
+        body[slot] = f"{body[slot]} {fact}"
+        facts.append({"fact": fact, "query": f"{a} {context[0]} {context[1]} {b} {context[2]}"})
+    return title, body, facts
+
+# ========== Format Writers ==========
+def write_txt(path, title, paragraphs):
+    path.write_text(title + "\n\n" + "\n\n".join(paragraphs) + "\n", encoding="utf-8")
+
+def write_html(path, title, paragraphs):
+    body = "\n".join(f"<p>{escape(p)}</p>" for p in paragraphs)
+    path.write_text(f"<!DOCTYPE html>\n<html><head><title>{escape(title)}</title></head>"
+                    f"<body><h1>{escape(title)}</h1>\n{body}\n</body></html>\n", encoding="utf-8")
+
+def write_rtf(path, title, paragraphs):
+    body = "".join(f"{p}\\par\n" for p in [title] + paragraphs)
+    path.write_text("{\\rtf1\\ansi\\deff0{\\fonttbl{\\f0 Times New Roman;}}\\f0\\fs24\n" + body + "}\n",
+                    encoding="ascii")
+
+def _wrap(text, width=90):
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + len(word) + 1 > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+def write_pdf(path, title, paragraphs, lines_per_page=50):
+    # Minimal PDF 1.4 with Helvetica text; enough for pypdf's extract_text().
+    lines = [title, ""]
+    for p in paragraphs:
+        lines += _wrap(p) + [""]
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)]
+
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in pages:
+        ops = ["BT", "/F1 10 Tf", "12 TL", "50 770 Td"]
+        ops += ["(" + line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ") Tj T*" for line in page]
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id)
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % k for k in kids), len(kids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    path.write_bytes(bytes(out))
+
+def write_epub(path, title, paragraphs, paragraphs_per_chapter=10):
+    chapters = [paragraphs[i:i + paragraphs_per_chapter] for i in range(0, len(paragraphs), paragraphs_per_chapter)]
+    manifest = "".join(f'<item id="c{i}" href="c{i}.xhtml" media-type="application/xhtml+xml"/>'
+                       for i in range(len(chapters)))
+    spine = "".join(f'<itemref idref="c{i}"/>' for i in range(len(chapters)))
+    opf = ('<?xml version="1.0" encoding="utf-8"?>\n'
+           '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="id">'
+           '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+           f'<dc:identifier id="id">{escape(path.stem)}</dc:identifier><dc:title>{escape(title)}</dc:title>'
+           '<dc:language>en</dc:language></metadata>'
+           f'<manifest>{manifest}</manifest><spine>{spine}</spine></package>')
+    container = ('<?xml version="1.0"?>\n'
+                 '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+                 '<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>'
+                 '</rootfiles></container>')
+    # Fixed timestamps keep the zip byte-identical across runs.
+    def add(zf, name, data, method=zipfile.ZIP_DEFLATED):
+        zf.writestr(zipfile.ZipInfo(name, date_time=(2000, 1, 1, 0, 0, 0)), data, compress_type=method)
+    with zipfile.ZipFile(path, "w") as zf:
+        add(zf, "mimetype", "application/epub+zip", zipfile.ZIP_STORED) # must be first and stored
+        add(zf, "META-INF/container.xml", container)
+        add(zf, "OEBPS/content.opf", opf)
+        for i, chapter in enumerate(chapters):
+            body = "".join(f"<p>{escape(p)}</p>" for p in chapter)
+            add(zf, f"OEBPS/c{i}.xhtml",
+                '<?xml version="1.0" encoding="utf-8"?>\n<html xmlns="http://www.w3.org/1999/xhtml">'
+                f"<head><title>{escape(title)}</title></head><body>{body}</body></html>")
+
+def _posts(title, paragraphs, per_post=3):
+    for n, i in enumerate(range(0, len(paragraphs), per_post)):
+        yield f"{title} {n + 1}", f"2020-01-{n % 28 + 1:02d}T12:00:00Z", paragraphs[i:i + per_post]
+
+def write_atom(path, title, paragraphs):
+    entries = "".join(
+        f"<entry><title>{escape(t)}</title><published>{date}</published>"
+        f"<content type=\"html\">{escape(''.join(f'<p>{p}</p>' for p in body))}</content></entry>\n"
+        for t, date, body in _posts(title, paragraphs))
+    path.write_text('<?xml version="1.0" encoding="utf-8"?>\n<feed xmlns="http://www.w3.org/2005/Atom">'
+                    f"<title>{escape(title)}</title>\n{entries}</feed>\n", encoding="utf-8")
+
+def write_blogspot(path, title, paragraphs):
+    kind = "http://schemas.google.com/blogger/2008/kind#post"
+    entries = "".join(
+        f'<entry><category scheme="http://schemas.google.com/g/2005#kind" term="{kind}"/>'
+        f"<title>{escape(t)}</title><published>{date}</published>"
+        f"<content type=\"html\">{escape(''.join(f'<p>{p}</p>' for p in body))}</content></entry>\n"
+        for t, date, body in _posts(title, paragraphs))
+    path.write_text('<?xml version="1.0" encoding="utf-8"?>\n'
+                    '<feed xmlns="http://www.w3.org/2005/Atom" xmlns:blogger="http://schemas.google.com/blogger/2008">'
+                    f"<generator>Blogger</generator><title>{escape(title)}</title>\n{entries}</feed>\n",
+                    encoding="utf-8")
+
+def write_wordpress(path, title, paragraphs):
+    items = "".join(
+        f"<item><title>{escape(t)}</title><pubDate>{date}</pubDate>"
+        f"<content:encoded><![CDATA[{''.join(f'<p>{p}</p>' for p in body)}]]></content:encoded>"
+        "<wp:post_type>post</wp:post_type></item>\n"
+        for t, date, body in _posts(title, paragraphs))
+    path.write_text('<?xml version="1.0" encoding="utf-8"?>\n'
+                    '<rss version="2.0" xmlns:content="http://purl.org/rss/1.0/modules/content/" '
+                    'xmlns:wp="http://wordpress.org/export/1.2/"><channel>'
+                    f"<title>{escape(title)}</title>\n{items}</channel></rss>\n", encoding="utf-8")
+
+WRITERS = {
+    "txt": write_txt, "pdf": write_pdf, "epub": write_epub, "html": write_html, "rtf": write_rtf,
+    "atom": write_atom, "wordpress": write_wordpress, "blogspot": write_blogspot,
+}
+
+# ========== Generator ==========
+def generate_corpus(out_dir, size="small", seed=1234, formats=FORMATS) -> list[dict]:
+    """ Writes the corpus under out_dir and returns one manifest entry per file:
+        {"path", "format", "title", "facts": [{"fact", "query"}]} """
+    files_per_format, paragraphs = SIZES[size]
+    rng = random.Random(seed)
+    used = set()
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    manifest = []
+    for fmt in formats:
+        for i in range(files_per_format):
+            title, body, facts = _document(rng, paragraphs, used)
+            path = out_dir / fmt / f"{fmt}_{i:03d}{EXTENSIONS.get(fmt, '.' + fmt)}"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            WRITERS[fmt](path, title, body)
+            manifest.append({"path": str(path), "format": fmt, "title": title, "facts": facts})
+
+    (out_dir.parent / "corpus_manifest.json").write_text(json.dumps(manifest, indent=2))
+    return manifest
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Generate the synthetic benchmark corpus")
+    parser.add_argument("out_dir")
+    parser.add_argument("--size", choices=SIZES, default="small")
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+    files = generate_corpus(args.out_dir, args.size, args.seed)
+    print(f"Wrote {len(files)} files to {args.out_dir}")
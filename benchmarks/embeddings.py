@@ -0,0 +1,29 @@
+"""
+    Deterministic feature-hashing embeddings so the benchmark runs offline on
+    a CPU box. Quality is bag-of-words, which is enough for the planted-fact
+    recall check; use --embedding model to measure the real model instead.
+"""
+import hashlib
+import re
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+_TOKEN = re.compile(r"\w+")
+
+class HashingEmbeddings(Embeddings):
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _embed(self, text: str) -> list[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in _TOKEN.findall(text.lower()):
+            digest = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+            vector[digest % self.dim] += 1.0 if digest >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
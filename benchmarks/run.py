@@ -0,0 +1,226 @@
+"""
+    Benchmark runner. Generates the seeded corpus in a scratch workspace, then
+    measures ingestion (files/sec), cleaner MB/s, index build time, query
+    latency p50/p99, recall@k on planted facts, end-to-end RAG latency against
+    the stub llama-server and peak RSS per phase. Results are written as JSON for
+    benchmarks/compare.py.
+
+    python -m benchmarks.run --size medium --out bench/results.json
+    python -m benchmarks.run --embedding model --model-path /models/bge-small-en
+    python -m benchmarks.run --size large --index-bytes 64   # SQ/PQ index, see INDEX_BYTES_PER_VECTOR
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+
+from benchmarks.cleaning import run_cleaning
+from benchmarks.corpus import FORMATS, SIZES, generate_corpus
+from benchmarks.stub_llama import start_stub
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SRC_DIR = REPO_ROOT / "src"
+TOPIC = "bench"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline RAG benchmarks")
+    parser.add_argument("--size", choices=SIZES, default="small", help="Corpus size")
+    parser.add_argument("--seed", type=int, default=1234, help="Corpus seed")
+    parser.add_argument("--k", type=int, default=5, help="Top-k for retrieval and recall@k")
+    parser.add_argument("--embedding", choices=["hashing", "model"], default="hashing",
+                        help="hashing: offline feature hashing; model: HuggingFace model from --model-path")
+    parser.add_argument("--model-path", type=str, default=None, help="Local embedding model directory")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Stub llama-server seconds per completion")
+    parser.add_argument("--e2e-queries", type=int, default=20, help="Queries sent through the full RAG pipeline")
+    parser.add_argument("--warmup", type=int, default=3, help="Untimed queries before measuring")
+    parser.add_argument("--workdir", type=str, default=None, help="Workspace (default: a temp dir, removed afterwards)")
+    parser.add_argument("--index-bytes", type=int, default=0,
+                        help="INDEX_BYTES_PER_VECTOR for the index (0: exact float32)")
+    parser.add_argument("--chunk-unit", choices=["chars", "tokens"], default="chars",
+                        help="CHUNK_UNIT; tokens use the tokenizer of --model-path (else EMBED_MODEL_NAME)")
+    parser.add_argument("--ocr-skip", action="store_true", help="Disable OCR artifact detection (read by the chunker too)")
+    parser.add_argument("--log-level", type=str.upper, default="WARNING", help="Log level while benchmarking")
+    parser.add_argument("--out", type=str, default="benchmark_results.json", help="Results file")
+    return parser.parse_args()
+
+# ========== Helpers ==========
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # KiB on Linux
+
+def percentile(samples, q):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+def latency_summary(prefix, seconds) -> dict:
+    ms = [s * 1000 for s in seconds]
+    return {
+        f"{prefix}_p50_ms": round(percentile(ms, 0.5), 3) if ms else None,
+        f"{prefix}_p99_ms": round(percentile(ms, 0.99), 3) if ms else None,
+        f"{prefix}_mean_ms": round(sum(ms) / len(ms), 3) if ms else None,
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_embedding(args):
+    if args.embedding == "hashing":
+        from benchmarks.embeddings import HashingEmbeddings
+        return HashingEmbeddings()
+    if not args.model_path:
+        sys.exit("[Fatal] --embedding model needs --model-path")
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=args.model_path, model_kwargs={"device": "cpu"},
+                                 encode_kwargs={"normalize_embeddings": True})
+
+# ========== Benchmark ==========
+def run(args, workdir: Path) -> dict:
+    data_path = workdir / "data" / TOPIC
+    db_path = workdir / "db" / TOPIC
+    manifest = generate_corpus(data_path, args.size, args.seed)
+    total_bytes = sum(os.path.getsize(entry["path"]) for entry in manifest)
+
+    stub = start_stub(latency=args.llm_latency)
+    # Everything below reads its configuration at import time.
+    os.environ.update(TOPIC=TOPIC, DATA_DIR=str(workdir / "data"), DB_DIR=str(workdir / "db"),
+                      LLAMA_SERVER_HOST="127.0.0.1", LLAMA_SERVER_PORT=str(stub.server_port),
+                      INDEX_BYTES_PER_VECTOR=str(args.index_bytes), CHUNK_UNIT=args.chunk_unit)
+    if args.model_path:
+        os.environ["CHUNK_TOKENIZER"] = args.model_path
+    os.chdir(workdir) # data.db resolves db/<topic>/metadata.db against the cwd
+    sys.path.insert(0, str(SRC_DIR))
+
+    from context.chunker import split_into_chunks
+    from context.provenance import run_rag_with_provenance
+    from context.retriever import chunk_documents
+    from context.store import create_vector_store, index_report
+    from data.db import connect, get_all_chunks, init_db
+    from server.logger import setup_logging
+    from server.metrics import dump_json
+
+    setup_logging(args.log_level)
+
+    def split_file(text, path):
+        return split_into_chunks(text, filename=path)
+
+    results, rss = {}, {"start": peak_rss_mb()}
+    embedding = load_embedding(args)
+    rss["embedding"] = peak_rss_mb()
+
+    # ========== Ingestion ==========
+    init_db(rebuild=True)
+    start = perf_counter()
+    chunk_documents(str(data_path), split_file)
+    elapsed = perf_counter() - start
+    rss["ingest"] = peak_rss_mb()
+    results.update(ingest_seconds=round(elapsed, 3),
+                   ingest_files_per_sec=round(len(manifest) / elapsed, 3),
+                   ingest_mb_per_sec=round(total_bytes / 2**20 / elapsed, 3))
+
+    # ========== Cleaning (golden check against the reference cleaner) ==========
+    results.update(run_cleaning(args.size, args.seed))
+
+    with connect() as conn:
+        loaded_paths = {Path(row[0]).resolve() for row in conn.execute("SELECT path FROM documents")}
+
+    # ========== Index Build ==========
+    chunks = get_all_chunks(TOPIC)
+    if not chunks:
+        raise RuntimeError("No chunks were ingested; check the loaders for this corpus.")
+    start = perf_counter()
+    retriever = create_vector_store(str(db_path), chunks, embedding)
+    results.update(index_build_seconds=round(perf_counter() - start, 3), index_vectors=len(chunks))
+    rss["index"] = peak_rss_mb()
+    store = retriever.vectorstore
+    retriever.k = args.k
+
+    # ========== Query Latency and Recall ==========
+    queries = [(fact["query"], Path(entry["path"]).resolve(), entry["format"])
+               for entry in manifest for fact in entry["facts"]]
+    for query, _, _ in queries[:args.warmup]:
+        store.similarity_search_with_score(query, k=args.k)
+
+    latencies, hits = [], {fmt: [0, 0] for fmt in FORMATS}
+    for query, expected, fmt in queries:
+        start = perf_counter()
+        found = store.similarity_search_with_score(query, k=args.k)
+        latencies.append(perf_counter() - start)
+        hit = any(Path(src["path"]).resolve() == expected for doc, _ in found for src in doc.metadata["sources"])
+        hits[fmt][0] += hit
+        hits[fmt][1] += 1
+    rss["query"] = peak_rss_mb()
+    results.update(latency_summary("query", latencies))
+    results[f"recall_at_{args.k}"] = round(sum(h for h, _ in hits.values()) / len(queries), 4)
+    index = index_report(store, k=args.k)
+    results.update(index_mode=index["mode"], index_mb=index["index_mb"],
+                   index_recall_at_k=index.get(f"recall_at_{args.k}_reranked"))
+
+    # ========== End-to-end RAG (stub LLM) ==========
+    e2e = []
+    for query, _, _ in queries[:args.e2e_queries]:
+        start = perf_counter()
+        run_rag_with_provenance(query, retriever)
+        e2e.append(perf_counter() - start)
+    results.update(latency_summary("e2e", e2e))
+    rss["e2e"] = peak_rss_mb()
+    stub.shutdown()
+
+    results.update({f"rss_peak_mb_{phase}": round(mb, 1) for phase, mb in rss.items()})
+    formats = {}
+    for fmt in FORMATS:
+        files = [Path(e["path"]).resolve() for e in manifest if e["format"] == fmt]
+        if files:
+            formats[fmt] = {"files": len(files), "loaded": sum(p in loaded_paths for p in files),
+                            "recall": round(hits[fmt][0] / hits[fmt][1], 4) if hits[fmt][1] else None}
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "size": args.size, "seed": args.seed, "k": args.k,
+            "embedding": args.embedding if args.embedding == "hashing" else args.model_path,
+            "llm_latency": args.llm_latency, "index_bytes": args.index_bytes, "chunk_unit": args.chunk_unit,
+            "files": len(manifest), "corpus_bytes": total_bytes, "queries": len(queries),
+        },
+        "results": results,
+        "formats": formats,
+        "metrics": dump_json(),
+    }
+
+def main():
+    args = parse_args()
+    out = Path(args.out).resolve() # before the runner changes directory
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="rag_bench_")).resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+    cwd = os.getcwd()
+    try:
+        report = run(args, workdir)
+    finally:
+        os.chdir(cwd)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2, default=str))
+    print(json.dumps(report["results"], indent=2))
+    print(json.dumps(report["formats"], indent=2))
+    print(f"[Bench] Results written to {out}")
+
+if __name__ == "__main__":
+    main()
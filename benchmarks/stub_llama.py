@@ -0,0 +1,88 @@
+"""
+    Stub llama-server: GET /health and POST /v1/completions (plain and SSE
+    streaming) with a configurable fixed latency, so end-to-end RAG latency
+    can be measured without a GPU or a model.
+
+    python -m benchmarks.stub_llama --port 8080 --latency 0.05
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    tokens = 32
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/v1/completions":
+            self._send_json(404, {"error": "not found"})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        n = min(self.tokens, int(payload.get("max_tokens") or self.tokens))
+        words = [f"token{i}" for i in range(n)]
+
+        if not payload.get("stream"):
+            time.sleep(self.latency)
+            self._send_json(200, {"object": "text_completion", "model": "stub",
+                                  "choices": [{"index": 0, "text": " ".join(words), "finish_reason": "length"}],
+                                  "usage": {"prompt_tokens": len(payload.get("prompt", "").split()),
+                                            "completion_tokens": n}})
+            return
+
+        # Latency is spread across the tokens so time-to-first-token is measurable.
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        delay = self.latency / max(n, 1)
+        for word in words:
+            time.sleep(delay)
+            chunk = {"choices": [{"index": 0, "text": word + " ", "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+def start_stub(host="127.0.0.1", port=0, latency=0.0, tokens=32) -> ThreadingHTTPServer:
+    """ Starts the stub in a daemon thread; port=0 picks a free port (server.server_port). """
+    handler = type("StubHandler", (_Handler,), {"latency": latency, "tokens": tokens})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-llama", daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Stub llama-server for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds per completion")
+    parser.add_argument("--tokens", type=int, default=32, help="Tokens per completion")
+    args = parser.parse_args()
+    server = start_stub(args.host, args.port, args.latency, args.tokens)
+    print(f"Stub llama-server on http://{args.host}:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,353 @@
+"""
+    HTTP API for programs and other services: the RAG pipeline without the
+    Gradio chat interface, so a request costs little more than the pipeline.
+
+    POST /retrieve              {"query", "k"?} -> chunks, scores and provenance
+    POST /ask                   {"question", "stream"?} -> NDJSON lines: sources,
+                                answer pieces as the LLM writes them, done
+    POST /v1/chat/completions   OpenAI chat format ("stream" supported); RAG on
+                                the last user message, sources in "sources"
+    GET  /v1/models, /health, /ready, /metrics
+
+    Questions accept the same filter prefix as the CLI (type:pdf after:2024-01-01 ...).
+    Every response carries X-Request-ID (the caller's, or a new one). At most
+    API_MAX_CONCURRENCY requests run the pipeline at once per process; others
+    wait up to API_QUEUE_TIMEOUT, then get 503. Non-streaming requests get 504
+    after API_TIMEOUT; streams end when the LLM sends nothing for LLM_TIMEOUT.
+
+    python src/api.py --topic tech
+    python src/api.py --topic tech --snapshot tech.ragsnap --workers 4
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from time import perf_counter
+from typing import Any, Optional, Union
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+from config import (
+    API_HOST, API_KEEPALIVE, API_MAX_CONCURRENCY, API_MODEL_NAME, API_PORT, API_QUEUE_TIMEOUT, API_TIMEOUT,
+    LLM_WARMUP_TIMEOUT, QUERY_WAIT_TIMEOUT)
+from main import setup_retriever, load_embedding
+from context.provenance import hit_record, retrieve_scored, stream_rag_with_provenance
+from server.llm import parse_args, wait_for_llama_server, log_runtime_info
+from server.logger import setup_logging
+from server.metrics import count, observe, render_prometheus, timed
+from server.prefork import serve
+from server.warmup import Readiness, RetrieverHolder, DeferredEmbeddings, start_component, stop_on_failure
+
+logger = logging.getLogger(__name__)
+
+RETRIEVE_COMPONENTS = ["embedding", "index"]
+COMPONENTS = RETRIEVE_COMPONENTS + ["llm"]
+
+readiness = Readiness(COMPONENTS)
+retriever_holder = RetrieverHolder()
+
+# ========== Warm-up ==========
+def warm_up(args, embedding_loader=load_embedding):
+    # As in webui.py: index, embedding model and LLM connection load concurrently.
+    embedding = DeferredEmbeddings()
+    start_component(readiness, "embedding", embedding.load, embedding_loader)
+    start_component(readiness, "index", lambda: retriever_holder.swap(setup_retriever(args, embedding)))
+    start_component(readiness, "llm", wait_for_llama_server, LLM_WARMUP_TIMEOUT)
+
+async def _require(components: list[str]):
+    if readiness.is_ready(components):
+        return
+    if not await run_in_threadpool(readiness.wait, components, QUERY_WAIT_TIMEOUT):
+        failed = readiness.failed()
+        detail = f"Failed to load: {', '.join(failed)}" if failed else \
+                 f"Still warming up ({', '.join(readiness.pending(components))})"
+        raise HTTPException(503, detail, headers={"Retry-After": "5"})
+
+# ========== Request IDs and Limits ==========
+class RequestContext:
+    """ ASGI middleware: X-Request-ID in and out, per-endpoint latency metrics.
+        Plain ASGI rather than BaseHTTPMiddleware, which buffers streams. """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        request_id = next((value.decode("latin-1")[:128] for key, value in scope["headers"]
+                           if key == b"x-request-id"), None) or uuid.uuid4().hex
+        scope.setdefault("state", {})["request_id"] = request_id
+        status = 500
+        start = perf_counter()
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            seconds = perf_counter() - start
+            endpoint = getattr(scope.get("endpoint"), "__name__", "unmatched")
+            observe("api", endpoint, seconds, status=str(status))
+            logger.debug("[API] %s %s %s %d %.1fms", request_id, scope["method"], scope["path"], status, seconds * 1000)
+
+class PipelineSlots:
+    """ Caps the requests running the pipeline in this process. A request that
+        cannot get a slot within API_QUEUE_TIMEOUT is rejected with 503. """
+    def __init__(self, size: int):
+        self._semaphore = asyncio.Semaphore(size)
+
+    async def acquire(self):
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), API_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            count("api_rejected", pipeline="api")
+            raise HTTPException(503, "Too many requests in flight; retry shortly", headers={"Retry-After": "1"})
+
+    def release(self):
+        self._semaphore.release()
+
+slots = PipelineSlots(API_MAX_CONCURRENCY)
+
+async def _call(fn, *args):
+    # Blocking pipeline code runs in the thread pool; the event loop only moves bytes.
+    try:
+        return await asyncio.wait_for(run_in_threadpool(fn, *args), API_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(504, f"Timed out after {API_TIMEOUT:.0f}s")
+
+class _Body:
+    """ Response lines, produced in the thread pool. close() waits for a line
+        in progress, so a request cancelled mid-line can still close it. """
+    def __init__(self, lines, pieces):
+        self.lines = lines
+        self.pieces = pieces
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self._lock:
+            return next(self.lines)
+
+    def close(self):
+        with self._lock:
+            self.lines.close()
+            self.pieces.close() # closes the llama-server connection: generation stops
+
+async def _stream(lines, pieces):
+    # Frees the slot and stops the LLM when the stream ends, the client
+    # leaves or the request times out.
+    body = _Body(lines, pieces)
+    try:
+        async for line in iterate_in_threadpool(body):
+            yield line
+    finally:
+        slots.release()
+        asyncio.get_running_loop().run_in_executor(None, body.close)
+
+async def _prepend(first, rest):
+    yield first
+    async for item in rest:
+        yield item
+
+async def _streaming_response(lines, pieces, media_type: str) -> StreamingResponse:
+    body = _stream(lines, pieces)
+    # Started here: asyncio closes a started generator (running its finally)
+    # even if the client is gone before the response body is sent.
+    first = await body.__anext__()
+    return StreamingResponse(_prepend(first, body), media_type=media_type)
+
+async def _collect(pieces) -> str:
+    """The whole answer (non-streaming requests); 504 after API_TIMEOUT."""
+    async def join():
+        return "".join([piece async for piece in _stream(pieces, pieces)])
+    try:
+        return await asyncio.wait_for(join(), API_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(504, f"Timed out after {API_TIMEOUT:.0f}s")
+
+async def _start_rag(question: str):
+    """Take a slot, retrieve, and start generating: (hits, answer pieces)."""
+    await _require(COMPONENTS)
+    await slots.acquire()
+    try:
+        return await _call(stream_rag_with_provenance, question, retriever_holder.get())
+    except BaseException:
+        slots.release()
+        raise
+
+# ========== Request Bodies ==========
+class RetrieveRequest(BaseModel):
+    query: str
+    k: Optional[int] = Field(None, ge=1, le=100) # default: the retriever's k
+
+class AskRequest(BaseModel):
+    question: str
+    stream: bool = True
+
+class ChatMessage(BaseModel):
+    role: str
+    content: Union[str, list[dict[str, Any]], None] = None
+
+class ChatRequest(BaseModel):
+    # Sampling fields (temperature, max_tokens, ...) are accepted and ignored:
+    # generation uses the same settings as the web UI.
+    model: Optional[str] = None
+    messages: list[ChatMessage]
+    stream: bool = False
+
+def _last_user_message(messages: list[ChatMessage]) -> str:
+    for message in reversed(messages):
+        if message.role != "user":
+            continue
+        content = message.content
+        if isinstance(content, list): # [{"type": "text", "text": ...}, ...]
+            content = " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+        if content and content.strip():
+            return content.strip()
+    raise HTTPException(400, "messages has no user message")
+
+def _provenance(hits) -> list[dict]:
+    # Chat responses carry where the answer came from, not the chunk texts.
+    return [{key: value for key, value in hit_record(doc, score).items() if key != "text"} for doc, score in hits]
+
+def _json_line(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False) + "\n"
+
+# ========== Endpoints ==========
+def build_app() -> FastAPI:
+    app = FastAPI(title="Local RAG API")
+    app.add_middleware(RequestContext)
+
+    @app.get("/health")
+    def health():
+        return {"status": "ok"}
+
+    @app.get("/ready")
+    def ready():
+        snapshot = readiness.snapshot()
+        return JSONResponse(snapshot, status_code=200 if snapshot["ready"] else 503)
+
+    @app.get("/metrics")
+    def metrics():
+        return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+    @app.post("/retrieve")
+    async def retrieve(body: RetrieveRequest, request: Request):
+        await _require(RETRIEVE_COMPONENTS)
+        retriever = retriever_holder.get()
+        if body.k is not None:
+            retriever = retriever.model_copy(update={"k": body.k})
+
+        def run():
+            count("queries", pipeline="query")
+            with timed("query", "total"):
+                return retrieve_scored(body.query, retriever)[1]
+
+        await slots.acquire()
+        try:
+            hits = await _call(run)
+        finally:
+            slots.release()
+        return JSONResponse({"request_id": request.state.request_id,
+                             "hits": [hit_record(doc, score) for doc, score in hits]})
+
+    @app.post("/ask")
+    async def ask(body: AskRequest, request: Request):
+        request_id = request.state.request_id
+        logger.info("[API] %s ask: %s", request_id, body.question)
+        start = perf_counter()
+        hits, pieces = await _start_rag(body.question)
+        sources = [hit_record(doc, score) for doc, score in hits]
+        if not body.stream:
+            answer = await _collect(pieces)
+            return JSONResponse({"request_id": request_id, "answer": answer, "sources": sources,
+                                 "seconds": round(perf_counter() - start, 3)})
+
+        def lines():
+            yield _json_line({"type": "sources", "request_id": request_id, "sources": sources})
+            try:
+                for piece in pieces:
+                    yield _json_line({"type": "answer", "text": piece})
+            except Exception as e:
+                logger.error("[API] %s generation failed: %s", request_id, e)
+                yield _json_line({"type": "error", "error": f"{type(e).__name__}: {e}"})
+                return
+            yield _json_line({"type": "done", "seconds": round(perf_counter() - start, 3)})
+
+        return await _streaming_response(lines(), pieces, "application/x-ndjson")
+
+    @app.get("/v1/models")
+    def models():
+        return {"object": "list", "data": [{"id": API_MODEL_NAME, "object": "model", "owned_by": "local"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(body: ChatRequest, request: Request):
+        request_id = request.state.request_id
+        question = _last_user_message(body.messages)
+        logger.info("[API] %s chat: %s", request_id, question)
+        hits, pieces = await _start_rag(question)
+        completion = {"id": f"chatcmpl-{request_id}", "created": int(time.time()), "model": body.model or API_MODEL_NAME}
+        sources = _provenance(hits)
+        if not body.stream:
+            answer = await _collect(pieces)
+            return JSONResponse({**completion, "object": "chat.completion", "sources": sources, "choices": [
+                {"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}]})
+
+        def chunk(delta: dict, finish_reason=None, **extra) -> str:
+            data = {**completion, "object": "chat.completion.chunk", **extra,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+        def events():
+            yield chunk({"role": "assistant"}, sources=sources)
+            try:
+                for piece in pieces:
+                    yield chunk({"content": piece})
+            except Exception as e:
+                logger.error("[API] %s generation failed: %s", request_id, e)
+                yield f"data: {json.dumps({'error': {'message': str(e), 'type': type(e).__name__}})}\n\n"
+                return
+            yield chunk({}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return await _streaming_response(events(), pieces, "text/event-stream")
+
+    return app
+
+def run_worker(args, embedding, sock):
+    # One pre-fork worker (--workers N): embeddings come from the shared
+    # embedding process, connections from the socket the front process bound.
+    warm_up(args, embedding.wait_ready)
+    config = uvicorn.Config(build_app(), timeout_keep_alive=API_KEEPALIVE, access_log=False)
+    server = uvicorn.Server(config)
+    stop_on_failure(readiness, ["embedding"], server)
+    server.run(sockets=[sock])
+    if readiness.failed():
+        sys.exit(1) # restarted by the supervisor
+
+if __name__ == "__main__":
+    args = parse_args()
+    setup_logging(args.log_level)
+    log_runtime_info()
+    os.environ["TOPIC"] = args.topic
+    if args.workers > 1:
+        serve(args, load_embedding, run_worker)
+    else:
+        warm_up(args)
+        logger.info("HTTP API on http://%s:%s", API_HOST, API_PORT)
+        # Keep-alive connections; per-request access logging is in RequestContext (DEBUG).
+        uvicorn.run(build_app(), host=API_HOST, port=API_PORT, timeout_keep_alive=API_KEEPALIVE, access_log=False)
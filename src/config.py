@@ -19,6 +19,7 @@ EMBED_MODEL_NAME = os.getenv("EMBED_MODEL_NAME") # for lamma-cpp-python or HDD
                                 # FAISS and LangChain's VectorstoreRetriever
                                 # "intfloat/multilingual-e5-small" - 100 languages
                                 # "BAAI/bge-small-en" - for English-only documents
+EMBED_DEVICE = os.getenv("EMBED_DEVICE") # "cuda" / "cpu"; unset = cuda when available
 START_LAMMA = os.getenv("START_LAMMA")
 LLAMA_CPP_PARAMS = {
     "model_path": MODEL_PATH,   # Path to your GGUF model file
@@ -51,5 +52,106 @@ CHUNK_SIZE = 512
 # A typical value is 10–20% of CHUNK_SIZE (e.g., 64 if CHUNK_SIZE is 512).
 CHUNK_OVERLAP = 64
 
+# CHUNK_UNIT=tokens measures chunks with the embedding model's own (fast) tokenizer
+# instead of counting characters: each chunk fills up to CHUNK_TOKENS tokens, so
+# none is truncated by the model and English text needs far fewer chunks.
+# Changing the unit or budget needs --rechunk.
+CHUNK_UNIT = os.getenv("CHUNK_UNIT", "chars")                    # "chars" (CHUNK_SIZE/CHUNK_OVERLAP) or "tokens"
+CHUNK_TOKENS = getenv_int("CHUNK_TOKENS", 0)                      # 0 = the model's max sequence length
+CHUNK_TOKEN_OVERLAP = getenv_int("CHUNK_TOKEN_OVERLAP", 32)
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER")                    # tokenizer dir/name; default: the embedding model's
+
 # These parameters control how your documents are chunked before being embedded and indexed in FAISS. 
-# Well-tuned values help avoid missing relevant context during retrieval and ensure smoother RAG performance.
\ No newline at end of file
+# Well-tuned values help avoid missing relevant context during retrieval and ensure smoother RAG performance.
+
+# ========== Web UI Warm-up ==========
+WEBUI_HOST = os.getenv("WEBUI_HOST", "0.0.0.0")
+WEBUI_PORT = getenv_int("WEBUI_PORT", 7860)
+# Seconds a query waits for the index/model/LLM to finish warming up before it is rejected.
+QUERY_WAIT_TIMEOUT = getenv_float("QUERY_WAIT_TIMEOUT", 30.0)
+# Seconds to keep polling llama-server /health before marking the LLM component failed.
+LLM_WARMUP_TIMEOUT = getenv_float("LLM_WARMUP_TIMEOUT", 600.0)
+
+# ========== Pre-fork Serving (api.py --workers N --snapshot FILE) ==========
+API_WORKERS = getenv_int("API_WORKERS", 1)                           # 1 = single process, no pre-fork
+EMBED_SERVER_BATCH_WAIT_MS = getenv_float("EMBED_SERVER_BATCH_WAIT_MS", 2.0) # gather concurrent queries into one batch
+EMBED_SERVER_WAIT = getenv_float("EMBED_SERVER_WAIT", 600.0)         # seconds workers wait for the embedding process
+
+# ========== HTTP API (src/api.py) ==========
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = getenv_int("API_PORT", 8000)
+API_MAX_CONCURRENCY = getenv_int("API_MAX_CONCURRENCY", 8)    # requests running the pipeline at once, per process
+API_QUEUE_TIMEOUT = getenv_float("API_QUEUE_TIMEOUT", 10.0)   # seconds a request waits for a free slot before 503
+API_TIMEOUT = getenv_float("API_TIMEOUT", 120.0)              # seconds a non-streaming request may take before 504
+API_KEEPALIVE = getenv_int("API_KEEPALIVE", 75)               # seconds an idle keep-alive connection stays open
+API_MODEL_NAME = os.getenv("API_MODEL_NAME", "local-rag")     # model id in /v1/models and completion responses
+
+# ========== RAM Disk Staging ==========
+STAGE_WORKERS = getenv_int("STAGE_WORKERS", 4)             # parallel file copies
+STAGE_LARGE_FILE_MB = getenv_int("STAGE_LARGE_FILE_MB", 64) # cold files above this are staged in background
+STAGE_BUFFER_MB = getenv_int("STAGE_BUFFER_MB", 16)         # buffered copy / hash block size
+# Files needed before the service can start; staged first and always in the foreground.
+STAGE_HOT_PATTERNS = os.getenv(
+    "STAGE_HOT_PATTERNS",
+    "index.faiss,index.pkl,metadata.db,*.safetensors,*.bin,*.pt,*.onnx,*.gguf"
+).split(",")
+
+# ========== RAM Disk Watchdog ==========
+SYNC_QUIET_SECONDS = getenv_float("SYNC_QUIET_SECONDS", 5.0)      # sync once a file is quiet this long
+SYNC_MAX_DELAY = getenv_float("SYNC_MAX_DELAY", 60.0)             # ...or at most this long after its first write
+SYNC_FULL_VALIDATE_INTERVAL = getenv_float("SYNC_FULL_VALIDATE_INTERVAL", 3600.0) # full read_index/integrity_check
+
+# ========== Live Ingestion (--watch) ==========
+INGEST_QUIET_SECONDS = getenv_float("INGEST_QUIET_SECONDS", 2.0)   # wait for a file to stop changing
+INGEST_MAX_DELAY = getenv_float("INGEST_MAX_DELAY", 30.0)          # ...but never longer than this
+INGEST_SAVE_INTERVAL = getenv_float("INGEST_SAVE_INTERVAL", 30.0)  # persist the live index at most this often under load
+
+# ========== FAISS Index ==========
+EMBED_BATCH_SIZE = getenv_int("EMBED_BATCH_SIZE", 256)                  # chunks per embed_documents() call
+TOMBSTONE_COMPACT_RATIO = getenv_float("TOMBSTONE_COMPACT_RATIO", 0.1)  # compact when deleted vectors exceed this share
+TOMBSTONE_COMPACT_MIN = getenv_int("TOMBSTONE_COMPACT_MIN", 1000)       # ...and at least this many
+# Memory budget per vector: 0 = exact float32 (4 x dim bytes); >= dim: SQ8; >= dim/2: SQ4;
+# smaller: PQ with that many bytes. Compressed modes keep float16 originals in vectors.f16
+# (memory-mapped) and re-rank RERANK_FACTOR x k candidates exactly. Changing it converts the index on load.
+INDEX_BYTES_PER_VECTOR = getenv_int("INDEX_BYTES_PER_VECTOR", 0)
+RERANK_FACTOR = getenv_int("RERANK_FACTOR", 4)
+# Filtered search (type:, after:, lang:... see context.filters): filters matching at most
+# FILTER_EXACT_MAX vectors are searched exactly over just those, larger ones through an IDSelector.
+FILTER_EXACT_MAX = getenv_int("FILTER_EXACT_MAX", 4096)
+FILTER_CACHE_SIZE = getenv_int("FILTER_CACHE_SIZE", 32)                  # resolved filters kept per index
+
+# ========== Profiling (--profile) ==========
+PROFILE_DIR = os.getenv("PROFILE_DIR", "logs/profiles")         # cProfile/tracemalloc captures
+PROFILE_REPORT_TOP = getenv_int("PROFILE_REPORT_TOP", 15)       # rows in the slowest files report
+
+# ========== Query Log and Batch Runs (--batch) ==========
+QUERY_LOG = os.getenv("QUERY_LOG", "logs/queries.jsonl")       # every interactive/web query, for --batch replay; "" = off
+BATCH_CONCURRENCY = getenv_int("BATCH_CONCURRENCY", 4)          # questions in flight in --batch runs
+
+# ========== Logging ==========
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")                      # DEBUG shows per-file and per-stage detail
+PROGRESS_INTERVAL = getenv_float("PROGRESS_INTERVAL", 5.0)      # seconds between progress lines in long loops
+
+# ========== Extracted-text Cache ==========
+TEXT_CACHE = getenv_bool("TEXT_CACHE", True)                    # keep loader output for re-chunking
+TEXT_CACHE_DIR = os.getenv("TEXT_CACHE_DIR", "db/textcache")    # shared by all topics (content-addressed)
+
+# ========== Text Extraction ==========
+EXTRACT_WORKERS = getenv_int("EXTRACT_WORKERS", min(4, os.cpu_count() or 1)) # files parsed ahead in parallel (CHM, PDF...)
+
+# ========== Near-duplicate Documents ==========
+NEAR_DUP = getenv_bool("NEAR_DUP", True)                        # MinHash fingerprint of every extracted text
+NEAR_DUP_THRESHOLD = getenv_float("NEAR_DUP_THRESHOLD", 0.85)   # estimated Jaccard similarity of word 5-grams
+NEAR_DUP_ACTION = os.getenv("NEAR_DUP_ACTION", "skip")          # skip: keep only the best copy; flag: log and keep all
+
+# ========== External Converters ==========
+CONVERTER_LIMITS = os.getenv("CONVERTER_LIMITS", "ebook-convert=2")   # concurrent runs per tool: "tool=n,tool=n"
+CONVERTER_DEFAULT_LIMIT = getenv_int("CONVERTER_DEFAULT_LIMIT", os.cpu_count() or 1) # ...for tools not listed
+CONVERTER_TIMEOUT = getenv_float("CONVERTER_TIMEOUT", 600.0)          # wall-clock seconds; the process group is killed
+CONVERTER_MEMORY_MB = getenv_int("CONVERTER_MEMORY_MB", 0)            # address-space limit per run, 0 = none (e.g. 4096)
+CONVERTER_NICE = getenv_int("CONVERTER_NICE", 10)                     # keep queries responsive while converting
+CONVERTER_RETRIES = getenv_int("CONVERTER_RETRIES", 1)                # extra attempts after a failed run
+CONVERTER_QUARANTINE_AFTER = getenv_int("CONVERTER_QUARANTINE_AFTER", 3) # failed runs before a file is no longer tried, 0 = never
+CONVERTER_CACHE = getenv_bool("CONVERTER_CACHE", True)                # keep converter output by input hash
+CONVERTER_CACHE_DIR = os.getenv("CONVERTER_CACHE_DIR", "db/convcache")
+CONVERTER_CACHE_MB = getenv_int("CONVERTER_CACHE_MB", 2048)           # least recently used outputs evicted above this, 0 = no limit
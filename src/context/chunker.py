@@ -1,23 +1,152 @@
+import json
+import logging
+import os
+import threading
 from pathlib import Path
+
+import numpy as np
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
 
-from config import CHUNK_SIZE, CHUNK_OVERLAP
+from config import CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_TOKENIZER, CHUNK_TOKEN_OVERLAP, CHUNK_TOKENS, CHUNK_UNIT, EMBED_MODEL_NAME
 from data.filter import process_text_for_chunking
 from server.llm import parse_args
+from server.metrics import observe_chunk_sizes, timed
+from server.ramdisk import safe_load
+
+logger = logging.getLogger(__name__)
 
 # ========== Text Splitter ==========
 splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
 
+# ========== Token-budget Splitter (CHUNK_UNIT=tokens) ==========
+TOKENIZE_BLOCK = 32768 # characters per tokenizer input; a file goes to the tokenizer as one batch of blocks
+MAX_MODEL_TOKENS = 8192 # tokenizers without a real limit report a huge model_max_length
+
+class TokenSplitter:
+    """ Chunks of at most budget tokens of the embedding model, cut at the best
+        boundary (paragraph, line, sentence end, word) in the second half of
+        the window, with overlap tokens shared by neighbours. A file is
+        tokenized once, in one batched call to the fast tokenizer; chunks are
+        slices of the original text, so nothing is decoded back. """
+    def __init__(self, tokenizer, budget: int, overlap: int):
+        if not getattr(tokenizer, "is_fast", False):
+            raise ValueError("CHUNK_UNIT=tokens needs a fast tokenizer (character offsets)")
+        self.tokenizer = tokenizer
+        self.budget = budget
+        self.overlap = min(overlap, budget // 2)
+
+    def token_spans(self, text: str) -> tuple[np.ndarray, np.ndarray]:
+        """Start and end character offsets of every token of text."""
+        blocks, offsets, start = [], [], 0
+        while start < len(text):
+            end = min(start + TOKENIZE_BLOCK, len(text))
+            if end < len(text): # cut at whitespace, where no token spans the cut
+                space = max(text.rfind(" ", start, end), text.rfind("\n", start, end))
+                end = space + 1 if space > start else end
+            blocks.append(text[start:end])
+            offsets.append(start)
+            start = end
+        if not blocks:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        encoded = self.tokenizer(blocks, add_special_tokens=False, return_offsets_mapping=True,
+                                 return_attention_mask=False, return_token_type_ids=False)
+        spans = [np.asarray(mapping, dtype=np.int64).reshape(-1, 2) + offset
+                 for mapping, offset in zip(encoded["offset_mapping"], offsets)]
+        spans = np.concatenate(spans)
+        return spans[:, 0], spans[:, 1]
+
+    @staticmethod
+    def _boundary(text: str, end: int, start: int) -> int:
+        # How good a cut between a token ending at end and one starting at start is.
+        gap = text[end:start]
+        if not gap:
+            return 0 # inside a word
+        if "\n\n" in gap:
+            return 4
+        if "\n" in gap:
+            return 3
+        return 2 if text[end - 1:end] in ".!?;:…。！？" else 1
+
+    def split(self, text: str) -> tuple[list[str], list[int]]:
+        """Chunks of text and their length in tokens."""
+        starts, ends = self.token_spans(text)
+        n = len(starts)
+        chunks, sizes = [], []
+        i = 0
+        while i < n:
+            cut = min(i + self.budget, n)
+            if cut < n:
+                best = 0
+                for j in range(cut, i + self.budget // 2, -1): # latest of the best boundaries
+                    score = self._boundary(text, ends[j - 1], starts[j])
+                    if score > best:
+                        best, cut = score, j
+                        if score == 4:
+                            break
+                # best == 0: no boundary at all (one enormous word), cut stays at the budget
+            chunk = text[starts[i]:ends[cut - 1]].strip()
+            if chunk:
+                chunks.append(chunk)
+                sizes.append(cut - i)
+            if cut >= n:
+                break
+            # Overlap starts at a word start, never at a subword piece.
+            nxt = max(cut - self.overlap, i + 1)
+            while nxt < cut and starts[nxt] == ends[nxt - 1]:
+                nxt += 1
+            i = nxt
+        return chunks, sizes
+
+_token_splitter = None
+_token_splitter_lock = threading.Lock()
+
+def _model_max_tokens(tokenizer, source: str) -> int:
+    # sentence-transformers truncates at max_seq_length, which can be below the tokenizer's limit.
+    limit = min(tokenizer.model_max_length, MAX_MODEL_TOKENS)
+    config = Path(source) / "sentence_bert_config.json"
+    if config.exists():
+        limit = min(limit, json.loads(config.read_text()).get("max_seq_length", limit))
+    return limit
+
+def token_splitter() -> TokenSplitter:
+    """The TokenSplitter of the embedding model, loaded on first use (tokenizer files only)."""
+    global _token_splitter
+    with _token_splitter_lock:
+        if _token_splitter is None:
+            from transformers import AutoTokenizer
+            source = CHUNK_TOKENIZER
+            if not source:
+                model_dir = safe_load("RAM_EMBED_MODEL_NAME_PATH", "EMBED_MODEL_NAME_PATH")
+                source = model_dir + os.getenv("EMBED_MODEL_SNAPHOTS", "") if model_dir else EMBED_MODEL_NAME
+            tokenizer = AutoTokenizer.from_pretrained(source, use_fast=True)
+            # Room for the [CLS]/[SEP] (<s>/</s>) the model adds around every chunk.
+            budget = (CHUNK_TOKENS or _model_max_tokens(tokenizer, source)) - tokenizer.num_special_tokens_to_add()
+            _token_splitter = TokenSplitter(tokenizer, budget, CHUNK_TOKEN_OVERLAP)
+            logger.info("[Chunk] Token chunks of up to %d tokens (overlap %d), tokenizer %s",
+                        budget, _token_splitter.overlap, source)
+        return _token_splitter
+
 # ========== Chunking Logic ==========
 def split_into_chunks(text: str, filename: Path | str = "") -> list[str]:
-    print("[DEBUG] Starting split_into_chunks")
+    logger.debug("Splitting %s", filename)
 
-    args = parse_args()
+    args = parse_args(known_only=True)
     normalized = process_text_for_chunking(
         text,
         filename=str(filename),
         enable_ocr=not args.ocr_skip)
 
-    print("[DEBUG] Splitting with text splitter")
-    return [doc.page_content for doc in splitter.split_documents([Document(page_content=normalized)])]
\ No newline at end of file
+    with timed("ingest", "split"):
+        if CHUNK_UNIT == "tokens":
+            chunks, sizes = token_splitter().split(normalized)
+        else:
+            chunks = [doc.page_content for doc in splitter.split_documents([Document(page_content=normalized)])]
+            sizes = [len(chunk) for chunk in chunks]
+
+    observe_chunk_sizes(sizes, CHUNK_UNIT)
+    if sizes and logger.isEnabledFor(logging.DEBUG):
+        ordered = sorted(sizes)
+        logger.debug("[Chunk] %s: %d chunks, %s p50 %d p90 %d max %d", filename, len(sizes), CHUNK_UNIT,
+                     ordered[len(ordered) // 2], ordered[int(0.9 * (len(ordered) - 1))], ordered[-1])
+    return chunks
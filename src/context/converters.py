@@ -0,0 +1,249 @@
+"""
+    Scheduler for the external converters the loaders shell out to
+    (ebook-convert, djvutxt, extract_chmLib). Every run gets:
+
+    - a per-tool concurrency slot (CONVERTER_LIMITS / CONVERTER_DEFAULT_LIMIT),
+      so parallel extraction keeps the machine busy without oversubscribing
+      heavy tools such as Calibre;
+    - a wall-clock timeout (the whole process group is killed) plus CPU-time,
+      optional address-space and nice limits, set before the tool starts
+      (prlimit/nice wrap the command) so its own workers inherit them;
+    - retries, then quarantine: a file that failed CONVERTER_QUARANTINE_AFTER
+      times (counted in metadata.db across runs) is not tried again until it
+      changes;
+    - an output cache keyed by input hash (CONVERTER_CACHE_DIR/<tool>/...), so
+      a loader change (LOADER_VERSION) re-reads the output without converting.
+      It holds at most CONVERTER_CACHE_MB, least recently used entries go
+      first; extracted trees (CHM) are not cached, the text cache has their
+      text.
+
+    with converters.convert("ebook-convert", path,
+                            lambda out: ["ebook-convert", str(path), str(out / "book.epub")]) as out:
+        docs = FixedEPubLoader(out / "book.epub").load()
+"""
+import hashlib
+import logging
+import os
+import resource
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from config import (
+    CONVERTER_CACHE, CONVERTER_CACHE_DIR, CONVERTER_CACHE_MB, CONVERTER_DEFAULT_LIMIT, CONVERTER_LIMITS, CONVERTER_MEMORY_MB,
+    CONVERTER_NICE, CONVERTER_QUARANTINE_AFTER, CONVERTER_RETRIES, CONVERTER_TIMEOUT)
+from data.db import clear_converter_failures, get_converter_failures, record_converter_failure
+from server.metrics import count, timed
+
+logger = logging.getLogger(__name__)
+
+DONE_MARKER = ".converted" # written last (holds the entry size): a cache entry without it is incomplete
+
+class ConverterError(RuntimeError):
+    pass
+
+def _parse_limits(spec: str) -> dict[str, int]:
+    limits = {}
+    for item in spec.split(","):
+        tool, _, n = item.partition("=")
+        if tool.strip() and n.strip():
+            limits[tool.strip()] = max(1, int(n))
+    return limits
+
+def _hash_file(path: Path) -> str:
+    h = hashlib.md5() # same digest as documents.hash
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _limited(cmd: list[str]) -> tuple[list[str], bool]:
+    """ cmd run under the CPU, address-space and nice limits: the prlimit and
+        nice commands set them and exec the tool, so every process it forks
+        has them from the start (preexec_fn is unsafe with the extraction
+        threads). Returns the command and whether the limits are in it. """
+    prlimit = shutil.which("prlimit")
+    if prlimit is None:
+        return cmd, False
+    wrapped = [prlimit, f"--cpu={int(CONVERTER_TIMEOUT) + 1}"]
+    if CONVERTER_MEMORY_MB > 0:
+        wrapped.append(f"--as={CONVERTER_MEMORY_MB * 2**20}")
+    nice = shutil.which("nice")
+    if CONVERTER_NICE and nice:
+        wrapped += [nice, "-n", str(CONVERTER_NICE)]
+    return wrapped + cmd, True
+
+def _apply_limits(pid: int):
+    # Fallback without the prlimit command: set on the running child, so
+    # workers it forked before this call escape them.
+    try:
+        cpu = int(CONVERTER_TIMEOUT) + 1
+        resource.prlimit(pid, resource.RLIMIT_CPU, (cpu, cpu))
+        if CONVERTER_MEMORY_MB > 0:
+            limit = CONVERTER_MEMORY_MB * 2**20
+            resource.prlimit(pid, resource.RLIMIT_AS, (limit, limit))
+        if CONVERTER_NICE:
+            os.setpriority(os.PRIO_PROCESS, pid, CONVERTER_NICE)
+    except (AttributeError, OSError, ValueError) as e: # not Linux, or already exited
+        logger.debug("[Convert] Could not limit pid %d: %s", pid, e)
+
+class ConverterScheduler:
+    def __init__(self):
+        self.limits = _parse_limits(CONVERTER_LIMITS)
+        self._slots = {}
+        self._lock = threading.Lock()
+        self._in_use = {} # cache entry -> readers, never evicted while read
+
+    def _slot(self, tool: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if tool not in self._slots:
+                self._slots[tool] = threading.BoundedSemaphore(self.limits.get(tool, CONVERTER_DEFAULT_LIMIT))
+            return self._slots[tool]
+
+    def _run(self, tool: str, cmd: list[str]):
+        with self._slot(tool), timed("ingest", "convert", tool=tool):
+            cmd, limited = _limited(cmd)
+            proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.PIPE, start_new_session=True)
+            if not limited:
+                _apply_limits(proc.pid)
+            try:
+                _, stderr = proc.communicate(timeout=CONVERTER_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL) # converters fork workers of their own
+                except ProcessLookupError:
+                    pass
+                proc.communicate()
+                raise ConverterError(f"{tool} timed out after {CONVERTER_TIMEOUT:.0f}s")
+        if proc.returncode != 0:
+            message = stderr.decode("utf-8", errors="ignore").strip()[-300:]
+            raise ConverterError(f"{tool} exited with {proc.returncode}: {message}")
+
+    def _run_with_retries(self, tool: str, argv, input_path: Path, file_hash: str, work: Path):
+        attempts = 1 + max(0, CONVERTER_RETRIES)
+        for attempt in range(1, attempts + 1):
+            try:
+                self._run(tool, argv(work))
+                clear_converter_failures(file_hash, tool)
+                return
+            except (ConverterError, OSError) as e:
+                failures = record_converter_failure(file_hash, tool, input_path, str(e))
+                count("converter_failures", pipeline="ingest", tool=tool)
+                if CONVERTER_QUARANTINE_AFTER and failures >= CONVERTER_QUARANTINE_AFTER:
+                    logger.error("[Convert] Quarantined %s after %d failed %s runs: %s", input_path, failures, tool, e)
+                    raise ConverterError(f"{tool} failed on {input_path}: {e}") from e
+                if attempt == attempts:
+                    raise ConverterError(f"{tool} failed on {input_path}: {e}") from e
+                logger.warning("[Convert] %s failed on %s (attempt %d/%d): %s", tool, input_path, attempt, attempts, e)
+                shutil.rmtree(work, ignore_errors=True) # start the next attempt clean
+                work.mkdir(parents=True)
+
+    # ========== Output Cache ==========
+    @contextmanager
+    def _reading(self, entry: Path):
+        with self._lock:
+            self._in_use[entry] = self._in_use.get(entry, 0) + 1
+        try:
+            yield entry
+        finally:
+            with self._lock:
+                self._in_use[entry] -= 1
+                if not self._in_use[entry]:
+                    del self._in_use[entry]
+
+    def _evict(self):
+        # Least recently used entries (marker mtime, touched on every hit) go
+        # until the cache fits CONVERTER_CACHE_MB.
+        if CONVERTER_CACHE_MB <= 0:
+            return
+        entries = []
+        for marker in Path(CONVERTER_CACHE_DIR).glob(f"*/*/*/{DONE_MARKER}"):
+            try:
+                entries.append((marker.stat().st_mtime, int(marker.read_text() or 0), marker.parent))
+            except (OSError, ValueError): # evicted by another process meanwhile
+                continue
+        total, limit = sum(size for _, size, _ in entries), CONVERTER_CACHE_MB * 2**20
+        for _, size, entry in sorted(entries, key=lambda e: e[0]):
+            if total <= limit:
+                break
+            with self._lock:
+                if entry in self._in_use:
+                    continue
+                (entry / DONE_MARKER).unlink(missing_ok=True) # incomplete from here on
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            count("converter_cache_evictions", pipeline="ingest")
+
+    @staticmethod
+    def _install(work: Path, cached: Path) -> bool:
+        # Move finished output into the cache. True when cached holds a complete
+        # entry afterwards (work is gone), False when work must be read instead.
+        for _ in range(2):
+            try:
+                os.replace(work, cached)
+                return True
+            except OSError:
+                pass
+            if (cached / DONE_MARKER).exists(): # another worker cached the same input first
+                shutil.rmtree(work, ignore_errors=True)
+                return True
+            # A partial entry (crash mid-write, eviction mid-removal): replace it.
+            shutil.rmtree(cached, ignore_errors=True)
+        return False
+
+    @contextmanager
+    def convert(self, tool: str, input_path, argv, cache: bool = True):
+        """ Run argv(out_dir) for input_path unless its output is cached; yields
+            the directory holding the output. Cached output stays; uncached
+            output (also with cache=False, for large extracted trees) is
+            removed when the block exits. """
+        input_path = Path(input_path)
+        if shutil.which(tool) is None:
+            raise ConverterError(f"{tool} is not installed")
+        file_hash = _hash_file(input_path)
+        cache = cache and CONVERTER_CACHE
+        cached = Path(CONVERTER_CACHE_DIR) / tool / file_hash[:2] / file_hash
+        if cache and (cached / DONE_MARKER).exists():
+            with self._reading(cached):
+                try:
+                    os.utime(cached / DONE_MARKER) # most recently used
+                except FileNotFoundError: # evicted by another process just now
+                    pass
+                else:
+                    count("converter_cache_hits", pipeline="ingest", tool=tool)
+                    yield cached
+                    return
+
+        failures = get_converter_failures(file_hash, tool)
+        if CONVERTER_QUARANTINE_AFTER and failures >= CONVERTER_QUARANTINE_AFTER:
+            count("converter_quarantined", pipeline="ingest", tool=tool)
+            raise ConverterError(f"{input_path} is quarantined for {tool} ({failures} failed runs)")
+
+        if cache:
+            cached.parent.mkdir(parents=True, exist_ok=True)
+        # Same filesystem as the cache, so finishing is a rename.
+        work = Path(tempfile.mkdtemp(prefix=f".{file_hash}.", dir=cached.parent if cache else None))
+        try:
+            self._run_with_retries(tool, argv, input_path, file_hash, work)
+            if not cache:
+                yield work
+                return
+            size = sum(p.stat().st_size for p in work.rglob("*") if p.is_file())
+            (work / DONE_MARKER).write_text(str(size))
+            if not self._install(work, cached):
+                yield work # no complete entry to read: this run's output, removed below
+                return
+            work = None
+            with self._reading(cached):
+                self._evict()
+                yield cached
+        finally:
+            if work is not None:
+                shutil.rmtree(work, ignore_errors=True)
+
+converters = ConverterScheduler()
@@ -0,0 +1,88 @@
+"""
+    Structured retrieval filters. A SearchFilter is resolved in SQLite
+    (documents joined to chunks) to the set of vector ids it allows; the index
+    then searches only those ids (ChunkIndex.search), so a filtered query does
+    not fetch a large k and throw most of it away.
+
+    In the CLI and Web UI, filters are key:value words in front of the question:
+
+    type:pdf,epub after:2024-01-01 lang:en what does chapter 3 say about tides?
+    title:"moby dick" tag:whaling who is Queequeg?
+"""
+import re
+from dataclasses import dataclass, fields
+
+from data.db import get_filtered_text_ids
+
+# Query prefix keys -> SearchFilter fields; list-valued fields take comma-separated values.
+KEYS = {"type": "source_types", "after": "after", "before": "before", "title": "title",
+        "path": "path", "lang": "languages", "tag": "tags"}
+_TERM = re.compile(r'\s*(\w+):("([^"]*)"|\S+)')
+
+@dataclass(frozen=True)
+class SearchFilter:
+    source_types: tuple[str, ...] = () # file extensions without the dot
+    after: str = None  # documents added at or after this date (YYYY-MM-DD[ HH:MM:SS])
+    before: str = None # ... and before this one
+    title: str = None  # substring, case-insensitive
+    path: str = None   # substring of the file path
+    languages: tuple[str, ...] = () # ISO 639-1 codes, as detected at ingestion
+    tags: tuple[str, ...] = () # any of these tags
+
+    def __bool__(self) -> bool:
+        return any(getattr(self, f.name) for f in fields(self))
+
+    def where(self) -> tuple[str, list]:
+        """SQL condition on documents d and its arguments."""
+        clauses, args = [], []
+        if self.source_types:
+            clauses.append(f"d.source_type IN ({','.join('?' * len(self.source_types))})")
+            args += [t.lower().lstrip(".") for t in self.source_types]
+        if self.after:
+            clauses.append("d.timestamp >= ?")
+            args.append(self.after)
+        if self.before:
+            clauses.append("d.timestamp < ?")
+            args.append(self.before)
+        if self.title:
+            clauses.append("d.title LIKE ?")
+            args.append(f"%{self.title}%")
+        if self.path:
+            clauses.append("d.path LIKE ?")
+            args.append(f"%{self.path}%")
+        if self.languages:
+            clauses.append(f"d.language IN ({','.join('?' * len(self.languages))})")
+            args += [lang.lower() for lang in self.languages]
+        if self.tags:
+            # documents.tags is stored as ",tag1,tag2,"
+            clauses.append("(" + " OR ".join("d.tags LIKE ?" for _ in self.tags) + ")")
+            args += [f"%,{tag.lower()},%" for tag in self.tags]
+        return " AND ".join(clauses) or "1", args
+
+    def text_ids(self) -> list[int]:
+        return get_filtered_text_ids(*self.where())
+
+def make_filter(**values) -> SearchFilter:
+    """SearchFilter from keyword values; list fields accept a list or a comma-separated string."""
+    cleaned = {}
+    for name, value in values.items():
+        if value in (None, "", [], ()):
+            continue
+        if isinstance(SearchFilter.__dataclass_fields__[name].default, tuple):
+            items = value.split(",") if isinstance(value, str) else value
+            value = tuple(item.strip() for item in items if item.strip())
+        cleaned[name] = value
+    return SearchFilter(**cleaned)
+
+def parse_filter(query: str) -> tuple[SearchFilter | None, str]:
+    """ Split leading key:value filter words off a question. Returns (filter
+        or None, remaining question); unknown keys end the filter prefix. """
+    values, pos = {}, 0
+    while True:
+        match = _TERM.match(query, pos)
+        if not match or match.group(1).lower() not in KEYS:
+            break
+        values[KEYS[match.group(1).lower()]] = match.group(3) if match.group(3) is not None else match.group(2)
+        pos = match.end()
+    search_filter = make_filter(**values)
+    return (search_filter or None), query[pos:].strip()
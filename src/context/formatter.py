@@ -9,7 +9,6 @@ def format_context(docs):
                        for idx, doc in enumerate(docs))
 
 def format_sources(docs):
-    print(format_sources(docs))
     # Format unique source files from retrieved documents.
     seen = set()
     output = []
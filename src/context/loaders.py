@@ -1,21 +1,32 @@
+import logging
 import os
+import re
 import shutil
-import subprocess
-import tempfile
 import xml.etree.ElementTree as ET
-from xml.etree.ElementTree import QName
 from bs4 import BeautifulSoup
 from pathlib import Path
+from typing import Iterator
+from urllib.parse import unquote
 
 from langchain_community.document_loaders import (
     PyPDFLoader, UnstructuredMarkdownLoader, UnstructuredWordDocumentLoader,
     UnstructuredEPubLoader, TextLoader)
 from langchain.schema import Document
 from pypdf import PdfReader
+
+from context.converters import converters
 from striprtf.striprtf import rtf_to_text
 from unstructured.partition.doc import partition_doc
 from unstructured.partition.html import partition_html
 
+logger = logging.getLogger(__name__)
+
+# Bump when any loader's output changes: cached extracted text (context.textcache)
+# from older versions is then ignored and files are parsed again.
+# 4: the cache keeps every loader document (post, CHM page) with its metadata.
+# 5: CHM pages carry their 1-based page number.
+LOADER_VERSION = 5
+
 # ========== .txt loader ==========
 class SafeTextLoader(TextLoader):
     def __init__(self, file_path):
@@ -53,38 +64,68 @@ class DidjvuLoader:
         if not djvu_path.exists():
             raise FileNotFoundError(f"DjVu file not found: {self.file_path}")
 
-        try:
-            # Extract text using djvutxt
-            result = subprocess.run(
-                ["djvutxt", self.file_path],
-                check=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            full_text = result.stdout.strip()
-        except subprocess.CalledProcessError as e:
-            raise RuntimeError(f"djvutxt failed: {e.stderr}")
+        # Extract text using djvutxt
+        with converters.convert("djvutxt", djvu_path,
+                                lambda out: ["djvutxt", str(djvu_path), str(out / "text.txt")]) as out:
+            full_text = (out / "text.txt").read_text(encoding="utf-8", errors="ignore").strip()
 
         return [Document(page_content=full_text)]
 
 # ========== .chm loader using extract_chmlib ==========
 class CHMLoader:
+    """ Extracts the CHM into a temporary directory that is always removed
+        (the text cache keeps its text, so the tree is not cached) and yields
+        one Document per HTML page, in table-of-contents (.hhc) order followed
+        by pages the TOC does not list, numbered from 1 in that order. """
     def __init__(self, file_path):
         self.file_path = file_path
-    
+
+    @staticmethod
+    def _toc_order(root: Path) -> list[str]:
+        # <param name="Local" value="html/intro.htm#top"> entries of the sitemap.
+        pages = []
+        for hhc in sorted(root.rglob("*.hhc")):
+            raw = hhc.read_text(encoding="utf-8", errors="ignore")
+            for value in re.findall(r"""<param\s+name=["']?local["']?\s+value=["']([^"']+)["']""", raw, re.I):
+                page = unquote(value.split("#", 1)[0]).replace("\\", "/").lstrip("/")
+                if page:
+                    pages.append(page.lower())
+        return list(dict.fromkeys(pages))
+
+    @staticmethod
+    def _page_text(html_file: Path) -> tuple[str, str]:
+        # Bytes in, so BeautifulSoup picks up the page's own charset.
+        soup = BeautifulSoup(html_file.read_bytes(), "html.parser")
+        for tag in soup(["script", "style"]):
+            tag.decompose()
+        title = soup.title.get_text(strip=True) if soup.title else ""
+        lines = (line.strip() for line in soup.get_text("\n").splitlines())
+        return title, "\n".join(line for line in lines if line)
+
+    def lazy_load(self):
+        with converters.convert("extract_chmLib", self.file_path,
+                                lambda out: ["extract_chmLib", str(self.file_path), str(out)],
+                                cache=False) as extract_dir:
+            logger.debug("Extracted CHM file %s to %s", self.file_path, extract_dir)
+            pages = {str(p.relative_to(extract_dir)).lower(): p for p in extract_dir.rglob("*.htm*") if p.is_file()}
+            if not pages:
+                raise RuntimeError(f"extract_chmLib found no pages in {self.file_path}")
+
+            toc = [page for page in self._toc_order(extract_dir) if page in pages]
+            ordered = toc + sorted(set(pages) - set(toc))
+            total, number = 0, 0
+            for key in ordered:
+                title, text = self._page_text(pages[key])
+                if text:
+                    total += len(text)
+                    number += 1
+                    yield Document(page_content=text, metadata={
+                        "page": number, "page_path": str(pages[key].relative_to(extract_dir)), "title": title})
+            logger.debug("Finished extracting CHM: %d pages (%d in TOC, %d with text), %d chars",
+                         len(ordered), len(toc), number, total)
+
     def load(self) -> list[Document]:
-        extract_dir = Path("/tmp/chm_extract")
-        extract_dir.mkdir(parents=True, exist_ok=True)
-        print(f"[DEBUG] Extracting CHM file {self.file_path} to {extract_dir}")
-
-        subprocess.run(["extract_chmLib", self.file_path, str(extract_dir)])
-        text = ""
-        for html_file in extract_dir.rglob("*.htm*"):
-            with open(html_file, "r", encoding="utf-8", errors="ignore") as f:
-                text += f.read() + "\n"
-        print(f"[DEBUG] Finished extracting CHM, total length {len(text)} chars")
-        return [Document(page_content=text)]
+        return list(self.lazy_load())
 
 # Some .chm files can't be parsed well because they're binary-encoded archives.
 #     Extract .chm manually:
@@ -118,20 +159,9 @@ class MOBILoader:
         if not shutil.which("ebook-convert"):
             raise EnvironmentError("'ebook-convert' not found. Please install Calibre CLI.")
 
-        with tempfile.TemporaryDirectory() as tmpdir:
-            tmpdir_path = Path(tmpdir)
-            epub_path = tmpdir_path / (self.file_path.stem + ".epub")
-
-            try:
-                subprocess.run(
-                    ["ebook-convert", str(self.file_path), str(epub_path)],
-                    check=True,
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL
-                )
-            except subprocess.CalledProcessError as e:
-                raise RuntimeError(f"Failed to convert MOBI to EPUB: {e}")
-
+        with converters.convert("ebook-convert", self.file_path,
+                                lambda out: ["ebook-convert", str(self.file_path), str(out / "book.epub")]) as out:
+            epub_path = out / "book.epub"
             if not epub_path.exists():
                 raise FileNotFoundError(f"Conversion failed, EPUB not found at {epub_path}")
             return FixedEPubLoader(epub_path).load()
@@ -145,7 +175,65 @@ class PyPDFLoaderWithPassword(PyPDFLoader):
     def load(self) -> list[Document]:
         reader = PdfReader(self.file_path, password=self.password)
         texts = [page.extract_text() or "" for page in reader.pages]
-        return [Document(page_content="\n".join(texts))]
+        page_offsets, offset = [], 0
+        for text in texts:
+            page_offsets.append(offset)
+            offset += len(text) + 1
+        return [Document(page_content="\n".join(texts), metadata={"page_offsets": page_offsets})]
+
+# ========== Streaming XML helpers ==========
+# Feed exports can be hundreds of MB: detection reads only the first
+# HEADER_BYTES, and loaders make one iterparse pass that frees every post
+# once it has been turned into a Document.
+HEADER_BYTES = 64 * 1024
+ATOM_NS = "http://www.w3.org/2005/Atom"
+CONTENT_NS = "http://purl.org/rss/1.0/modules/content/"
+WP_NS_PREFIX = "http://wordpress.org/export/"
+BLOGGER_HINTS = ("schemas.google.com/blogger", "www.blogger.com", "tag:blogger.com")
+
+def _read_header(file_path: str) -> str:
+    try:
+        with open(file_path, "rb") as f:
+            return f.read(HEADER_BYTES).decode("utf-8", errors="ignore")
+    except OSError:
+        return ""
+
+def _root_tag(header: str) -> str:
+    """Local name of the first element in an XML header (skips <?xml ?>, comments, DOCTYPE)."""
+    match = re.search(r"<(?![?!])([\w:.-]+)", header)
+    return match.group(1).rsplit(":", 1)[-1] if match else ""
+
+def _split_tag(tag: str) -> tuple[str, str]:
+    # "{namespace}local" -> (namespace, local)
+    if tag.startswith("{"):
+        ns, _, local = tag[1:].partition("}")
+        return ns, local
+    return "", tag
+
+def _iter_elements(file_path: str, local_name: str):
+    """ Yield every complete <local_name> element (any namespace) in one
+        streaming pass, then drop it and its already parsed siblings (channel
+        level terms, authors...) so memory stays flat however large the file is. """
+    stack = []
+    for event, elem in ET.iterparse(file_path, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            continue
+        stack.pop()
+        if _split_tag(elem.tag)[1] == local_name:
+            yield elem
+            elem.clear()
+            if stack:
+                stack[-1].clear() # parsed children only; later ones are appended afterwards
+
+def _text(elem) -> str:
+    # itertext also covers type="xhtml" content, which is markup rather than text.
+    return "".join(elem.itertext()).strip() if elem is not None else ""
+
+def _tags_match(tags: list[str], tags_filter: list[str] | None) -> bool:
+    if not tags_filter:
+        return True
+    return bool({t.strip().lower() for t in tags} & {t.strip().lower() for t in tags_filter})
 
 # ========== .xml Blogspot loader ==========
 class BlogspotXMLLoader:
@@ -155,114 +243,73 @@ class BlogspotXMLLoader:
 
     @staticmethod
     def is_blogspot_export(file_path: str) -> bool:
-        # Strip namespace and return local tag name.
-        def localname(tag: str) -> str:    
-            if tag.startswith("{"):
-                return tag.split("}", 1)[1]
-            return tag
-
-        try:
-            for event, elem in ET.iterparse(file_path, events=("start",)):
-                if localname(elem.tag) == "feed":
-                    # Blogger-specific hints
-                    content = Path(file_path).read_text(encoding="utf-8", errors="ignore").lower()
-                    if "schemas.google.com/blogger" in content or "www.blogger.com" in content:
-                        return True
-                    return False
-                break
-        except ET.ParseError:
-            return False
-        return False
-
-    def load(self) -> list[Document]:
-        tree = ET.parse(self.file_path)
-        root = tree.getroot()
-
-        ns = {
-            "atom": "http://www.w3.org/2005/Atom"
-        }
-
-        documents = []
-        for entry in root.findall("atom:entry", ns):
-            kind = entry.find("atom:category", ns)
-            categories = entry.findall("atom:category", ns)
-            tags = [cat.attrib.get("term", "") for cat in categories if cat.attrib.get("term")]
-            # --- Normalize tags ---
-            normalized_tags = {tag.strip().lower() for tag in tags}
-            normalized_filter = {tag.strip().lower() for tag in self.tags_filter}
-
+        header = _read_header(file_path)
+        return _root_tag(header) == "feed" and any(hint in header.lower() for hint in BLOGGER_HINTS)
+
+    def lazy_load(self):
+        for entry in _iter_elements(self.file_path, "entry"):
+            terms = [cat.attrib.get("term", "") for cat in entry.findall(f"{{{ATOM_NS}}}category")
+                     if cat.attrib.get("term")]
+            # --- Ensure this is a real blog post (not a comment, setting or template) ---
+            if not any(term.endswith("#post") for term in terms):
+                continue
+            labels = [term for term in terms if "schemas.google.com" not in term]
             # --- Apply tag filter if defined ---
-            if self.tags_filter:
-                if not normalized_tags & normalized_filter:
-                    continue
-            # --- Ensure this is a real blog post ---
-            if not any(tag.endswith("#post") for tag in tags):
-                print(f"[MATCH] Tags: {tags} → matched: {normalized_tags & normalized_filter}")
+            if not _tags_match(terms, self.tags_filter):
                 continue
 
-            # if kind is not None and kind.attrib.get("term", "").endswith("#post"):
-            title_el = entry.find("atom:title", ns)
-            content_el = entry.find("atom:content", ns)
-            pub_date_el = entry.find("atom:published", ns)
-            # --- Advantage of HTML in getting images and other data ---
-            title = title_el.text if title_el is not None else ""
-            content = content_el.text if content_el is not None else ""
-            pub_date = pub_date_el.text if pub_date_el is not None else ""
+            # --- Content is kept as HTML; BeautifulSoup would drop links to images and videos ---
+            title = _text(entry.find(f"{{{ATOM_NS}}}title"))
+            pub_date = _text(entry.find(f"{{{ATOM_NS}}}published"))
+            content = _text(entry.find(f"{{{ATOM_NS}}}content"))
             full_text = f"{title}\n{pub_date}\n\n{content}".strip()
-            # --- BeautifulSoup removes links to images and videos ---
-            # raw_html = content_el.text if content_el is not None else "" # BeautifulSoup
-            # clean_text = BeautifulSoup(raw_html, "html.parser").get_text(separator="\n\n")
-            # full_text = f"{title}\n{pub_date}\n\n{clean_text}".strip() # BeautifulSoup
             if full_text:
-                documents.append(Document(page_content=full_text))
-        return documents
-    
+                yield Document(page_content=full_text, metadata={"title": title, "date": pub_date, "tags": labels})
+
+    def load(self) -> list[Document]:
+        return list(self.lazy_load())
+
 # ========== .xml WordPress loader ==========
 class WordPressXMLLoader:
+    POST_TYPES = {"post", "page"} # skips attachments, menu items, custom CSS...
+
     def __init__(self, file_path):
         self.file_path = file_path
 
     @staticmethod
     def is_wordpress_export(file_path: str) -> bool:
-        try:
-            for event, elem in ET.iterparse(file_path, events=("start",)):
-                if elem.tag == "rss" and "wordpress.org/export" in str(elem.attrib.get("xmlns:wp", "")):
-                    return True
-                if elem.tag.endswith("rss"):
-                    # Check for WordPress namespace
-                    for k, v in elem.attrib.items():
-                        if "wordpress.org/export" in v:
-                            return True
-                break  # We only need the root
-        except ET.ParseError:
-            return False
-        return False
-
-    def load(self) -> list[Document]:
-        tree = ET.parse(self.file_path)
-        root = tree.getroot()
-
-        ns = {
-            "wp": "http://wordpress.org/export/1.2/",
-            "content": "http://purl.org/rss/1.0/modules/content/",
-            "dc": "http://purl.org/dc/elements/1.1/"
-        }
-
-        documents = []
-        for item in root.findall(".//item"):
-            title_el = item.find("title")
-            content_el = item.find("content:encoded", ns)
-            pub_date_el = item.find("pubDate")
-
-            title = title_el.text if title_el is not None else ""
-            content = content_el.text if content_el is not None else ""
-            pub_date = pub_date_el.text if pub_date_el is not None else ""
+        # Namespace declarations are not attributes once parsed, so look at the raw header.
+        header = _read_header(file_path)
+        return _root_tag(header) == "rss" and WP_NS_PREFIX in header
+
+    def lazy_load(self):
+        for item in _iter_elements(self.file_path, "item"):
+            title = content = pub_date = post_type = ""
+            tags = []
+            for child in item:
+                ns, local = _split_tag(child.tag)
+                if not ns and local == "title":
+                    title = _text(child)
+                elif not ns and local == "pubDate":
+                    pub_date = _text(child)
+                elif not ns and local == "category":
+                    tags.append(_text(child))
+                elif ns == CONTENT_NS and local == "encoded":
+                    content = _text(child)
+                elif ns.startswith(WP_NS_PREFIX) and local == "post_type":
+                    post_type = _text(child)
+                elif ns.startswith(WP_NS_PREFIX) and local == "post_date" and not pub_date:
+                    pub_date = _text(child)
+            if post_type and post_type not in self.POST_TYPES:
+                continue
 
             full_text = f"{title}\n{pub_date}\n\n{content}".strip()
             if full_text:
-                documents.append(Document(page_content=full_text))
+                yield Document(page_content=full_text,
+                               metadata={"title": title, "date": pub_date, "tags": [t for t in tags if t]})
 
-        return documents
+    def load(self) -> list[Document]:
+        return list(self.lazy_load())
 
 # ========== .atom feed loader ==========
 class AtomXMLLoader:
@@ -272,53 +319,39 @@ class AtomXMLLoader:
 
     @staticmethod
     def is_atom_feed(file_path):
-        try:
-            tree = ET.parse(file_path)
-            root = tree.getroot()
-            # Atom root must be <feed> in Atom namespace
-            return 'http://www.w3.org/2005/Atom' in root.tag or root.tag.endswith('feed')
-        except Exception:
-            return False
-
-    def load(self) -> list[Document]:
-        tree = ET.parse(self.file_path)
-        root = tree.getroot()
-
-        print(f"[AtomXMLLoader] Root tag: {root.tag}")
-
-        documents = []
-        for entry in root.findall("{http://www.w3.org/2005/Atom}entry"):
-            categories = entry.findall("{http://www.w3.org/2005/Atom}category")
-            tags = [cat.attrib.get("term", "") for cat in categories if cat.attrib.get("term")]
-
-            normalized_tags = {tag.strip().lower() for tag in tags}
-            normalized_filter = {tag.strip().lower() for tag in self.tags_filter} if self.tags_filter else set()
-
-            if self.tags_filter:
-                if not normalized_tags & normalized_filter:
-                    continue
-
-            title_el = entry.find("{http://www.w3.org/2005/Atom}title")
-            content_el = entry.find("{http://www.w3.org/2005/Atom}content")
-            summary_el = entry.find("{http://www.w3.org/2005/Atom}summary")
-            pub_date_el = entry.find("{http://www.w3.org/2005/Atom}published")
-
-            title = title_el.text.strip() if title_el is not None and title_el.text else ""
-            content = content_el.text.strip() if content_el is not None and content_el.text else ""
-            summary = summary_el.text.strip() if summary_el is not None and summary_el.text else ""
-            pub_date = pub_date_el.text.strip() if pub_date_el is not None and pub_date_el.text else ""
+        # Atom root must be <feed>, normally in the Atom namespace
+        return _root_tag(_read_header(file_path)) == "feed"
+
+    def lazy_load(self):
+        count = 0
+        for entry in _iter_elements(self.file_path, "entry"):
+            tags = [cat.attrib.get("term", "") for cat in entry.findall(f"{{{ATOM_NS}}}category")
+                    if cat.attrib.get("term")]
+            if not _tags_match(tags, self.tags_filter):
+                continue
 
+            title = _text(entry.find(f"{{{ATOM_NS}}}title"))
+            content = _text(entry.find(f"{{{ATOM_NS}}}content"))
+            summary = _text(entry.find(f"{{{ATOM_NS}}}summary"))
+            pub_date = _text(entry.find(f"{{{ATOM_NS}}}published"))
             body = content if content else summary
 
             full_text = f"{title}\n{pub_date}\n\n{body}".strip()
             if full_text:
-                documents.append(Document(page_content=full_text))
+                count += 1
+                yield Document(page_content=full_text, metadata={"title": title, "date": pub_date, "tags": tags})
+        logger.debug("[AtomXMLLoader] Loaded %d entries from Atom feed.", count)
 
-        print(f"[AtomXMLLoader] Loaded {len(documents)} entries from Atom feed.")
-        return documents
+    def load(self) -> list[Document]:
+        return list(self.lazy_load())
 
 # ========== Loader Dispatcher ==========
-def detect_and_load_text(file_path: str, pdf_password: str = None) -> list[Document] | None:
+# Loaders whose lazy_load() parses as it yields: one post or page in memory.
+STREAMING_LOADERS = (BlogspotXMLLoader, WordPressXMLLoader, AtomXMLLoader, CHMLoader)
+
+def _detect_loader(file_path: str, pdf_password: str = None):
+    """ (supported, loader) for a file; loader is None for a feed file that is
+        no known export. """
     ext = os.path.splitext(file_path)[-1].lower()
 
     if ext == ".pdf":
@@ -330,8 +363,8 @@ def detect_and_load_text(file_path: str, pdf_password: str = None) -> list[Docum
             tags_filter = [tag.strip() for tag in raw_tags.split(",") if tag.strip()]
             loader = AtomXMLLoader(file_path, tags_filter=tags_filter)
         else:
-            print(f"[INFO] .atom file not recognized: {file_path}")
-            return []
+            logger.info(".atom file not recognized: %s", file_path)
+            return True, None
 
     elif ext == ".xml":
         if WordPressXMLLoader.is_wordpress_export(file_path):
@@ -341,8 +374,8 @@ def detect_and_load_text(file_path: str, pdf_password: str = None) -> list[Docum
             tags_filter = [tag.strip() for tag in raw_tags.split(",") if tag.strip()]
             loader = BlogspotXMLLoader(file_path, tags_filter=tags_filter)
         else:
-            print(f"[INFO] .xml file not recognized as WordPress or Blogspot export: {file_path}")
-            return []
+            logger.info(".xml file not recognized as WordPress or Blogspot export: %s", file_path)
+            return True, None
 
     else:
         loader_map = {
@@ -362,11 +395,55 @@ def detect_and_load_text(file_path: str, pdf_password: str = None) -> list[Docum
     
         loader_cls = loader_map.get(ext)
         if loader_cls is None:
-            return None
+            return False, None
         loader = loader_cls(file_path)
+    return True, loader
 
+def detect_and_load_text(file_path: str, pdf_password: str = None) -> list[Document] | None:
+    supported, loader = _detect_loader(file_path, pdf_password)
+    if not supported:
+        return None
+    if loader is None:
+        return []
     try:
         return loader.load()
     except Exception as e:
-        print(f"[ERROR] Failed to load {file_path}: {e}")
+        logger.error("Failed to load %s: %s", file_path, e)
         return []
+
+def _whole_file(docs: list[Document]) -> Document:
+    # Elements of an HTML or .doc file are no units of their own: one document,
+    # with the offset where each element (or PDF page) starts.
+    parts, page_offsets, offset, tags = [], [], 0, set()
+    for doc in docs:
+        metadata = doc.metadata or {}
+        page_offsets += [offset + o for o in metadata.get("page_offsets") or [0]]
+        tags.update(metadata.get("tags") or ())
+        parts.append(doc.page_content)
+        offset += len(doc.page_content) + 2
+    metadata = {"page_offsets": page_offsets, "tags": sorted(tags)} if tags else {"page_offsets": page_offsets}
+    return Document(page_content="\n\n".join(parts), metadata=metadata)
+
+def _load_whole_file(loader, file_path: str) -> Iterator[Document]:
+    # A generator, so the loader runs when the caller starts reading.
+    try:
+        docs = loader.load()
+    except Exception as e:
+        logger.error("Failed to load %s: %s", file_path, e)
+        return
+    if docs:
+        yield _whole_file(docs)
+
+def lazy_load_text(file_path: str, pdf_password: str = None) -> Iterator[Document] | None:
+    """ detect_and_load_text() as an iterator. Feed exports and CHM files
+        yield one post or page at a time and are parsed as they are consumed,
+        so their errors surface during iteration. Other loaders give one
+        document for the whole file. None for unsupported file types. """
+    supported, loader = _detect_loader(file_path, pdf_password)
+    if not supported:
+        return None
+    if loader is None:
+        return iter(())
+    if isinstance(loader, STREAMING_LOADERS):
+        return loader.lazy_load()
+    return _load_whole_file(loader, file_path)
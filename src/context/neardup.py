@@ -0,0 +1,174 @@
+"""
+    Near-duplicate documents: the same book as PDF, EPUB and MOBI, or two scans
+    of it, have different file hashes but nearly the same text. Every extracted
+    text gets a MinHash signature over word 5-grams (doc_fingerprints in
+    metadata.db); LSH banding finds candidates with one indexed lookup per band,
+    so checking a document does not depend on corpus size.
+
+    With NEAR_DUP_ACTION=skip only the best copy (cleanest text, see
+    text_quality) is chunked and embedded: a worse copy is skipped, a better one
+    replaces the copy already stored. NEAR_DUP_ACTION=flag logs and keeps both.
+"""
+import hashlib
+import logging
+import re
+import zlib
+from dataclasses import dataclass
+
+import numpy as np
+
+from config import NEAR_DUP_ACTION, NEAR_DUP_THRESHOLD
+from data.db import delete_document, get_lsh_candidates, mark_duplicate, record_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Changing these invalidates stored signatures (rebuild with --rebuild-db).
+SHINGLE_SIZE = 5 # words
+NUM_PERM = 128
+NUM_BANDS = 16   # 8 rows per band: a pair at 0.85 similarity shares a band with p > 0.99
+ROWS = NUM_PERM // NUM_BANDS
+BLOCK = 16384    # shingles hashed per step, bounds memory to NUM_PERM * BLOCK * 8 bytes
+QUALITY_MARGIN = 0.005 # a new copy must be this much cleaner to replace the stored one
+
+_WORD = re.compile(r"\w+")
+_rng = np.random.default_rng(0x5EED)
+# Multiply-shift hashing: (a * x + b) mod 2^64, top 32 bits.
+_A = _rng.integers(1, 2**63, size=NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 2**63, size=NUM_PERM, dtype=np.uint64)
+
+@dataclass
+class Fingerprint:
+    minhash: np.ndarray # uint32[NUM_PERM]
+    bands: list[int]
+    quality: float
+    chars: int
+
+@dataclass
+class Replacement:
+    """A stored copy that a better one replaces, once that one is stored."""
+    doc_id: int
+    hash_: str
+    path: str
+    quality: float
+    similarity: float
+    fingerprint: Fingerprint
+
+def shingle_hashes(text: str) -> np.ndarray:
+    """Unique 32-bit hashes of the word SHINGLE_SIZE-grams of text."""
+    words = _WORD.findall(text.lower())
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    token_hash = {}
+    tokens = np.fromiter((token_hash.setdefault(w, zlib.crc32(w.encode("utf-8"))) for w in words),
+                         dtype=np.uint64, count=len(words))
+    n = max(1, len(tokens) - SHINGLE_SIZE + 1)
+    h = np.zeros(n, dtype=np.uint64)
+    for j in range(min(SHINGLE_SIZE, len(tokens))):
+        h = h * np.uint64(0x100000001B3) + tokens[j:j + n]
+    return np.unique((h ^ (h >> np.uint64(32))) & np.uint64(0xFFFFFFFF))
+
+def minhash(shingles: np.ndarray) -> np.ndarray:
+    signature = np.full(NUM_PERM, 0xFFFFFFFF, dtype=np.uint64)
+    for start in range(0, len(shingles), BLOCK):
+        block = shingles[start:start + BLOCK]
+        hashed = (_A[:, None] * block[None, :] + _B[:, None]) >> np.uint64(32)
+        np.minimum(signature, hashed.min(axis=1), out=signature)
+    return signature.astype(np.uint32)
+
+def band_keys(signature: np.ndarray) -> list[int]:
+    # One signed 64-bit key per band (SQLite INTEGER).
+    return [int.from_bytes(hashlib.blake2b(signature[b * ROWS:(b + 1) * ROWS].tobytes(), digest_size=8).digest(),
+                           "little", signed=True) for b in range(NUM_BANDS)]
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.mean(a == b))
+
+def _word_counts(text: str) -> tuple[int, int]:
+    # (plain words, whitespace-separated tokens)
+    tokens = text.split()
+    return sum(1 for t in tokens if t.strip(".,;:!?\"'()[]").isalpha()), len(tokens)
+
+def text_quality(text: str) -> float:
+    """ Share of whitespace-separated tokens that are plain words. OCR noise,
+        broken encodings and markup leftovers score low. """
+    words, tokens = _word_counts(text)
+    return words / tokens if tokens else 0.0
+
+class Fingerprinter:
+    """ fingerprint() of a text that arrives in parts (pages, feed posts): a
+        MinHash signature is a minimum, so the parts' signatures combine
+        elementwise. Shingles spanning two parts are not counted. """
+    def __init__(self):
+        self.signature = None
+        self.words = self.tokens = self.chars = 0
+
+    def add(self, text: str):
+        shingles = shingle_hashes(text)
+        if len(shingles):
+            signature = minhash(shingles)
+            self.signature = signature if self.signature is None else np.minimum(self.signature, signature)
+        words, tokens = _word_counts(text)
+        self.words += words
+        self.tokens += tokens
+        self.chars += len(text)
+
+    def result(self) -> Fingerprint | None:
+        if self.signature is None:
+            return None
+        quality = self.words / self.tokens if self.tokens else 0.0
+        return Fingerprint(self.signature, band_keys(self.signature), round(quality, 4), self.chars)
+
+def fingerprint(text: str) -> Fingerprint | None:
+    parts = Fingerprinter()
+    parts.add(text)
+    return parts.result()
+
+def find_near_duplicate(fp: Fingerprint, file_hash: str):
+    """ Most similar ingested document at or above NEAR_DUP_THRESHOLD, as
+        (hash, path, quality, chars, document id, similarity), or None. """
+    best = None
+    for hash_, path, blob, quality, chars, doc_id in get_lsh_candidates(fp.bands, exclude_hash=file_hash):
+        score = similarity(fp.minhash, np.frombuffer(blob, dtype="<u4"))
+        if score >= NEAR_DUP_THRESHOLD and (best is None or score > best[-1]):
+            best = (hash_, path, quality, chars, doc_id, score)
+    return best
+
+def check_near_duplicate(path, file_hash: str, fp: Fingerprint | None) -> tuple[bool, Replacement | None]:
+    """ Resolve an extracted text's fingerprint against stored copies.
+        Returns (skip, replacement): skip when the caller should skip the file;
+        a replacement when it is a better copy of a stored one, which the
+        caller passes to replace_near_duplicate() once this copy is stored. """
+    if fp is None:
+        return False, None
+    blob = fp.minhash.astype("<u4").tobytes()
+    match = find_near_duplicate(fp, file_hash)
+    if match is None:
+        record_fingerprint(file_hash, path, blob, fp.quality, fp.chars, fp.bands)
+        return False, None
+
+    hash_, kept_path, quality, chars, doc_id, score = match
+    if NEAR_DUP_ACTION != "skip":
+        logger.info("[NearDup] %s is %.0f%% similar to %s (flagged, both kept)", path, score * 100, kept_path)
+        record_fingerprint(file_hash, path, blob, fp.quality, fp.chars, fp.bands)
+        return False, None
+
+    if fp.quality > quality + QUALITY_MARGIN:
+        return False, Replacement(doc_id, hash_, kept_path, quality, score, fp)
+
+    record_fingerprint(file_hash, path, blob, fp.quality, fp.chars, fp.bands, duplicate_of=hash_, similarity=score)
+    logger.info("[NearDup] Skipping %s: %.0f%% similar to %s (quality %.2f vs %.2f)",
+                path, score * 100, kept_path, fp.quality, quality)
+    return True, None
+
+def replace_near_duplicate(path, file_hash: str, replacement: Replacement) -> list[int]:
+    """ Delete the worse copy after the better one (file_hash) was stored, so
+        the content never leaves the topic. Returns the tombstoned vector ids
+        for the caller's index; texts both copies share stay live. """
+    fp = replacement.fingerprint
+    removed = delete_document(replacement.doc_id)
+    mark_duplicate(replacement.hash_, file_hash, replacement.similarity)
+    record_fingerprint(file_hash, path, fp.minhash.astype("<u4").tobytes(), fp.quality, fp.chars, fp.bands)
+    logger.info("[NearDup] %s replaces %s (%.0f%% similar, quality %.2f > %.2f)",
+                path, replacement.path, replacement.similarity * 100, fp.quality, replacement.quality)
+    return removed
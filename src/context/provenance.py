@@ -3,46 +3,128 @@
     for each retrieved chunk, injecting metadata into the prompt and
     returning both sources list and answer.
 """
-from typing import List, Tuple
+from typing import Iterator, List, Tuple
 from langchain.schema import Document
 import os 
+from time import perf_counter
+
+from context.filters import parse_filter
+from data.db import SECTION_KEYS
+from server.metrics import count, observe, timed
+from server.profiler import query_profiler
+from server.querylog import query_log
 
 def run_rag_with_provenance(
     question: str,
-    retriever
+    retriever,
+    record: bool = True
 ) -> Tuple[str, str]:
 
     # Import here to avoid circular dependency
     from server.llm import generate_answer
 
+    if record: # batch runs (server.batch) replay the log and do not add to it
+        query_log.record(question)
+    count("queries", pipeline="query")
+    with timed("query", "total"):
+        # Runs under cProfile/tracemalloc while queries are armed (--profile-queries, `profile N`).
+        return query_profiler.run(_run_rag_with_provenance, question, retriever, generate_answer)
+
+def _run_rag_with_provenance(question, retriever, generate_answer) -> Tuple[str, str]:
+    # "type:pdf after:2024-01-01 question" searches only matching documents.
+    search_filter, question = parse_filter(question)
+    if search_filter and hasattr(retriever, "with_filter"):
+        retriever = retriever.with_filter(search_filter)
+
     # Retrieve chunks as LangChain Document objects
     # docs: List[Document] = retriever.get_relevant_documents(question) #DEPRECATED but works
-    docs: List[Document] = retriever.invoke(question)
+    with timed("query", "retrieve"):
+        docs: List[Document] = retriever.invoke(question)
+
+    context_text, sources_text = build_context(docs)
+    with timed("query", "generate"):
+        answer = generate_answer(question, context_text)
+    return sources_text, answer
+
+def stream_rag_with_provenance(
+    question: str,
+    retriever,
+    record: bool = True
+) -> Tuple[List[Tuple[Document, float]], Iterator[str]]:
+    """ Streaming run_rag_with_provenance (HTTP API): returns the scored chunks
+        as soon as retrieval is done, and an iterator over the answer text as
+        the LLM generates it. Closing the iterator early stops generation. """
+    from server.llm import stream_answer
+
+    if record:
+        query_log.record(question)
+    count("queries", pipeline="query")
+    start = perf_counter()
+    question, hits = retrieve_scored(question, retriever)
+    context_text, _ = build_context([doc for doc, _ in hits])
 
-    # Build context with metadata tags
+    def pieces():
+        generate_start = perf_counter()
+        first = True
+        try:
+            for piece in stream_answer(question, context_text):
+                if first:
+                    observe("query", "first_token", perf_counter() - start)
+                    first = False
+                yield piece
+        finally:
+            observe("query", "generate", perf_counter() - generate_start)
+            observe("query", "total", perf_counter() - start)
+    return hits, pieces()
+
+def retrieve_scored(question: str, retriever) -> Tuple[str, List[Tuple[Document, float]]]:
+    """ Same search as retriever.invoke() (filter prefix included), with scores.
+        Returns the question without the filter prefix and (chunk, distance) pairs. """
+    search_filter, question = parse_filter(question)
+    search_filter = search_filter or getattr(retriever, "search_filter", None)
+    with timed("query", "retrieve"):
+        hits = retriever.vectorstore.similarity_search_with_score(question, k=retriever.k, search_filter=search_filter)
+    return question, hits
+
+def hit_record(doc: Document, score: float) -> dict:
+    """JSON form of one scored chunk: text, score and every source it came from."""
+    return {"text_id": doc.metadata.get("text_id"), "score": round(float(score), 6), "text": doc.page_content,
+            "sources": [{key: src.get(key) for key in ("path", "title", "chunk_index", "page")}
+                        | {key: src[key] for key in SECTION_KEYS if key in src}
+                        for src in doc.metadata.get("sources", [])]}
+
+def build_context(docs: List[Document]) -> Tuple[str, str]:
+    """Prompt context with metadata tags, and the sources text shown under the answer."""
+    prompt_start = perf_counter()
     context_blocks: List[str] = []
     sources_info = set()
 
     for doc in docs:
         md = doc.metadata or {}
-        title = md.get("title", "unknown")
-        path = md.get("path", "unknown")
-        page = md.get("page", "?")
-        chunk_index = md.get("chunk_index", None)
+        # A text stored once for several documents is one block listing every source.
+        sources = md.get("sources") or [md]
+        tags = []
+        snippet = doc.page_content[:80].replace("\n", " ").strip() + "..."
+        for src in sources:
+            title = src.get("title", "unknown")
+            path = src.get("path", "unknown")
+            page = src.get("page", "?")
+            chunk_index = src.get("chunk_index", None)
+            tags.append(f"{title}" + (f"—chunk {chunk_index}" if chunk_index is not None else ""))
 
-        tag = f"[{title}" + (f"—chunk {chunk_index}" if chunk_index is not None else "") + "]"
-        context_blocks.append(f"{tag} {doc.page_content}")
+            filename = os.path.basename(path)
+            line = f"{filename} ?page" if page == "?" else f"{filename} page {page}"
+            if src.get("page_path"): # a CHM page
+                line += f" ({src['page_path']})"
+            if src.get("page_title"): # a feed post or CHM page
+                line += f" — {src['page_title']}" + (f" ({src['page_date']})" if src.get("page_date") else "")
+            sources_info.add(f"{line}\n  ↳ {snippet}")
 
-        filename = os.path.basename(path)
-        snippet = doc.page_content[:80].replace("\n", " ").strip() + "..."
-        line = f"{filename} ?page" if page == "?" else f"{filename} page {page}"
-        sources_info.add(f"{line}\n  ↳ {snippet}")
+        context_blocks.append(f"[{'; '.join(tags)}] {doc.page_content}")
 
     context_text = "\n\n".join(context_blocks)
-    answer = generate_answer(question, context_text)
-
-    sources_text = "\n\n".join(sorted(sources_info))
-    return sources_text, answer
+    observe("query", "build_prompt", perf_counter() - prompt_start)
+    return context_text, "\n\n".join(sorted(sources_info))
 """
     Run RAG pipeline, retrieving documents with FAISS retriever then
     constructing a prompt that includes provenance metadata.
@@ -0,0 +1,105 @@
+"""
+    Roll a normalization map edit out to the chunks already stored, without
+    --rechunk: main.py --renormalize.
+
+    metadata.db records the map the chunk texts were last normalized with
+    (normalization_applied). The rules added or changed since then are
+    compiled into one Normalizer, and each rule's term (the ligature, the
+    punctuation mark, the literal of an OCR pattern) is looked up in the
+    trigram index over chunk_texts, so only texts containing a term are read.
+    Texts the rules change get a new text id (text ids are content addresses
+    and FAISS vector ids); the chunks follow, the old vectors are tombstoned
+    and only the new texts are embedded.
+
+    Chunk boundaries stay as they are. Removed rules are not reverted, and a
+    changed rule only applies where its term still occurs: both need --rechunk.
+"""
+import logging
+from time import perf_counter
+
+from config import EMBED_BATCH_SIZE
+from data.db import (
+    SQL_BATCH, find_text_ids_containing, get_applied_normalization, get_texts_by_ids, iter_chunk_texts,
+    rewrite_chunk_texts, set_applied_normalization,
+)
+from data.filter import normalization_rules
+from data.jsonhandler import Normalizer
+from server.logger import Progress
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = ("ligatures", "punctuation", "ocr_artifacts")
+
+def rules_diff(applied: dict, current: dict) -> tuple[dict, int, int]:
+    """ The entries of current that applied lacks or maps differently, as a
+        normalization map, with the number of changed and of removed entries. """
+    diff, changed, removed = {}, 0, 0
+    for cat in CATEGORIES:
+        old, new = applied.get(cat, {}), current.get(cat, {})
+        diff[cat] = {bad: good for bad, good in new.items() if old.get(bad) != good}
+        changed += sum(bad in old for bad in diff[cat])
+        removed += sum(bad not in new for bad in old)
+    return diff, changed, removed
+
+def _candidates(normalize: Normalizer) -> list[int] | None:
+    # Text ids containing any rule's term, or None when a rule has no literal term.
+    terms = [bad for bad, _ in normalize.replacements] + [probe for _, _, probe in normalize.rules]
+    if any(term is None for term in terms):
+        return None
+    ids = set()
+    for term in dict.fromkeys(terms):
+        ids.update(find_text_ids_containing(term))
+    return sorted(ids)
+
+def renormalize(store, batch_size: int = EMBED_BATCH_SIZE) -> dict:
+    """ Apply the rules added or changed since the last run to the stored chunk
+        texts and re-embed the texts that changed. Returns a summary. """
+    start = perf_counter()
+    current = normalization_rules()
+    applied = get_applied_normalization()
+    if applied is None:
+        # Texts stored before the bookkeeping existed: the current map is the baseline.
+        set_applied_normalization(current)
+        logger.info("[Renormalize] No record of the applied normalization map; recorded the current one")
+        return {"rules": 0, "candidates": 0, "rewritten": 0, "embedded": 0, "seconds": 0.0}
+
+    diff, changed, removed = rules_diff(applied[0], current)
+    rules = sum(len(entries) for entries in diff.values())
+    if changed or removed:
+        logger.warning("[Renormalize] %d changed and %d removed rules since %s: old replacements stay "
+                       "in place, run --rechunk to redo them", changed, removed, applied[1])
+    summary = {"rules": rules, "candidates": 0, "rewritten": 0, "embedded": 0}
+    if rules:
+        normalize = Normalizer(diff)
+        candidates = _candidates(normalize)
+        if candidates is None:
+            logger.warning("[Renormalize] A pattern without a literal term: scanning every chunk text")
+        summary["candidates"] = len(candidates) if candidates is not None else "all"
+        logger.info("[Renormalize] %d new or changed rules, %s candidate chunk texts", rules, summary["candidates"])
+
+        contents = {}
+        for rows in iter_chunk_texts(candidates):
+            for text_id, content in rows:
+                fixed = normalize(content)
+                if fixed != content:
+                    contents[text_id] = fixed
+        moved = rewrite_chunk_texts(contents)
+        summary["rewritten"] = len(contents)
+
+        # rewrite_chunk_texts() already stored the tombstones.
+        if moved:
+            store.mark_removed(moved.keys())
+            new_ids = sorted(set(moved.values()))
+            progress = Progress(logger, "[Renormalize] Embedded texts", total=len(new_ids))
+            for offset in range(0, len(new_ids), SQL_BATCH):
+                docs = get_texts_by_ids(new_ids[offset:offset + SQL_BATCH])
+                summary["embedded"] += len(store.add_documents(list(docs.values()), batch_size))
+                progress.update(len(docs))
+            progress.close()
+            store.save()
+
+    set_applied_normalization(current)
+    summary["seconds"] = round(perf_counter() - start, 2)
+    logger.info("[Renormalize] %d chunk texts rewritten, %d embedded in %.2fs",
+                summary["rewritten"], summary["embedded"], summary["seconds"])
+    return summary
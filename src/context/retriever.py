@@ -1,13 +1,27 @@
 import hashlib
 import json
+import logging
 import string
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
+from time import perf_counter
+from typing import Iterable, Iterator
 from langchain.schema import Document
 
-from data import insert_document,insert_chunks, get_existing_hashes
-from context.loaders import detect_and_load_text
-from config import EMBED_MODEL_NAME, GARBAGE_THRESHOLD
+from data import insert_document,insert_chunks, get_existing_hashes, delete_document
+from data.db import SECTION_KEYS, get_kept_copy, get_rechunk_sources, set_applied_normalization
+from data.filter import detect_language, normalization_rules
+from context.loaders import lazy_load_text
+from context.neardup import Fingerprinter, check_near_duplicate, replace_near_duplicate
+from context.textcache import cache_pages, get_pages
+from config import EMBED_MODEL_NAME, EXTRACT_WORKERS, GARBAGE_THRESHOLD, NEAR_DUP
+from server.metrics import count, metrics_context, observe, timed
+from server.logger import Progress
+from server.profiler import ingest_profiler
+
+logger = logging.getLogger(__name__)
 
 # Metadata summary
 def write_stats(doc_count, chunk_count, topic, model_name):
@@ -21,7 +35,7 @@ def write_stats(doc_count, chunk_count, topic, model_name):
     stats_path = Path("db") / topic / "stats.json"
     with open(stats_path, "w", encoding="utf-8") as f:
         json.dump(stats, f, indent=2)
-    print(f"[INFO] Stats written to {stats_path}")
+    logger.info("Stats written to %s", stats_path)
 
 # Encoding handling
 def read_file_safely(path: str) -> str:
@@ -88,80 +102,265 @@ def chunk_documents(data_dir: str, split_func: callable) -> list[Document]:
         and return list of Document objects with metadata."""
     docs = []
     existing_hashes = get_existing_hashes()
+    files = [path for path in Path(data_dir).rglob("*") if path.is_file()]
+    progress = Progress(logger, "[Ingest] Files", total=len(files))
 
-    for path in Path(data_dir).rglob("*"):
-        if not path.is_file():
-            continue
-
+    new_files = []
+    for path in files:
         file_hash = hash_file(path)
         if file_hash in existing_hashes:
-            print(f"[SKIP] Already indexed: {path}(hash: {file_hash})")
-            continue
+            logger.debug("[SKIP] Already indexed: %s (hash: %s)", path, file_hash)
+            progress.update()
+        else:
+            new_files.append((path, file_hash))
 
-        try:
-            docs_from_loader = detect_and_load_text(str(path))
-            print(f"[DEBUG] Running OCR artifact detection: {path.stem}")
-            if not docs_from_loader:
-                print(f"[SKIP] Unsupported file type: {path}")
-                continue
-
-            if path.suffix.lower() == ".txt":
-                print(f"[DEBUG] Reading {path} using read_file_safely")
-                text = read_file_safely(path)
+    # Loaders (extract_chmLib, pypdf, ebook-convert...) run ahead in worker
+    # threads; splitting and SQLite writes stay in this thread, in file order.
+    # Profiled runs stay sequential so every stage is charged to its own file.
+    workers = 1 if ingest_profiler.enabled else EXTRACT_WORKERS
+    for (path, file_hash), extract in _prefetch(new_files, workers):
+        docs.extend(ingest_file(path, split_func, file_hash, extract))
+        progress.update()
+
+    progress.close()
+    return docs
+
+# Feed exports are streamed post by post in the ingesting thread: extracted
+# ahead, a multi-GB export would be held in memory whole.
+STREAMED_SUFFIXES = (".xml", ".atom")
+
+def _prefetch(files: list[tuple[Path, str]], workers: int):
+    """ Yield (item, extract) in order, where extract() returns the pages that
+        a worker already extracted. At most 2 * workers files are held. """
+    if workers <= 1:
+        for item in files:
+            yield item, None
+        return
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="extract") as pool:
+        def submit(item):
+            return None if item[0].suffix.lower() in STREAMED_SUFFIXES else pool.submit(_extract_ahead, *item)
+        pending = deque()
+        items = iter(files)
+        for item in items:
+            pending.append((item, submit(item)))
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            item, future = pending.popleft()
+            yield item, (lambda *_, future=future: future.result()) if future else None
+            for next_item in items:
+                pending.append((next_item, submit(next_item)))
+                break
+
+def _extract_ahead(path: Path, file_hash: str) -> list[Document] | None:
+    if NEAR_DUP and get_kept_copy(file_hash): # _ingest_file skips it without extracting
+        return None
+    with metrics_context(filetype=path.suffix[1:].lower() or "none"):
+        pages = extract_pages(path, file_hash)
+        return list(pages) if pages is not None else None
+
+def rechunk_documents(split_func: callable) -> int:
+    """ Rebuild every document's chunks from the text cache with the current
+        chunking, normalization and garbage settings, without parsing source
+        files. Documents ingested before the cache existed are parsed once more
+        if their source is unchanged. Returns the number of documents stored;
+        the caller rebuilds the index. """
+    sources = get_rechunk_sources()
+    progress = Progress(logger, "[Rechunk] Files", total=len(sources))
+    stored = kept = 0
+    for path, file_hash, doc_id in sources:
+        path = Path(path)
+        with ingest_profiler.file(path), metrics_context(filetype=path.suffix[1:].lower() or "none"), \
+                timed("ingest", "file_total"):
+            pages = get_pages(file_hash)
+            if pages is not None:
+                count("text_cache_hits", pipeline="ingest")
+            elif path.is_file() and hash_file(path) == file_hash:
+                pages = extract_pages(path, file_hash)
+            if pages is None:
+                logger.warning("[Rechunk] No cached text and no unchanged source for %s; keeping its chunks", path)
+                kept += 1
             else:
-                text = "\n\n".join(doc.page_content for doc in docs_from_loader)
-            
-        except Exception as e:
-            print(f"[ERROR] Cannot load file {path}: {e}")
-            continue
+                stored += bool(_ingest_pages(path, file_hash, pages, split_func, replaces=doc_id))
+        progress.update()
+    progress.close()
+    if not kept: # every chunk now carries the current map (see context/renormalize.py)
+        set_applied_normalization(normalization_rules())
+    logger.info("[Rechunk] %d documents re-chunked, %d kept as they were", stored, kept)
+    return stored
 
-        chunks = split_func(text, path)
-        if not chunks:
-            print(f"[SKIP] No chunks extracted: {path}")
-            continue
+def ingest_file(path: Path, split_func: callable, file_hash: str = None, extract: callable = None,
+                removed: callable = None) -> list[Document]:
+    """ Load, chunk and filter a single file, insert it into SQLite and
+        return its chunks as Documents ready to be embedded. extract(path,
+        file_hash) replaces extract_pages, e.g. with a prefetched result.
+        removed(ids) gets the vector ids tombstoned when the file replaces a
+        worse near-duplicate copy (for an index that stays in memory). """
+    path = Path(path)
+    with ingest_profiler.file(path), metrics_context(filetype=path.suffix[1:].lower() or "none"), \
+            timed("ingest", "file_total"):
+        return _ingest_file(path, split_func, file_hash, extract, removed)
+
+def extract_pages(path: Path, file_hash: str) -> Iterator[Document] | None:
+    """ The loader documents of a file (pages, feed posts, CHM pages) one at
+        a time: from the text cache when this content was parsed before by
+        the current loaders, otherwise from the loader, cached on the way.
+        None for unsupported file types. """
+    cached = get_pages(file_hash)
+    if cached is not None:
+        count("text_cache_hits", pipeline="ingest")
+        return cached
+
+    if path.suffix.lower() == ".txt":
+        pages = _txt_pages(path)
+    else:
+        pages = lazy_load_text(str(path))
+        if pages is None:
+            return None
+    return cache_pages(file_hash, pages, path)
 
-        print(f"Indexed: {path} | Chunks: {len(chunks)}")
+def _txt_pages(path: Path) -> Iterator[Document]:
+    yield Document(page_content=read_file_safely(path))
 
-        trash_count = sum(1 for chunk in chunks if is_trash(chunk))
-        if trash_count / len(chunks) > GARBAGE_THRESHOLD:
-            print(f"[SKIP] File mostly garbage: {path} ({trash_count}/{len(chunks)} chunks)")
+def _language_sample(chunks: list[tuple[str, dict]], sample_chars: int = 2000) -> str:
+    # detect_language() reads the middle of a text; the middle chunks are that.
+    sample, size = [], 0
+    for chunk, _ in chunks[len(chunks) // 2:]:
+        sample.append(chunk)
+        size += len(chunk)
+        if size >= sample_chars:
+            break
+    return "\n".join(sample)
+
+def _ingest_file(path: Path, split_func: callable, file_hash: str = None, extract: callable = None,
+                 removed: callable = None) -> list[Document]:
+    file_hash = file_hash or hash_file(path)
+    if NEAR_DUP:
+        kept = get_kept_copy(file_hash) # skipped before: no need to extract again
+        if kept:
+            logger.debug("[NearDup] Skipping %s: near-duplicate of %s", path, kept)
+            count("files_near_duplicate", pipeline="ingest")
+            return []
+    try:
+        pages = (extract or extract_pages)(path, file_hash)
+        if pages is None:
+            logger.info("[SKIP] Unsupported file type: %s", path)
+            return []
+    except Exception as e:
+        logger.error("Cannot load file %s: %s", path, e)
+        count("files_failed", pipeline="ingest")
+        return []
+    return _ingest_pages(path, file_hash, pages, split_func, removed)
+
+def _ingest_pages(path: Path, file_hash: str, pages: Iterable[Document], split_func: callable,
+                  removed: callable = None, replaces: int = None) -> list[Document]:
+    """ Split, filter and store a file's loader documents as they are read:
+        each page or feed post is split on its own and its chunks carry its
+        title and date. replaces is the id of the document these pages
+        rebuild, deleted once they have all been read (--rechunk). """
+    docs = []
+    replacement = None
+    count("files", pipeline="ingest")
+
+    fingerprints = Fingerprinter() if NEAR_DUP else None
+    chunks = [] # (chunk, page metadata)
+    pages, read, load_seconds = iter(pages), 0, 0.0
+    while True:
+        start = perf_counter()
+        try:
+            page = next(pages)
+        except StopIteration:
+            break
+        except Exception as e: # streaming loaders parse while their pages are read
+            logger.error("Cannot load file %s: %s", path, e)
+            count("files_failed", pipeline="ingest")
+            return docs
+        finally:
+            load_seconds += perf_counter() - start
+        text, metadata = page.page_content, page.metadata or {}
+        read += 1
+        count("bytes", len(text) if text.isascii() else len(text.encode("utf-8")), pipeline="ingest") # UTF-8 bytes
+        if fingerprints:
+            with timed("ingest", "fingerprint"):
+                fingerprints.add(text)
+        section = {"page": metadata.get("page"), "page_title": metadata.get("title"),
+                   "page_date": metadata.get("date"), "page_path": metadata.get("page_path")}
+        chunks += [(chunk, section) for chunk in split_func(text, path)]
+    observe("ingest", "load", load_seconds)
+    if replaces is not None:
+        delete_document(replaces) # tombstones its vectors
+    if not read:
+        logger.info("[SKIP] No text extracted: %s", path)
+        return docs
+
+    if NEAR_DUP:
+        with timed("ingest", "fingerprint"):
+            duplicate, replacement = check_near_duplicate(path, file_hash, fingerprints.result())
+        if duplicate:
+            count("files_near_duplicate", pipeline="ingest")
+            return docs
+
+    if not chunks:
+        logger.info("[SKIP] No chunks extracted: %s", path)
+        return docs
+
+    logger.debug("Split %s into %d chunks from %d pages", path, len(chunks), read)
+
+    filter_start = perf_counter()
+    trash_count = sum(1 for chunk, _ in chunks if is_trash(chunk))
+    if trash_count / len(chunks) > GARBAGE_THRESHOLD:
+        logger.info("[SKIP] File mostly garbage: %s (%d/%d chunks)", path, trash_count, len(chunks))
+        count("files_garbage", pipeline="ingest")
+        return docs
+
+    # Filter trash chunks and add OCR metadata
+    filtered_chunks = []
+    for chunk, section in chunks:
+        if is_trash(chunk):
             continue
+        skip_ocr_fix = is_good_chunk(chunk)
+        filtered_chunks.append((chunk, {"skip_ocr_fix": skip_ocr_fix, **section}))
+    observe("ingest", "filter", perf_counter() - filter_start)
+    count("chunks_rejected", len(chunks) - len(filtered_chunks), pipeline="ingest")
+
+    with timed("ingest", "language"):
+        language = detect_language(_language_sample(chunks))
+    doc_id = insert_document(
+        str(path), path.stem, file_hash, path.suffix[1:].lower(), EMBED_MODEL_NAME, language
+    )
+
+    accepted = 0
+    final_chunks = []
+    for idx, (chunk, metadata) in enumerate(filtered_chunks): 
+        page_num = metadata.get("page") or "?" # numbered pages (CHM) only
+        chunk = ' '.join(chunk.split())
+        docs.append(Document(
+            page_content=chunk,
+            metadata={
+                "doc_id": doc_id,
+                "path": str(path),
+                "title": path.stem,
+                "chunk_index": idx,
+                "page": page_num,
+                "skip_ocr_fix": metadata.get("skip_ocr_fix", False),
+                **{key: metadata[key] for key in SECTION_KEYS if metadata.get(key)},
+            }
+        ))
+        final_chunks.append((chunk, metadata))
+        accepted += 1
+
+    if final_chunks:
+        with timed("ingest", "insert"):
+            text_ids = insert_chunks(doc_id, final_chunks)
+        if not text_ids: # same content already stored under another path
+            return []
+        for doc, text_id in zip(docs, text_ids):
+            doc.metadata["text_id"] = text_id
+        if replacement: # only now that this copy is stored
+            tombstoned = replace_near_duplicate(path, file_hash, replacement)
+            if removed:
+                removed(tombstoned)
 
-        # Filter trash chunks and add OCR metadata
-        filtered_chunks = []
-        for chunk in chunks:
-            if is_trash(chunk):
-                continue
-            skip_ocr_fix = is_good_chunk(chunk)
-            filtered_chunks.append((chunk, {"skip_ocr_fix": skip_ocr_fix}))
-
-        doc_id = insert_document(
-            str(path), path.stem, file_hash, path.suffix[1:], EMBED_MODEL_NAME
-        )
-
-        accepted = 0
-        final_chunks = []
-        for idx, (chunk, metadata) in enumerate(filtered_chunks): 
-            page_num = "?" # update page data here if needed
-            chunk = ' '.join(chunk.split())
-            docs.append(Document(
-                page_content=chunk,
-                metadata={
-                    "doc_id": doc_id,
-                    "path": str(path),
-                    "title": path.stem,
-                    "chunk_index": idx,
-                    "page": page_num,
-                    "skip_ocr_fix": metadata.get("skip_ocr_fix", False),
-                }
-            ))
-            final_chunks.append((chunk, metadata))
-            accepted += 1
-
-        if final_chunks:
-            print(f"[DB] Inserting {len(final_chunks)} chunks to DB for {path.name}")
-            insert_chunks(doc_id, final_chunks)
-
-        print(f"Accepted {accepted}/{len(chunks)} chunks from {path.stem}")
-
-    return docs
\ No newline at end of file
+    logger.debug("Indexed: %s | accepted %d/%d chunks", path, accepted, len(chunks))
+    count("chunks_accepted", accepted, pipeline="ingest")
+    return docs
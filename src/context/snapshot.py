@@ -0,0 +1,262 @@
+"""
+    Topic snapshots: one versioned, checksummed file holding everything a
+    server needs, built on one machine and copied to others.
+
+    Layout (every section starts on a 4 KiB boundary):
+
+        metadata.db   at offset 0, vacuumed; SQLite opens it in place (immutable)
+        index.faiss   tombstoned vectors removed; memory-mapped by FAISS, zero-copy
+        vectors.f16   compressed indexes only (INDEX_BYTES_PER_VECTOR)
+        stats.json
+        manifest      JSON: format, topic, embedding model fingerprint, and
+                      offset/length/sha256 of every section
+        footer        MAGIC, format version, manifest offset/length/sha256
+
+    A server opens the file with open_snapshot() and maps it as is; import
+    (import_snapshot) streams every section to the topic directory while
+    checking its checksum, and only replaces the old files when all match.
+
+    python src/main.py --topic tech --export-snapshot tech.ragsnap
+    python src/main.py --topic tech --import-snapshot tech.ragsnap
+    python src/main.py --topic tech --snapshot tech.ragsnap   # serve without unpacking
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import struct
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from config import EMBED_MODEL_NAME
+from context.store import INDEX_FILE, VECTORS_FILE, ChunkIndex, VectorFile, describe_index
+from data.db import db_path, use_read_only
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"RAGSNAP\0"
+FORMAT_VERSION = 1
+FOOTER = struct.Struct("<8sIQQ32s") # magic, version, manifest offset, manifest length, manifest sha256
+ALIGN = 4096 # page size: sections can be memory-mapped
+BLOCK = 1 << 20
+PROBE_TEXTS = ["dimension probe", "The quick brown fox jumps over the lazy dog.", "42"]
+
+class SnapshotError(RuntimeError):
+    pass
+
+def embedding_fingerprint(embedding) -> dict:
+    """ Model name, dimension and a hash of the vectors of a few probe texts
+        (rounded, so CPU/GPU float noise does not matter). Vectors from
+        another model are useless against the snapshot's index. """
+    vectors = np.asarray(embedding.embed_documents(PROBE_TEXTS), dtype="float32")
+    digest = hashlib.sha256(np.round(vectors, 3).tobytes()).hexdigest()[:16]
+    return {"model": EMBED_MODEL_NAME, "dim": int(vectors.shape[1]), "fingerprint": digest}
+
+def _copy_section(src, out, length=None) -> str:
+    """Append src (file object) to out, returning the sha256 of what was copied."""
+    h = hashlib.sha256()
+    remaining = length
+    while remaining is None or remaining > 0:
+        block = src.read(BLOCK if remaining is None else min(BLOCK, remaining))
+        if not block:
+            break
+        h.update(block)
+        out.write(block)
+        if remaining is not None:
+            remaining -= len(block)
+    return h.hexdigest()
+
+def _pad(out):
+    out.write(b"\0" * (-out.tell() % ALIGN))
+
+# ========== Export ==========
+def _vacuumed_db(tmp_dir: Path, index) -> Path:
+    """ Consistent, compact copy of metadata.db (VACUUM INTO works while the
+        live database is in use) without tombstones or profiling rows. """
+    copy = tmp_dir / "metadata.db"
+    with sqlite3.connect(db_path()) as conn:
+        conn.execute("VACUUM INTO ?", (str(copy),))
+    conn = sqlite3.connect(copy)
+    try:
+        tombstones = np.asarray([row[0] for row in conn.execute("SELECT vector_id FROM tombstones")], dtype="int64")
+        if len(tombstones):
+            index.remove_ids(faiss.IDSelectorBatch(tombstones))
+        conn.execute("DELETE FROM tombstones")
+        conn.execute("DELETE FROM ingest_profile")
+        conn.commit()
+        conn.execute("PRAGMA journal_mode = DELETE") # immutable readers must not need a -wal file
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    return copy
+
+def export_snapshot(store: ChunkIndex, out_path, topic: str, embedding=None) -> dict:
+    """Write the topic behind store (a loaded ChunkIndex) to a single snapshot file."""
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    store.save(store.db_dir) # pending vectors on disk, vectors.f16 flushed
+    with store._mutate_lock, tempfile.TemporaryDirectory(dir=out_path.parent) as tmp:
+        tmp = Path(tmp)
+        with store.rw_lock.read():
+            index = faiss.clone_index(store.index)
+        db_copy = _vacuumed_db(tmp, index)
+        faiss.write_index(index, str(tmp / INDEX_FILE))
+
+        sections = [("metadata.db", db_copy), ("index.faiss", tmp / INDEX_FILE)]
+        if store.vectors is not None:
+            sections.append(("vectors.f16", Path(store.vectors.path)))
+        stats = Path(db_path()).with_name("stats.json")
+        if stats.exists():
+            sections.append(("stats.json", stats))
+
+        manifest = {
+            "format": FORMAT_VERSION,
+            "topic": topic,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "embedding": embedding_fingerprint(embedding) if embedding is not None else {"model": EMBED_MODEL_NAME},
+            "index": {"mode": describe_index(index), "dim": index.d, "vectors": index.ntotal},
+            "sections": {},
+        }
+        with sqlite3.connect(db_copy) as conn:
+            manifest["documents"] = conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+            manifest["texts"] = conn.execute("SELECT COUNT(*) FROM chunk_texts").fetchone()[0]
+
+        partial = out_path.with_name(out_path.name + ".tmp")
+        with open(partial, "wb") as out:
+            for name, path in sections:
+                _pad(out)
+                offset = out.tell()
+                with open(path, "rb") as src:
+                    digest = _copy_section(src, out)
+                manifest["sections"][name] = {"offset": offset, "length": out.tell() - offset, "sha256": digest}
+            if store.vectors is not None:
+                manifest["sections"]["vectors.f16"]["rows"] = store.vectors.rows
+            raw = json.dumps(manifest, indent=2).encode("utf-8")
+            offset = out.tell()
+            out.write(raw)
+            out.write(FOOTER.pack(MAGIC, FORMAT_VERSION, offset, len(raw), hashlib.sha256(raw).digest()))
+        os.replace(partial, out_path)
+    logger.info("[Snapshot] %s: %s index, %d vectors, %d texts, %.1f MB", out_path, manifest["index"]["mode"],
+                manifest["index"]["vectors"], manifest["texts"], out_path.stat().st_size / 2**20)
+    return manifest
+
+# ========== Reading ==========
+def read_manifest(path) -> dict:
+    """Manifest of a snapshot, after checking the footer and the manifest checksum."""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size < FOOTER.size:
+            raise SnapshotError(f"{path} is not a snapshot (too small)")
+        f.seek(size - FOOTER.size)
+        magic, version, offset, length, digest = FOOTER.unpack(f.read(FOOTER.size))
+        if magic != MAGIC:
+            raise SnapshotError(f"{path} is not a snapshot")
+        if version > FORMAT_VERSION:
+            raise SnapshotError(f"{path} has format {version}; this version reads up to {FORMAT_VERSION}")
+        if offset + length > size - FOOTER.size:
+            raise SnapshotError(f"{path} is truncated")
+        f.seek(offset)
+        raw = f.read(length)
+    if hashlib.sha256(raw).digest() != digest:
+        raise SnapshotError(f"{path}: manifest checksum mismatch")
+    return json.loads(raw)
+
+def check_embedding(manifest: dict, embedding):
+    """Refuse a snapshot whose vectors come from another embedding model."""
+    expected = manifest.get("embedding", {})
+    if "fingerprint" not in expected:
+        logger.warning("[Snapshot] No embedding fingerprint in the snapshot; cannot check the model")
+        return
+    actual = embedding_fingerprint(embedding)
+    if (actual["dim"], actual["fingerprint"]) != (expected["dim"], expected["fingerprint"]):
+        raise SnapshotError(f"Snapshot was built with {expected.get('model')} ({expected['dim']} dims); "
+                            f"the loaded embedding model ({actual['model']}, {actual['dim']} dims) differs")
+
+def verify_snapshot(path) -> dict:
+    """Stream every section and compare checksums; returns the manifest."""
+    manifest = read_manifest(path)
+    with open(path, "rb") as f:
+        for name, section in manifest["sections"].items():
+            f.seek(section["offset"])
+            if _copy_section(f, _Discard(), section["length"]) != section["sha256"]:
+                raise SnapshotError(f"{path}: section {name} is corrupt")
+    return manifest
+
+class _Discard:
+    def write(self, data):
+        pass
+
+# ========== Import ==========
+def import_snapshot(path, db_dir, embedding=None) -> dict:
+    """ Unpack a snapshot into db_dir (index) and the topic's metadata.db, in a
+        single streaming pass that checks every section. Nothing is replaced
+        unless all checksums match; the old metadata.db is kept as a backup. """
+    manifest = read_manifest(path)
+    if embedding is not None:
+        check_embedding(manifest, embedding)
+    targets = {"metadata.db": Path(db_path()), "index.faiss": Path(db_dir) / INDEX_FILE,
+               "vectors.f16": Path(db_dir) / VECTORS_FILE, "stats.json": Path(db_path()).with_name("stats.json")}
+    written = []
+    try:
+        with open(path, "rb") as f:
+            for name, section in manifest["sections"].items():
+                target = targets.get(name)
+                if target is None:
+                    logger.warning("[Snapshot] Skipping unknown section %s", name)
+                    continue
+                target.parent.mkdir(parents=True, exist_ok=True)
+                partial = target.with_name(target.name + ".import")
+                f.seek(section["offset"])
+                with open(partial, "wb") as out:
+                    digest = _copy_section(f, out, section["length"])
+                written.append((partial, target))
+                if digest != section["sha256"]:
+                    raise SnapshotError(f"{path}: section {name} is corrupt")
+    except BaseException:
+        for partial, _ in written:
+            partial.unlink(missing_ok=True)
+        raise
+
+    if targets["metadata.db"].exists():
+        stamp = datetime.now().strftime("%Y-%m-%d_%H%M%S")
+        shutil.copy2(targets["metadata.db"], targets["metadata.db"].with_name(f"metadata_{stamp}.db"))
+    for partial, target in written:
+        os.replace(partial, target)
+    if "vectors.f16" not in manifest["sections"]:
+        targets["vectors.f16"].unlink(missing_ok=True) # would re-rank with another index's vectors
+    Path(db_dir, "index.pkl").unlink(missing_ok=True)
+    logger.info("[Snapshot] Imported %s (%s, %d vectors, created %s)", path, manifest["index"]["mode"],
+                manifest["index"]["vectors"], manifest["created"])
+    return manifest
+
+# ========== Serving ==========
+def open_snapshot(path, embedding, verify: bool = False) -> ChunkIndex:
+    """ A read-only ChunkIndex served straight from the snapshot file: SQLite
+        opens the database section in place, the FAISS codes and float16
+        vectors are memory-mapped, so processes opening the same file share
+        one copy in the page cache. """
+    manifest = verify_snapshot(path) if verify else read_manifest(path)
+    if manifest["sections"]["metadata.db"]["offset"] != 0:
+        raise SnapshotError(f"{path}: metadata.db must be the first section")
+    if embedding is not None:
+        check_embedding(manifest, embedding)
+    section = manifest["sections"]["index.faiss"]
+    data = np.memmap(path, dtype="uint8", mode="r", offset=section["offset"], shape=(section["length"],))
+    index = faiss.read_index(faiss.ZeroCopyIOReader(faiss.swig_ptr(data), data.size), faiss.IO_FLAG_MMAP_IFC)
+    vectors = None
+    if "vectors.f16" in manifest["sections"]:
+        section = manifest["sections"]["vectors.f16"]
+        vectors = VectorFile(path, index.d, offset=section["offset"], rows=section["rows"])
+    use_read_only(path)
+    store = ChunkIndex(index, embedding, vectors=vectors)
+    store._snapshot_data = data # the index reads from this mapping: keep it alive
+    logger.info("[Snapshot] Serving %s: %s index, %d vectors, created %s", path, manifest["index"]["mode"],
+                index.ntotal, manifest["created"])
+    return store
@@ -1,32 +1,673 @@
+import faiss
+import logging
+import numpy as np
+import os
+import pickle
+import threading
+from collections import OrderedDict
 from time import time
-from langchain_community.vectorstores import FAISS
+from typing import Any
+from langchain.schema import Document
+from langchain_core.retrievers import BaseRetriever
+
+from config import (
+    EMBED_BATCH_SIZE, FILTER_CACHE_SIZE, FILTER_EXACT_MAX, INDEX_BYTES_PER_VECTOR, RERANK_FACTOR, TOMBSTONE_COMPACT_MIN, TOMBSTONE_COMPACT_RATIO)
+from data.db import (
+    get_tombstones, add_tombstones, clear_tombstones,
+    get_all_text_ids, get_text_id_map, get_texts_by_ids)
+from server.logger import Progress
+from server.metrics import count, timed
+
+logger = logging.getLogger(__name__)
+
+# ========== Concurrency ==========
+class ReadWriteLock:
+    """ Many concurrent searches, one exclusive writer. Waiting writers block new
+        readers so a live ingest cannot starve behind a stream of queries. """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    def acquire_read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+
+    def release_write(self):
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+    class _Guard:
+        def __init__(self, acquire, release):
+            self._acquire, self._release = acquire, release
+        def __enter__(self):
+            self._acquire()
+        def __exit__(self, *exc):
+            self._release()
+
+    def read(self):
+        return self._Guard(self.acquire_read, self.release_read)
+
+    def write(self):
+        return self._Guard(self.acquire_write, self.release_write)
+
+# ========== Float16 Vector File ==========
+VECTORS_FILE = "vectors.f16"
+
+class VectorFile:
+    """ Original vectors of a compressed index as float16, row = vector id,
+        memory-mapped: only the rows read for re-ranking are paged in, and they
+        live in the page cache rather than the process heap. Deleted ids leave
+        sparse holes that cost no disk space. With rows given it is a read-only
+        region of a larger file (a topic snapshot) starting at offset. """
+    def __init__(self, path, dim, offset: int = 0, rows: int = None):
+        self.path = path
+        self.dim = dim
+        self._map = None
+        if rows is None:
+            self._open()
+        elif rows:
+            self._map = np.memmap(path, dtype="float16", mode="r", offset=offset, shape=(rows, dim))
+
+    def _open(self):
+        rows = os.path.getsize(self.path) // (self.dim * 2) if os.path.exists(self.path) else 0
+        self._map = np.memmap(self.path, dtype="float16", mode="r+", shape=(rows, self.dim)) if rows else None
+
+    @property
+    def rows(self) -> int:
+        return 0 if self._map is None else self._map.shape[0]
+
+    def write(self, ids, vectors):
+        """Callers serialize writes (ChunkIndex._mutate_lock); readers may keep using the old map."""
+        if not len(ids):
+            return
+        top = int(ids.max()) + 1
+        if top > self.rows:
+            rows = max(top, int(self.rows * 1.5) + 1024)
+            with open(self.path, "ab") as f:
+                f.truncate(rows * self.dim * 2)
+            self._open()
+        self._map[ids] = np.asarray(vectors, dtype="float16")
+
+    def read(self, ids) -> np.ndarray:
+        return np.asarray(self._map[np.asarray(ids, dtype="int64")], dtype="float32")
+
+    def flush(self):
+        if self._map is not None:
+            self._map.flush()
+
+# ========== Chunk Index ==========
+INDEX_FILE = "index.faiss"
+TRAIN_SAMPLES = 20000 # vectors buffered to train a quantizer
+PQ_MIN_TRAIN = 39 * 256 # FAISS k-means wants ~39 points per centroid
+
+class ChunkIndex:
+    """ FAISS IndexIDMap2 whose vector ids are chunk_texts.id: a text shared by
+        several documents (or repeated within one) is embedded and stored once,
+        and a hit carries all of its sources. Text and metadata are read from
+        SQLite, so deleting a document only has to tombstone its orphaned ids:
+        tombstoned ids are excluded inside the FAISS search through an
+        IDSelector, and compaction physically removes them once they exceed
+        TOMBSTONE_COMPACT_RATIO of the index.
+
+        With INDEX_BYTES_PER_VECTOR set the index holds SQ/PQ codes and
+        `vectors` (a VectorFile) the float16 originals used to re-rank.
+
+        Locking: searches share rw_lock for reading; add/swap take it for writing
+        only for the in-memory update. Mutators (ingest, compaction, save) are
+        serialized by _mutate_lock so compaction can work on a clone while
+        queries continue on the current index. """
+    def __init__(self, index, embedding, db_dir=None, vectors: VectorFile = None):
+        self.index = index
+        self.embedding_function = embedding
+        self.db_dir = db_dir
+        self.vectors = vectors
+        self.rw_lock = ReadWriteLock()
+        self._mutate_lock = threading.RLock()
+        self._tomb_lock = threading.Lock()
+        self.tombstones = set(get_tombstones())
+        self._params = None # cached SearchParameters excluding tombstones
+        self._filters = OrderedDict() # SearchFilter -> its ids present in the index (LRU)
+        self._filter_params = {} # SearchFilter -> (SearchParameters or None, allowed ids, ...)
+        self._generation = 0 # bumped by every add; resolved filters from older generations are stale
+        self._compacting = False
+        self._pending = [] # (ids, vectors) waiting for the quantizer to be trained
+        self._pq = _is_pq(index)
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    def ids(self) -> np.ndarray:
+        with self.rw_lock.read():
+            return faiss.vector_to_array(self.index.id_map).copy()
+
+    # ========== Search ==========
+    def _reset_params(self):
+        """Drop everything derived from the tombstones. Caller holds _tomb_lock."""
+        self._params = None
+        self._filter_params.clear()
+
+    def _filter_entry(self, search_filter):
+        """ (SearchParameters or None, allowed ids, ...) for a SearchFilter: its
+            ids resolved in SQLite, cached until the next add, minus tombstones. """
+        with self._tomb_lock:
+            entry = self._filter_params.get(search_filter)
+            if entry is not None:
+                return entry
+            ids = self._filters.get(search_filter)
+            generation = self._generation
+            if ids is not None:
+                self._filters.move_to_end(search_filter)
+        if ids is None:
+            with timed("query", "resolve_filter"):
+                ids = np.intersect1d(np.asarray(search_filter.text_ids(), dtype="int64"), self.ids())
+        with self._tomb_lock:
+            if generation == self._generation:
+                self._filters[search_filter] = ids
+                while len(self._filters) > FILTER_CACHE_SIZE:
+                    self._filters.popitem(last=False)
+            allowed = np.setdiff1d(ids, np.fromiter(self.tombstones, dtype="int64")) if self.tombstones else ids
+            if len(allowed) > FILTER_EXACT_MAX and not self._pq:
+                batch = faiss.IDSelectorBatch(allowed)
+                entry = (faiss.SearchParameters(sel=batch), allowed, batch)
+            else: # searched exactly, or post-filtered with IndexPQ (no selector support)
+                entry = (None, allowed)
+            if generation == self._generation:
+                self._filter_params[search_filter] = entry
+            return entry
+
+    def _search_exact(self, query, ids, k: int) -> list[tuple[int, float]]:
+        """Brute force over a few ids: the sub-index of a selective filter."""
+        if not len(ids):
+            return []
+        if self.vectors is not None:
+            candidates = self.vectors.read(ids)
+        else:
+            with self.rw_lock.read():
+                candidates = self.index.reconstruct_batch(ids)
+        distances = ((candidates - query) ** 2).sum(axis=1)
+        order = np.argsort(distances, kind="stable")[:k]
+        return [(int(ids[i]), float(distances[i])) for i in order]
+
+    def _search_params(self):
+        """ (SearchParameters or None, tombstone ids, ...) or None without tombstones. """
+        with self._tomb_lock:
+            if not self.tombstones:
+                return None
+            if self._params is None:
+                tombs = np.fromiter(self.tombstones, dtype="int64")
+                if self._pq:
+                    # IndexPQ takes no IDSelector: search() drops these ids itself.
+                    self._params = (None, tombs)
+                else:
+                    batch = faiss.IDSelectorBatch(tombs)
+                    selector = faiss.IDSelectorNot(batch)
+                    # Keep the python wrappers alive as long as FAISS holds the raw pointers.
+                    self._params = (faiss.SearchParameters(sel=selector), tombs, selector, batch)
+            return self._params
+
+    def search(self, vector, k: int, rerank: bool = True, search_filter=None) -> list[tuple[int, float]]:
+        """ Nearest k vector ids with distances. search_filter (a SearchFilter)
+            restricts the search to the chunks of matching documents. """
+        query = np.asarray([vector], dtype="float32")
+        params = self._search_params() # held for the whole search, see _search_params
+        allowed = None
+        if search_filter:
+            entry = self._filter_entry(search_filter)
+            if len(entry[1]) <= FILTER_EXACT_MAX:
+                return self._search_exact(query[0], entry[1], k)
+            if entry[0] is not None:
+                params = entry # the selector leaves out tombstones as well
+            else:
+                allowed = entry[1]
+        vectors = self.vectors if rerank else None
+        fetch = k * RERANK_FACTOR if vectors is not None else k
+        post_filter = params is not None and params[0] is None
+        if post_filter:
+            fetch += len(params[1])
+        if allowed is not None: # over-fetch by the filter's selectivity
+            fetch = fetch * self.index.ntotal // len(allowed) + 1
+        with self.rw_lock.read():
+            fetch = min(fetch, self.index.ntotal)
+            if fetch <= 0:
+                return []
+            distances, ids = self.index.search(query, fetch, params=params[0] if params else None)
+        ids, distances = ids[0], distances[0]
+        keep = ids != -1
+        if post_filter:
+            keep &= ~np.isin(ids, params[1])
+        if allowed is not None:
+            keep &= np.isin(ids, allowed)
+        ids, distances = ids[keep], distances[keep]
+        if vectors is not None and len(ids):
+            # Exact distances from the float16 originals put the best k first.
+            exact = ((vectors.read(ids) - query[0]) ** 2).sum(axis=1)
+            order = np.argsort(exact, kind="stable")[:k]
+            return [(int(ids[i]), float(exact[i])) for i in order]
+        return [(int(i), float(d)) for i, d in zip(ids[:k], distances[:k])]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, search_filter=None) -> list[tuple[Document, float]]:
+        with timed("query", "embed_query"):
+            vector = self.embedding_function.embed_query(query) # outside any lock
+        with timed("query", "faiss_search"):
+            hits = self.search(vector, k, search_filter=search_filter)
+        with timed("query", "fetch_chunks"):
+            found = get_texts_by_ids([i for i, _ in hits])
+        stale = [i for i, _ in hits if i not in found]
+        if stale:
+            # Rows deleted by another process (e.g. admin.py): hide them from now on
+            # and search again so the caller still gets k results.
+            self.mark_removed(stale, persist=True)
+            hits = self.search(vector, k, search_filter=search_filter)
+            found = get_texts_by_ids([i for i, _ in hits])
+        return [(found[i], score) for i, score in hits if i in found]
+
+    def similarity_search(self, query: str, k: int = 4, search_filter=None) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, search_filter)]
+
+    def as_retriever(self, k: int = 4):
+        return ChunkRetriever(vectorstore=self, k=k)
+
+    # ========== Updates ==========
+    def add(self, ids, vectors):
+        ids = np.asarray(ids, dtype="int64")
+        vectors = np.asarray(vectors, dtype="float32")
+        with self._mutate_lock:
+            if not self.index.is_trained:
+                # SQ/PQ learn their codebooks from the first TRAIN_SAMPLES vectors.
+                self._pending.append((ids, vectors))
+                if sum(len(i) for i, _ in self._pending) >= TRAIN_SAMPLES:
+                    self.flush()
+                return ids.tolist()
+            return self._add(ids, vectors)
+
+    def flush(self):
+        """Train the quantizer on the buffered vectors and add them."""
+        with self._mutate_lock:
+            if not self._pending:
+                return
+            ids = np.concatenate([i for i, _ in self._pending])
+            vectors = np.concatenate([v for _, v in self._pending])
+            self._pending = []
+            trained = _train(self.index, vectors)
+            with self.rw_lock.write():
+                self.index = trained
+                self._pq = _is_pq(trained)
+            with self._tomb_lock:
+                self._reset_params()
+            self._add(ids, vectors)
+
+    def _add(self, ids, vectors):
+        with self._mutate_lock:
+            present = np.isin(ids, faiss.vector_to_array(self.index.id_map))
+            with self._tomb_lock:
+                revived = [int(i) for i in ids if int(i) in self.tombstones]
+            # A tombstoned id coming back (rowid reuse in pre-AUTOINCREMENT dbs):
+            # drop the stale vector before adding the new one.
+            reused = [int(i) for i in ids[present] if int(i) in revived]
+            keep = ~present | np.isin(ids, reused)
+            if self.vectors is not None:
+                self.vectors.write(ids[keep], vectors[keep])
+            with self.rw_lock.write():
+                if reused:
+                    self.index.remove_ids(faiss.IDSelectorBatch(np.asarray(reused, dtype="int64")))
+                self.index.add_with_ids(vectors[keep], ids[keep])
+            with self._tomb_lock:
+                if revived:
+                    self.tombstones.difference_update(revived)
+                    self._reset_params()
+                    clear_tombstones(revived)
+                self._filters.clear() # new ids may match
+                self._filter_params.clear()
+                self._generation += 1
+        return ids[keep].tolist()
+
+    def add_documents(self, docs: list[Document], batch_size: int = EMBED_BATCH_SIZE) -> list[int]:
+        """ Embed docs (metadata must carry text_id) outside any lock, then add them.
+            Texts that already have a live vector are not embedded again.
+            Queries only wait for the in-memory add. """
+        unique = {}
+        for doc in docs:
+            if doc.metadata.get("text_id") is not None:
+                unique.setdefault(doc.metadata["text_id"], doc)
+        ids = np.fromiter(unique, dtype="int64", count=len(unique))
+        index_ids = self.ids()
+        with self._tomb_lock:
+            live = np.setdiff1d(index_ids, np.fromiter(self.tombstones, dtype="int64"))
+        new = ids[~np.isin(ids, live)]
+        count("chunks_deduplicated", len(docs) - len(new), pipeline="ingest")
+        docs = [unique[i] for i in new.tolist()]
+        progress = Progress(logger, "[FAISS] Embedded chunks", total=len(docs)) if len(docs) > batch_size else None
+        added = []
+        for start in range(0, len(docs), batch_size):
+            batch = docs[start:start + batch_size]
+            with timed("ingest", "embed"):
+                vectors = self.embedding_function.embed_documents([d.page_content for d in batch])
+            with timed("ingest", "index_add"):
+                added += self.add([d.metadata["text_id"] for d in batch], vectors)
+            if progress:
+                progress.update(len(batch))
+        self.flush()
+        if progress:
+            progress.close()
+        return added
+
+    def mark_removed(self, ids, persist=False):
+        """ Tombstone vector ids. delete_document() already persists tombstones in
+            SQLite; persist=True is for ids discovered stale at query time. """
+        ids = [int(i) for i in ids]
+        if not ids:
+            return
+        if persist:
+            add_tombstones(ids)
+        with self._tomb_lock:
+            self.tombstones.update(ids)
+            self._reset_params()
+        self.maybe_compact()
+
+    # ========== Compaction ==========
+    def needs_compaction(self) -> bool:
+        with self._tomb_lock:
+            count = len(self.tombstones)
+        if self._pq: # every search over-fetches by the tombstone count
+            return count >= TOMBSTONE_COMPACT_MIN
+        return count >= max(TOMBSTONE_COMPACT_MIN, TOMBSTONE_COMPACT_RATIO * max(self.ntotal, 1))
+
+    def maybe_compact(self):
+        if self._compacting or not self.needs_compaction():
+            return
+        self._compacting = True
+        threading.Thread(target=self.compact, name="faiss-compact", daemon=True).start()
+
+    def compact(self):
+        """ Physically remove tombstoned vectors: clone, shrink the clone while
+            queries keep using the current index, swap, save, then clear the
+            tombstones that were applied. Briefly needs twice the index memory. """
+        try:
+            with self._mutate_lock:
+                with self._tomb_lock:
+                    applied = np.fromiter(self.tombstones, dtype="int64")
+                if not len(applied):
+                    return
+                start = time()
+                with self.rw_lock.read():
+                    clone = faiss.clone_index(self.index)
+                removed = clone.remove_ids(faiss.IDSelectorBatch(applied))
+                with self.rw_lock.write():
+                    self.index = clone
+                with self._tomb_lock:
+                    self.tombstones.difference_update(applied.tolist())
+                    self._reset_params()
+                if self.db_dir:
+                    self.save(self.db_dir)
+                clear_tombstones(applied.tolist())
+                logger.info("[FAISS] Compacted index: removed %d vectors, %d remain (%.2fs)",
+                            removed, self.ntotal, time() - start)
+        finally:
+            self._compacting = False
+
+    # ========== Persistence ==========
+    def save(self, db_dir=None):
+        db_dir = db_dir or self.db_dir
+        path = os.path.join(db_dir, INDEX_FILE)
+        with self._mutate_lock:
+            self.flush()
+            if self.vectors is not None:
+                self.vectors.flush() # before the index that refers to them
+            faiss.write_index(self.index, path + ".tmp")
+            os.replace(path + ".tmp", path)
+
+    def reconcile(self, batch_size: int = EMBED_BATCH_SIZE):
+        """ Bring the index in line with SQLite after a crash or an external edit:
+            embed texts that have no vector, tombstone vectors without a text (this
+            includes the duplicates' vectors after the chunk_texts migration). """
+        index_ids = self.ids()
+        text_ids = np.asarray(get_all_text_ids(), dtype="int64")
+        missing = np.setdiff1d(text_ids, index_ids)
+        with self._tomb_lock:
+            known = np.fromiter(self.tombstones, dtype="int64")
+        stray = np.setdiff1d(np.setdiff1d(index_ids, text_ids), known)
+        if len(stray):
+            logger.warning("[FAISS] %d vectors have no chunk text; tombstoning", len(stray))
+            self.mark_removed(stray.tolist(), persist=True)
+        if len(missing):
+            logger.warning("[FAISS] %d chunk texts have no vector; embedding", len(missing))
+            for start in range(0, len(missing), batch_size):
+                docs = get_texts_by_ids(missing[start:start + batch_size].tolist())
+                self.add_documents(list(docs.values()), batch_size)
+            if self.db_dir:
+                self.save(self.db_dir)
+
+class ChunkRetriever(BaseRetriever):
+    vectorstore: Any
+    k: int = 4
+    search_filter: Any = None # context.filters.SearchFilter
+
+    def with_filter(self, search_filter) -> "ChunkRetriever":
+        return self.model_copy(update={"search_filter": search_filter})
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> list[Document]:
+        return self.vectorstore.similarity_search(query, k=self.k, search_filter=self.search_filter)
+
+def _new_index(dim: int, bytes_per_vector: int = 0):
+    """ IndexIDMap2 over exact float32 vectors, or over SQ8/SQ4/PQ codes that
+        fit bytes_per_vector (see INDEX_BYTES_PER_VECTOR). """
+    if not bytes_per_vector or bytes_per_vector >= dim * 4:
+        return faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+    if bytes_per_vector >= dim:
+        return faiss.IndexIDMap2(faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit))
+    if bytes_per_vector * 2 >= dim:
+        return faiss.IndexIDMap2(faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_4bit))
+    m = max(m for m in range(1, bytes_per_vector + 1) if dim % m == 0) # PQ sub-vectors must divide dim
+    return faiss.IndexIDMap2(faiss.IndexPQ(dim, m, 8))
+
+def _inner(index):
+    return faiss.downcast_index(index.index)
+
+def _is_pq(index) -> bool:
+    return isinstance(_inner(index), faiss.IndexPQ)
+
+def _is_compressed(index) -> bool:
+    return not isinstance(_inner(index), faiss.IndexFlat)
+
+def describe_index(index) -> str:
+    inner = _inner(index)
+    if isinstance(inner, faiss.IndexPQ):
+        return f"PQ{inner.pq.M}"
+    if isinstance(inner, faiss.IndexScalarQuantizer):
+        return {faiss.ScalarQuantizer.QT_8bit: "SQ8", faiss.ScalarQuantizer.QT_4bit: "SQ4"}.get(inner.sq.qtype, "SQ")
+    return "Flat"
+
+def _train(index, sample):
+    """Train a quantized index, falling back to SQ8 when there is too little data for PQ."""
+    if _is_pq(index) and len(sample) < PQ_MIN_TRAIN:
+        logger.warning("[FAISS] %d vectors are too few to train %s; using SQ8 until there are %d",
+                       len(sample), describe_index(index), PQ_MIN_TRAIN)
+        index = faiss.IndexIDMap2(faiss.IndexScalarQuantizer(index.d, faiss.ScalarQuantizer.QT_8bit))
+    if len(sample) > TRAIN_SAMPLES:
+        sample = sample[np.random.default_rng(0).choice(len(sample), TRAIN_SAMPLES, replace=False)]
+    index.train(np.ascontiguousarray(sample, dtype="float32"))
+    return index
+
+def _open_vectors(db_dir, index, fresh=False) -> VectorFile | None:
+    """The float16 vector file of a compressed index; an exact index has none."""
+    path = os.path.join(db_dir, VECTORS_FILE)
+    if fresh or not _is_compressed(index):
+        if os.path.exists(path):
+            os.remove(path) # stale: would re-rank with old vectors
+    if not _is_compressed(index):
+        return None
+    if not fresh and not os.path.exists(path):
+        logger.warning("[FAISS] %s index without %s: searching without re-ranking", describe_index(index), path)
+        return None
+    return VectorFile(path, index.d)
+
+def _requantize(index, db_dir):
+    """ Convert an index to the INDEX_BYTES_PER_VECTOR layout without re-embedding:
+        vectors come from the exact index or from vectors.f16. """
+    wanted = _new_index(index.d, INDEX_BYTES_PER_VECTOR)
+    if _is_pq(wanted) and describe_index(index) == "SQ8" and index.ntotal < PQ_MIN_TRAIN:
+        return index # the _train() fallback; still too few vectors for PQ
+    path = os.path.join(db_dir, VECTORS_FILE)
+    ids = faiss.vector_to_array(index.id_map)
+    if not _is_compressed(index):
+        vectors = _inner(index).reconstruct_n(0, index.ntotal) if index.ntotal else np.empty((0, index.d), "float32")
+    elif os.path.exists(path):
+        vectors = VectorFile(path, index.d).read(ids)
+    else:
+        logger.error("[FAISS] Cannot convert %s to %s without %s; run with --rebuild-index",
+                     describe_index(index), describe_index(wanted), path)
+        return index
+    logger.info("[FAISS] Converting %s index to %s (%d vectors)...", describe_index(index), describe_index(wanted), len(ids))
+    start = time()
+    if _is_compressed(wanted) and len(ids):
+        wanted = _train(wanted, vectors)
+    if len(ids):
+        wanted.add_with_ids(vectors, ids)
+    store_vectors = _open_vectors(db_dir, wanted, fresh=True)
+    if store_vectors is not None:
+        store_vectors.write(ids, vectors)
+        store_vectors.flush()
+    faiss.write_index(wanted, os.path.join(db_dir, INDEX_FILE) + ".tmp")
+    os.replace(os.path.join(db_dir, INDEX_FILE) + ".tmp", os.path.join(db_dir, INDEX_FILE))
+    logger.info("[FAISS] Converted in %.2fs", time() - start)
+    return wanted
+
+# ========== Recall Report ==========
+def index_report(store: ChunkIndex, n_queries: int = 100, k: int = 10) -> dict:
+    """ Memory and recall@k of the compressed index against exact search over
+        the float16 originals. Queries are stored vectors (their own hit is
+        ignored), so no text or embedding model is needed. """
+    index = store.index
+    inner = _inner(index)
+    report = {
+        "mode": describe_index(index),
+        "vectors": index.ntotal,
+        "bytes_per_vector": inner.code_size,
+        "index_mb": round(inner.code_size * index.ntotal / 2**20, 2),
+        "float32_mb": round(index.d * 4 * index.ntotal / 2**20, 2),
+    }
+    report["compression"] = round(index.d * 4 / inner.code_size, 1)
+    if store.vectors is None or not index.ntotal:
+        return report
+
+    ids = store.ids()
+    with store._tomb_lock:
+        ids = np.setdiff1d(ids, np.fromiter(store.tombstones, dtype="int64"))
+    rng = np.random.default_rng(0)
+    sample = ids[rng.choice(len(ids), min(n_queries, len(ids)), replace=False)]
+    queries = store.vectors.read(sample)
+
+    # Exact top k+1 by brute force, in blocks so memory stays bounded.
+    best_d = np.full((len(sample), k + 1), np.inf, dtype="float32")
+    best_i = np.full((len(sample), k + 1), -1, dtype="int64")
+    for start in range(0, len(ids), 65536):
+        block_ids = ids[start:start + 65536]
+        block = store.vectors.read(block_ids)
+        d = (queries ** 2).sum(1)[:, None] - 2 * queries @ block.T + (block ** 2).sum(1)[None, :]
+        all_d = np.concatenate([best_d, d], axis=1)
+        all_i = np.concatenate([best_i, np.broadcast_to(block_ids, d.shape)], axis=1)
+        top = np.argsort(all_d, axis=1, kind="stable")[:, :k + 1]
+        best_d = np.take_along_axis(all_d, top, axis=1)
+        best_i = np.take_along_axis(all_i, top, axis=1)
+
+    def recall(rerank: bool) -> float:
+        total = 0.0
+        for query, own, exact in zip(queries, sample, best_i):
+            truth = [i for i in exact if i != own][:k]
+            found = [i for i, _ in store.search(query, k + 1, rerank=rerank) if i != own][:k]
+            total += len(set(truth) & set(found)) / max(len(truth), 1)
+        return round(total / len(sample), 4)
+
+    report[f"recall_at_{k}_quantized"] = recall(False)
+    report[f"recall_at_{k}_reranked"] = recall(True)
+    report["queries"] = len(sample)
+    return report
+
+def print_index_report(store: ChunkIndex, n_queries: int = 100, k: int = 10):
+    report = index_report(store, n_queries, k)
+    width = max(len(key) for key in report)
+    print("\n".join(f"{key:<{width}}  {value}" for key, value in report.items()))
 
 # Create a FAISS vector store from document chunks and save it locally.
-def create_vector_store(db_dir, chunks, embedding):    
-    if not chunks:      
+def create_vector_store(db_dir, chunks, embedding):
+    if not chunks:
         raise ValueError("No document chunks provided for vector store creation.")
-                
-    print("Creating vector store with FAISS...")
+
+    logger.info("[FAISS] Creating vector store...")
     start = time()
-    try: 
-        vectorstore = FAISS.from_documents(documents=chunks, embedding=embedding)
-        vectorstore.save_local(db_dir)
+    try:
+        dim = len(embedding.embed_query("dimension probe"))
+        index = _new_index(dim, INDEX_BYTES_PER_VECTOR)
+        store = ChunkIndex(index, embedding, db_dir, _open_vectors(db_dir, index, fresh=True))
+        store.add_documents(chunks)
+        store.save(db_dir)
+        clear_tombstones(store.tombstones) # fresh index holds no deleted vectors
+        store.tombstones.clear()
+        store._reset_params()
         elapsed = time() - start
-        print(f"[FAISS] Vector store saved to {db_dir} in {elapsed:.2f} seconds.")
-        return vectorstore.as_retriever()
+        logger.info("[FAISS] %s vector store saved to %s in %.2f seconds.", describe_index(store.index), db_dir, elapsed)
+        return store.as_retriever()
     except Exception as e:
-        print(f"[ERROR] Failed to create FAISS vector store: {e}")
+        logger.error("[FAISS] Failed to create vector store: %s", e)
         raise
 
+def _upgrade_legacy_index(index, db_dir):
+    """ Convert a LangChain FAISS index (positional ids + index.pkl docstore) to
+        an IndexIDMap2 keyed by chunk_texts.id, reusing the stored vectors. """
+    pkl_path = os.path.join(db_dir, "index.pkl")
+    logger.info("[FAISS] Upgrading positional index in %s to chunk-id index...", db_dir)
+    with open(pkl_path, "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    key_to_id = get_text_id_map()
+    positions, ids, seen = [], [], set()
+    for pos, docstore_id in index_to_docstore_id.items():
+        doc = docstore.search(docstore_id)
+        md = getattr(doc, "metadata", {}) or {}
+        text_id = key_to_id.get((md.get("doc_id"), md.get("chunk_index")))
+        if text_id is not None and text_id not in seen: # one vector per text
+            seen.add(text_id)
+            positions.append(pos)
+            ids.append(text_id)
+    upgraded = _new_index(index.d)
+    if positions:
+        vectors = index.reconstruct_n(0, index.ntotal)
+        upgraded.add_with_ids(vectors[positions], np.asarray(ids, dtype="int64"))
+    os.replace(pkl_path, pkl_path + ".legacy")
+    logger.info("[FAISS] Kept %d/%d vectors; the rest will be re-embedded", len(ids), index.ntotal)
+    return upgraded
+
 # Load an existing FAISS vector store from local disk.
 def load_vector_store(db_dir, embedding):
-    print(f"[FAISS] Loading vector store from {db_dir}...")
+    logger.info("[FAISS] Loading vector store from %s...", db_dir)
     try:
-        return FAISS.load_local(
-            db_dir,
-            embeddings=embedding,
-            allow_dangerous_deserialization=True
-        ).as_retriever()
+        index = faiss.read_index(os.path.join(db_dir, INDEX_FILE))
+        if not isinstance(index, faiss.IndexIDMap2):
+            index = _upgrade_legacy_index(index, db_dir)
+        if describe_index(index) != describe_index(_new_index(index.d, INDEX_BYTES_PER_VECTOR)):
+            index = _requantize(index, db_dir)
+        store = ChunkIndex(index, embedding, db_dir, _open_vectors(db_dir, index))
+        store.reconcile()
+        return store.as_retriever()
     except Exception as e:
-        print(f"[ERROR] Failed to load FAISS index: {e}")
-        raise
\ No newline at end of file
+        logger.error("[FAISS] Failed to load index: %s", e)
+        raise
@@ -0,0 +1,176 @@
+"""
+    Content-addressed store of extracted text. Loaders (pypdf, ebook-convert,
+    djvutxt, extract_chmLib...) are the slowest part of ingestion, so their
+    output is kept compressed, keyed by file hash and LOADER_VERSION, together
+    with page boundaries. Re-chunking (--rechunk) and re-ingesting unchanged
+    files read from here instead of parsing the source again.
+
+    Layout: TEXT_CACHE_DIR/<hash[:2]>/<hash>.v<LOADER_VERSION>.zst (.zz when
+    zstandard is not installed). Each blob is one JSON header line followed
+    by one JSON line per loader document (page, post, CHM page) with its text
+    and metadata, and a footer line that marks the blob complete. Blobs are written and read as streams: a feed export of any
+    size passes through with one post in memory.
+"""
+import json
+import logging
+import os
+import zlib
+from pathlib import Path
+from typing import Iterator
+
+from langchain.schema import Document
+
+from config import TEXT_CACHE, TEXT_CACHE_DIR
+from context.loaders import LOADER_VERSION
+from data.db import record_extracted_text
+
+try:
+    import zstandard # pip install zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+ZSTD_LEVEL = 10 # written once, read many times
+ZLIB_LEVEL = 6
+READ_BLOCK = 1 << 20
+
+def _blob_path(file_hash: str, suffix: str) -> Path:
+    return Path(TEXT_CACHE_DIR) / file_hash[:2] / f"{file_hash}.v{LOADER_VERSION}{suffix}"
+
+def _compressor():
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj(), ".zst"
+    return zlib.compressobj(ZLIB_LEVEL), ".zz"
+
+def _decompressed_blocks(blob: Path, suffix: str) -> Iterator[bytes]:
+    # At most READ_BLOCK decompressed bytes at a time, however well the text compressed.
+    with open(blob, "rb") as f:
+        if suffix == ".zst":
+            if zstandard is None:
+                raise RuntimeError("zstandard is not installed")
+            reader = zstandard.ZstdDecompressor().stream_reader(f)
+            while block := reader.read(READ_BLOCK):
+                yield block
+            return
+        decompressor = zlib.decompressobj()
+        while data := f.read(READ_BLOCK):
+            while data:
+                yield decompressor.decompress(data, READ_BLOCK)
+                data = decompressor.unconsumed_tail
+        yield decompressor.flush()
+
+def _read_lines(blob: Path, suffix: str) -> Iterator[bytes]:
+    # A line (one page) is joined only once complete.
+    parts = []
+    for block in _decompressed_blocks(blob, suffix):
+        *complete, rest = block.split(b"\n")
+        if complete:
+            yield b"".join(parts + complete[:1])
+            yield from complete[1:]
+            parts = []
+        parts.append(rest)
+    tail = b"".join(parts)
+    if tail:
+        yield tail
+
+def _read_pages(blob: Path, lines: Iterator[bytes]) -> Iterator[Document]:
+    try:
+        for line in lines:
+            page = json.loads(line)
+            if "text" not in page: # the footer: the blob is complete
+                return
+            yield Document(page_content=page["text"], metadata=page.get("metadata") or {})
+        raise ValueError("truncated")
+    except Exception as e: # corrupt blob: drop it, the next run parses the source again
+        logger.warning("[TextCache] Removing unreadable %s: %s", blob, e)
+        blob.unlink(missing_ok=True)
+        raise
+
+def get_pages(file_hash: str) -> Iterator[Document] | None:
+    """ The cached loader documents of a file, read as a stream, or None when
+        the current loaders have not cached this content. """
+    if not TEXT_CACHE or not file_hash:
+        return None
+    for suffix in (".zst", ".zz"):
+        blob = _blob_path(file_hash, suffix)
+        lines = _read_lines(blob, suffix)
+        try:
+            json.loads(next(lines)) # header
+        except (FileNotFoundError, StopIteration):
+            continue
+        except Exception as e: # corrupt or unreadable blob: fall back to the loader
+            logger.warning("[TextCache] Ignoring unreadable %s: %s", blob, e)
+            continue
+        return _read_pages(blob, lines)
+    return None
+
+class _BlobWriter:
+    def __init__(self, file_hash: str, path):
+        self.compressor, suffix = _compressor()
+        self.blob = _blob_path(file_hash, suffix)
+        self.blob.parent.mkdir(parents=True, exist_ok=True)
+        self.tmp = self.blob.with_name(self.blob.name + ".tmp")
+        self.f = open(self.tmp, "wb")
+        self.write({"path": str(path) if path else None, "loader_version": LOADER_VERSION})
+
+    def write(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False, default=str).encode("utf-8") + b"\n"
+        self.f.write(self.compressor.compress(line))
+
+    def commit(self, pages: int):
+        self.write({"pages": pages})
+        self.f.write(self.compressor.flush())
+        self.f.close()
+        os.replace(self.tmp, self.blob)
+
+    def discard(self):
+        self.f.close()
+        self.tmp.unlink(missing_ok=True)
+
+def cache_pages(file_hash: str, pages: Iterator[Document], path=None) -> Iterator[Document]:
+    """ Pass a file's loader documents through while storing them. The blob is
+        only put in place after the last one, so a loader that fails or a
+        caller that stops early leaves nothing behind. The file is recorded in
+        metadata.db (extracted_text), so --rechunk also finds files whose
+        chunks were all rejected. tags (from the loader) end up in
+        documents.tags for filtered search, so the row is recorded even when
+        the blob is not (TEXT_CACHE=0, disk full). """
+    writer = None
+    if TEXT_CACHE and file_hash:
+        try:
+            writer = _BlobWriter(file_hash, path)
+        except OSError as e: # a full disk must not fail ingestion
+            logger.warning("[TextCache] Could not write %s: %s", _blob_path(file_hash, ""), e)
+    page_offsets, chars, tags, count, complete = [], 0, set(), 0, False
+    try:
+        for page in pages:
+            metadata = page.metadata or {}
+            page_offsets += [chars + o for o in metadata.get("page_offsets") or [0]]
+            chars += len(page.page_content) + 2
+            tags.update(metadata.get("tags") or ())
+            count += 1
+            if writer:
+                try:
+                    writer.write({"text": page.page_content, "metadata": metadata})
+                except OSError as e:
+                    logger.warning("[TextCache] Could not write %s: %s", writer.blob, e)
+                    writer.discard()
+                    writer = None
+            yield page
+        complete = True
+    finally:
+        if writer and not complete:
+            writer.discard()
+    if not count: # nothing extracted: nothing to cache
+        if writer:
+            writer.discard()
+        return
+    if file_hash and path is not None:
+        record_extracted_text(file_hash, str(path), LOADER_VERSION, chars - 2, page_offsets, tags)
+    if writer:
+        try:
+            writer.commit(count)
+        except OSError as e:
+            logger.warning("[TextCache] Could not write %s: %s", writer.blob, e)
+            writer.discard()
@@ -3,5 +3,9 @@ from .db import (
     get_existing_hashes,
     insert_document,
     insert_chunks,
+    get_document_by_path,
+    get_document_by_hash,
+    set_document_path,
+    delete_document,
     fetch_metadata_by_content
 )
\ No newline at end of file
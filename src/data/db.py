@@ -1,3 +1,6 @@
+import hashlib
+import json
+import logging
 import os
 from pathlib import Path
 import shutil
@@ -6,9 +9,23 @@ import sys
 from datetime import datetime
 from langchain.schema import Document
 
+logger = logging.getLogger(__name__)
+
+SQL_BATCH = 500 # ids per IN (...) query, under SQLite's host parameter limit
+
+_read_only_path = None # set by use_read_only(): serving from a snapshot
+
 def db_path():
+    if _read_only_path is not None:
+        return _read_only_path
     return Path("db") / os.getenv("TOPIC", "default") / "metadata.db"
 
+def use_read_only(path):
+    """ Serve every query from the SQLite database at the start of a topic
+        snapshot, opened immutable: no locks, no journal, nothing written. """
+    global _read_only_path
+    _read_only_path = Path(path)
+
 def is_metadata_db_empty() -> bool:
     """Check if metadata.db exists and contains chunks."""
     if not db_path().exists():
@@ -24,18 +41,20 @@ def is_metadata_db_empty() -> bool:
 def backup_old_db():
     """Back up the existing metadata.db before overwriting."""
     if not db_path().exists():
-        print("[Warn] backup_old_db() called, but metadata.db does not exist.")
+        logger.warning("backup_old_db() called, but metadata.db does not exist.")
         return
     try:
         timestamp = datetime.now().strftime("%Y-%m-%d_%H%M%S")
         backup_path = db_path().with_name(f"metadata_{timestamp}.db")
         shutil.move(db_path(), backup_path)
-        print(f"[Backup] Old DB moved to: {backup_path}")
+        logger.info("[Backup] Old DB moved to: %s", backup_path)
     except Exception as e:
-        print(f"[Error] Failed to back up old DB: {e}")
+        logger.error("Failed to back up old DB: %s", e)
 
 def init_db(rebuild=False) -> sqlite3.Connection:
     """Initialize the SQLite database and schema."""
+    if _read_only_path is not None:
+        return connect() # a snapshot has its schema already
     db_path().parent.mkdir(parents=True, exist_ok=True) # create db directory
 
     db_already_exists = db_path().exists()
@@ -45,24 +64,34 @@ def init_db(rebuild=False) -> sqlite3.Connection:
             try:
                 backup_old_db()
                 db_path().unlink() # Might raise FileNotFoundError if backup moved it
-                print("[Info] Deleted existing metadata.db")
+                logger.info("Deleted existing metadata.db")
             except FileNotFoundError:
-                print("[Warn] Tried to delete metadata.db, but it was already missing.")
+                logger.warning("Tried to delete metadata.db, but it was already missing.")
             except Exception as e:
-                print(f"[Error] Unexpected error while deleting DB: {e}")
+                logger.error("Unexpected error while deleting DB: %s", e)
                 sys.exit(1) # File is now gone
         else:
-            print("[Info] No existing DB found — skipping backup and deletion.")
+            logger.info("No existing DB found — skipping backup and deletion.")
     
     conn = sqlite3.connect(db_path())
     if db_already_exists:
-        print(f"Loaded existing metadata: {db_path().name}")
+        logger.debug("Loaded existing metadata: %s", db_path().name)
     else:
-        print(f"[Info] Creating new metadata.db")
-    cur = conn.cursor()
-    cur.execute("PRAGMA foreign_keys = ON;")  # ENABLE enforcement
+        logger.info("Creating new metadata.db")
+    conn.execute("PRAGMA foreign_keys = ON;")  # ENABLE enforcement
     # ON DELETE CASCADE - critical for cleanup
     # Deleting a document will automatically delete all chunks tied to garbage - clean and safe.
+    migrate(conn)
+    return conn
+
+# ========== Schema Migrations ==========
+# PRAGMA user_version counts the migrations applied to a database. Append new
+# steps at the end; never edit or reorder released ones. An up-to-date
+# database costs init_db() a single PRAGMA read.
+def _create_base_schema(conn: sqlite3.Connection):
+    # Everything before versioned migrations. Idempotent, so unversioned
+    # databases of any age are brought up to date by running it.
+    cur = conn.cursor()
 
     cur.execute('''
         CREATE TABLE IF NOT EXISTS documents (
@@ -81,9 +110,22 @@ def init_db(rebuild=False) -> sqlite3.Connection:
         )
     ''')
 
+    # One row per unique chunk text (hash of the whitespace-normalized content).
+    # AUTOINCREMENT: text ids are FAISS vector ids and must never be reused.
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS chunk_texts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            hash TEXT UNIQUE,
+            content TEXT
+        )
+    ''')
+
+    # Where each text occurs: a chunk row is (document, position) -> text.
+    # content is only filled in databases created before chunk_texts existed
+    # and is moved out by _migrate_chunk_texts().
     cur.execute('''
         CREATE TABLE IF NOT EXISTS chunks (
-            id INTEGER PRIMARY KEY,
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
             document_id INTEGER,
             chunk_index INTEGER,
             content TEXT,
@@ -91,11 +133,228 @@ def init_db(rebuild=False) -> sqlite3.Connection:
             char_start INTEGER,
             char_end INTEGER,
             section TEXT,
+            text_id INTEGER REFERENCES chunk_texts(id),
             FOREIGN KEY(document_id) REFERENCES documents(id) ON DELETE CASCADE
         )
     ''')
+    if "text_id" not in {row[1] for row in cur.execute("PRAGMA table_info(chunks)")}:
+        cur.execute("ALTER TABLE chunks ADD COLUMN text_id INTEGER REFERENCES chunk_texts(id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_chunks_text_id ON chunks(text_id)")
+    _migrate_chunk_texts(conn)
 
-    conn.commit()
+    # Vector ids of deleted chunks still present in the FAISS index on disk.
+    # Filtered out at query time and cleared by index compaction.
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS tombstones (
+            vector_id INTEGER PRIMARY KEY
+        )
+    ''')
+
+    # Files whose extracted text is in the text cache (context.textcache),
+    # including files whose chunks were all rejected. Drives --rechunk.
+    # tags: ",tag1,tag2," from the loader (blog exports), copied to documents.tags.
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS extracted_text (
+            hash TEXT PRIMARY KEY,
+            path TEXT,
+            loader_version INTEGER,
+            chars INTEGER,
+            page_offsets TEXT,
+            timestamp TEXT,
+            tags TEXT
+        )
+    ''')
+    if "tags" not in {row[1] for row in cur.execute("PRAGMA table_info(extracted_text)")}:
+        cur.execute("ALTER TABLE extracted_text ADD COLUMN tags TEXT")
+
+    # MinHash signature of every extracted text (context.neardup). duplicate_of
+    # is the file hash of the copy that was kept. Only kept copies have rows in
+    # lsh_buckets, where one row per LSH band makes candidate lookup an index seek.
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS doc_fingerprints (
+            hash TEXT PRIMARY KEY,
+            path TEXT,
+            minhash BLOB,
+            quality REAL,
+            chars INTEGER,
+            duplicate_of TEXT,
+            similarity REAL,
+            timestamp TEXT
+        )
+    ''')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS lsh_buckets (
+            band INTEGER,
+            bucket INTEGER,
+            hash TEXT,
+            PRIMARY KEY (band, bucket, hash)
+        ) WITHOUT ROWID
+    ''')
+
+    # Failed external converter runs (context.converters) by input hash; files
+    # reaching CONVERTER_QUARANTINE_AFTER failures are not converted again.
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS converter_failures (
+            hash TEXT,
+            tool TEXT,
+            path TEXT,
+            failures INTEGER,
+            last_error TEXT,
+            timestamp TEXT,
+            PRIMARY KEY (hash, tool)
+        )
+    ''')
+
+    # Per-file ingestion cost, one row per file per --profile run.
+    # stages: JSON {stage: seconds}; wall_seconds covers the whole file.
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS ingest_profile (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id TEXT,
+            path TEXT,
+            status TEXT,
+            wall_seconds REAL,
+            stages TEXT,
+            bytes_read INTEGER,
+            text_chars INTEGER,
+            chunks_total INTEGER,
+            chunks_accepted INTEGER,
+            peak_rss_mb REAL,
+            timestamp TEXT
+        )
+    ''')
+
+
+def _add_browse_indexes(conn: sqlite3.Connection):
+    # Covering index for a document's chunks in order (browse pages,
+    # insert_chunks' existence check, ON DELETE CASCADE, filtered search);
+    # replaces the plain document_id index.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_document ON chunks(document_id, chunk_index, text_id, page_num)")
+    conn.execute("DROP INDEX IF EXISTS idx_chunks_document_id")
+    # Title lists per type (and type: filters), date filters with or without a type.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_type_title ON documents(source_type, title)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_timestamp ON documents(timestamp)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_type_timestamp ON documents(source_type, timestamp)")
+    conn.execute("ANALYZE") # statistics, so the planner picks between the new indexes
+
+def _add_profile_chunk_sizes(conn: sqlite3.Connection):
+    # chunk_sizes: JSON {unit, min, p50, p90, max} of the file's chunks (chars or tokens).
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(ingest_profile)")}
+    if "chunk_sizes" not in columns:
+        conn.execute("ALTER TABLE ingest_profile ADD COLUMN chunk_sizes TEXT")
+
+def _add_renormalization(conn: sqlite3.Connection):
+    # Trigram index over chunk_texts.content (external content: the index only),
+    # kept in sync by triggers, so the chunks containing a term are found
+    # without reading every text. Case-sensitive, like the normalization rules.
+    try:
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunk_texts_fts USING fts5(
+                content, content='chunk_texts', content_rowid='id', tokenize='trigram case_sensitive 1'
+            )
+        ''')
+    except sqlite3.OperationalError as e: # SQLite without FTS5 or older than 3.34
+        logger.warning("[DB] No trigram index (%s); --renormalize will scan all chunk texts", e)
+    else:
+        # One statement each: executescript() would commit the migration's transaction.
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS chunk_texts_fts_insert AFTER INSERT ON chunk_texts BEGIN
+                INSERT INTO chunk_texts_fts (rowid, content) VALUES (new.id, new.content);
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS chunk_texts_fts_delete AFTER DELETE ON chunk_texts BEGIN
+                INSERT INTO chunk_texts_fts (chunk_texts_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS chunk_texts_fts_update AFTER UPDATE OF content ON chunk_texts BEGIN
+                INSERT INTO chunk_texts_fts (chunk_texts_fts, rowid, content) VALUES ('delete', old.id, old.content);
+                INSERT INTO chunk_texts_fts (rowid, content) VALUES (new.id, new.content);
+            END
+        ''')
+        texts = conn.execute("SELECT COUNT(*) FROM chunk_texts").fetchone()[0]
+        if texts:
+            logger.info("[DB] Building the trigram index over %d chunk texts...", texts)
+        conn.execute("INSERT INTO chunk_texts_fts (chunk_texts_fts) VALUES ('rebuild')")
+
+    # The normalization map the chunk texts were last normalized with; --renormalize
+    # applies the rules added or changed since. Existing texts are assumed to
+    # match the map on disk at migration time.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS normalization_applied (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            rules TEXT,
+            timestamp TEXT
+        )
+    ''')
+    from data.jsonhandler import load_normalization_map
+    _set_applied_normalization(conn, load_normalization_map(create_if_missing=False))
+
+MIGRATIONS = [
+    (_create_base_schema, "base schema"),
+    (_add_browse_indexes, "indexes for browsing and filtering documents"),
+    (_add_profile_chunk_sizes, "chunk size distribution in ingest_profile"),
+    (_add_renormalization, "trigram index over chunk texts, applied normalization map"),
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Apply the migrations a database has not had yet, each in its own transaction. Returns the old version."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"{db_path()} has schema version {version}; this code knows up to {SCHEMA_VERSION}")
+    for number, (step, description) in enumerate(MIGRATIONS[version:], version + 1):
+        conn.execute("BEGIN IMMEDIATE") # one process migrates; the others wait, then skip
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= number:
+            conn.rollback()
+            continue
+        logger.info("[DB] Migration %d/%d: %s", number, SCHEMA_VERSION, description)
+        try:
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    return version
+
+def chunk_hash(content: str) -> str:
+    """Content address of a chunk: identical text after whitespace normalization."""
+    return hashlib.blake2b(" ".join(content.split()).encode("utf-8"), digest_size=16).hexdigest()
+
+def _migrate_chunk_texts(conn: sqlite3.Connection):
+    """ Move chunk text from chunks.content into chunk_texts. Each text keeps
+        the id of its first chunk, so the vectors already stored under that id
+        stay valid; the vectors of later duplicates become strays and are
+        tombstoned by ChunkIndex.reconcile(). """
+    rows = conn.execute(
+        "SELECT id, content FROM chunks WHERE text_id IS NULL AND content IS NOT NULL ORDER BY id").fetchall()
+    if not rows:
+        return
+    logger.info("[DB] Moving %d chunk texts to chunk_texts...", len(rows))
+    text_ids, links = {}, []
+    for chunk_id, content in rows:
+        hash_ = chunk_hash(content)
+        existing = conn.execute("SELECT id FROM chunk_texts WHERE hash = ?", (hash_,)).fetchone()
+        if existing:
+            text_ids.setdefault(hash_, existing[0])
+        elif hash_ not in text_ids:
+            conn.execute("INSERT INTO chunk_texts (id, hash, content) VALUES (?, ?, ?)", (chunk_id, hash_, content))
+            text_ids[hash_] = chunk_id
+        links.append((text_ids[hash_], chunk_id))
+    conn.executemany("UPDATE chunks SET text_id = ?, content = NULL WHERE id = ?", links)
+    # New text ids must not collide with chunk ids still present in the FAISS index.
+    max_chunk_id = conn.execute("SELECT MAX(id) FROM chunks").fetchone()[0] or 0
+    conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'chunk_texts'", (max_chunk_id,))
+    logger.info("[DB] %d chunks share %d unique texts", len(rows), len(set(text_ids.values())))
+
+def connect() -> sqlite3.Connection:
+    """Plain connection for hot read paths (no schema setup, no logging)."""
+    if _read_only_path is not None:
+        return sqlite3.connect(f"{_read_only_path.resolve().as_uri()}?immutable=1", uri=True)
+    conn = sqlite3.connect(db_path())
+    conn.execute("PRAGMA foreign_keys = ON;")
     return conn
 
 def get_existing_hashes():
@@ -104,7 +363,12 @@ def get_existing_hashes():
     cur.execute("SELECT hash FROM documents")
     return set(row[0] for row in cur.fetchall())
 
-def insert_document(path, title, hash_, source_type, embedding_model):
+def join_tags(tags) -> str | None:
+    """Tags as stored in documents.tags: lowercased, ",tag1,tag2," so LIKE '%,tag,%' matches exactly."""
+    tags = sorted({t.strip().lower().replace(",", " ") for t in tags or () if t and t.strip()})
+    return f",{','.join(tags)}," if tags else None
+
+def insert_document(path, title, hash_, source_type, embedding_model, language=None):
     conn = init_db()
     cur = conn.cursor()
 
@@ -116,27 +380,337 @@ def insert_document(path, title, hash_, source_type, embedding_model):
 
     # If not found, insert new document
     cur.execute('''
-        INSERT INTO documents (path, title, hash, timestamp, source_type, embedding_model)
-        VALUES (?, ?, ?, datetime('now'), ?, ?)
-    ''', (path, title, hash_, source_type, embedding_model))
+        INSERT INTO documents (path, title, hash, timestamp, source_type, embedding_model, language, tags)
+        VALUES (?, ?, ?, datetime('now'), ?, ?, ?, (SELECT tags FROM extracted_text WHERE hash = ?))
+    ''', (path, title, hash_, source_type, embedding_model, language, hash_))
     conn.commit()
     return cur.lastrowid
 
-def insert_chunks(doc_id, chunks: list[tuple[str, dict]]):
+# Metadata of the loader document a chunk comes from (feed post title and
+# date, CHM page title and path), kept as JSON in chunks.section and returned
+# with each source. Its page number goes to chunks.page_num.
+SECTION_KEYS = ("page_title", "page_date", "page_path")
+
+def _section(metadata: dict) -> str | None:
+    section = {key: metadata[key] for key in SECTION_KEYS if metadata.get(key)}
+    return json.dumps(section, ensure_ascii=False) if section else None
+
+def insert_chunks(doc_id, chunks: list[tuple[str, dict]]) -> list[int]:
+    """ Insert chunks for a document and return their text ids (= FAISS vector
+        ids), one per chunk. Text already stored by any document is reused. """
     conn = init_db()
     cur = conn.cursor()
 
     # Optional: Check if chunks already exist for this doc_id
     cur.execute("SELECT COUNT(*) FROM chunks WHERE document_id = ?", (doc_id,))
     if cur.fetchone()[0] > 0:
-        print(f"[Skip] Chunks already exist for doc_id {doc_id}")
-        return
-    
+        logger.info("[Skip] Chunks already exist for doc_id %s", doc_id)
+        return []
+
+    hashes = [chunk_hash(chunk_text) for chunk_text, _ in chunks]
+    cur.executemany("INSERT OR IGNORE INTO chunk_texts (hash, content) VALUES (?, ?)",
+                    [(hash_, chunk_text) for hash_, (chunk_text, _) in zip(hashes, chunks)])
+    text_ids = {}
+    unique = list(dict.fromkeys(hashes))
+    for start in range(0, len(unique), SQL_BATCH):
+        batch = unique[start:start + SQL_BATCH]
+        cur.execute(f"SELECT hash, id FROM chunk_texts WHERE hash IN ({','.join('?' * len(batch))})", batch)
+        text_ids.update(cur.fetchall())
     cur.executemany('''
-        INSERT INTO chunks (document_id, chunk_index, content)
-        VALUES (?, ?, ?)
-    ''', [(doc_id, i, chunk_text) for i, (chunk_text, _) in enumerate(chunks)])
+        INSERT INTO chunks (document_id, chunk_index, text_id, page_num, section)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(doc_id, i, text_ids[hash_], metadata.get("page"), _section(metadata))
+          for i, (hash_, (_, metadata)) in enumerate(zip(hashes, chunks))])
     conn.commit()
+    return [text_ids[hash_] for hash_ in hashes]
+
+def get_document_by_path(path):
+    """Return (id, hash) of the document stored for path, or None."""
+    conn = init_db()
+    cur = conn.cursor()
+    cur.execute("SELECT id, hash FROM documents WHERE path = ?", (str(path),))
+    return cur.fetchone()
+
+def get_document_by_hash(hash_):
+    """Return (id, path) of the document stored for this content, or None."""
+    conn = init_db()
+    cur = conn.cursor()
+    cur.execute("SELECT id, path FROM documents WHERE hash = ?", (hash_,))
+    return cur.fetchone()
+
+def set_document_path(doc_id, path):
+    """ Point a document at another file with the same content (renamed or
+        moved); its chunks and vectors stay as they are. """
+    conn = init_db()
+    conn.execute("UPDATE documents SET path = ?, title = ? WHERE id = ?", (str(path), Path(path).stem, doc_id))
+    conn.commit()
+
+def delete_document(doc_id) -> list[int]:
+    """ Delete a document and its chunks. Texts no other document uses are
+        deleted too and their vectors tombstoned; returns those text ids. """
+    conn = init_db()
+    cur = conn.cursor()
+    cur.execute("SELECT DISTINCT text_id FROM chunks WHERE document_id = ?", (doc_id,))
+    text_ids = [row[0] for row in cur.fetchall()]
+    cur.execute("DELETE FROM chunks WHERE document_id = ?", (doc_id,))
+    cur.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+    orphans = [i for i in text_ids
+               if not cur.execute("SELECT 1 FROM chunks WHERE text_id = ? LIMIT 1", (i,)).fetchone()]
+    cur.executemany("DELETE FROM chunk_texts WHERE id = ?", [(i,) for i in orphans])
+    cur.executemany("INSERT OR IGNORE INTO tombstones (vector_id) VALUES (?)", [(i,) for i in orphans])
+    conn.commit()
+    return orphans
+
+# ========== Vector Id Bookkeeping ==========
+def get_tombstones() -> list[int]:
+    with connect() as conn:
+        return [row[0] for row in conn.execute("SELECT vector_id FROM tombstones")]
+
+def add_tombstones(ids):
+    with connect() as conn:
+        conn.executemany("INSERT OR IGNORE INTO tombstones (vector_id) VALUES (?)", [(int(i),) for i in ids])
+
+def clear_tombstones(ids):
+    with connect() as conn:
+        conn.executemany("DELETE FROM tombstones WHERE vector_id = ?", [(int(i),) for i in ids])
+
+def get_all_text_ids() -> list[int]:
+    with connect() as conn:
+        return [row[0] for row in conn.execute("SELECT id FROM chunk_texts")]
+
+def get_text_id_map() -> dict[tuple[int, int], int]:
+    """(document_id, chunk_index) -> text id, used to upgrade pre-id FAISS indexes."""
+    with connect() as conn:
+        return {(d, i): t for t, d, i in conn.execute("SELECT text_id, document_id, chunk_index FROM chunks")}
+
+# ========== Re-normalization ==========
+def _set_applied_normalization(conn: sqlite3.Connection, rules: dict):
+    conn.execute("INSERT OR REPLACE INTO normalization_applied (id, rules, timestamp) VALUES (1, ?, datetime('now'))",
+                 (json.dumps(rules, ensure_ascii=False),))
+
+def set_applied_normalization(rules: dict):
+    """Record rules as the map every chunk text is now normalized with."""
+    with connect() as conn:
+        _set_applied_normalization(conn, rules)
+
+def get_applied_normalization() -> tuple[dict, str] | None:
+    """(rules, timestamp) last recorded by set_applied_normalization(), or None."""
+    with connect() as conn:
+        row = conn.execute("SELECT rules, timestamp FROM normalization_applied WHERE id = 1").fetchone()
+    return (json.loads(row[0]), row[1]) if row else None
+
+def find_text_ids_containing(term: str) -> list[int]:
+    """ Ids of the chunk texts containing term (case-sensitive). A trigram
+        index lookup for terms of 3+ characters, else a scan. """
+    with connect() as conn:
+        if len(term) >= 3:
+            try:
+                return [row[0] for row in conn.execute(
+                    "SELECT rowid FROM chunk_texts_fts WHERE chunk_texts_fts MATCH ?",
+                    ('"' + term.replace('"', '""') + '"',))]
+            except sqlite3.OperationalError: # no trigram index in this database
+                pass
+        return [row[0] for row in conn.execute("SELECT id FROM chunk_texts WHERE instr(content, ?) > 0", (term,))]
+
+def iter_chunk_texts(ids=None, batch: int = SQL_BATCH):
+    """Yield (id, content) batches of the given chunk texts, or of all of them."""
+    with connect() as conn:
+        if ids is None:
+            last = 0
+            while rows := conn.execute("SELECT id, content FROM chunk_texts WHERE id > ? ORDER BY id LIMIT ?",
+                                       (last, batch)).fetchall():
+                yield rows
+                last = rows[-1][0]
+            return
+        ids = sorted(ids)
+        for start in range(0, len(ids), batch):
+            part = ids[start:start + batch]
+            yield conn.execute(f"SELECT id, content FROM chunk_texts WHERE id IN ({','.join('?' * len(part))})",
+                               part).fetchall()
+
+def rewrite_chunk_texts(contents: dict[int, str]) -> dict[int, int]:
+    """ Give chunk texts new content (text id -> content) in one transaction.
+        Text ids are content addresses, so a changed text moves to the text
+        with the new hash (a new row unless another document has it already),
+        its chunks follow, and the old id is deleted and tombstoned. Returns
+        old id -> new id; the new rows still need their vectors. """
+    conn = init_db()
+    moved = {}
+    try:
+        for old_id, content in contents.items():
+            hash_ = chunk_hash(content)
+            row = conn.execute("SELECT id FROM chunk_texts WHERE hash = ?", (hash_,)).fetchone()
+            if row and row[0] == old_id: # whitespace only: same text, same vector
+                conn.execute("UPDATE chunk_texts SET content = ? WHERE id = ?", (content, old_id))
+                continue
+            new_id = row[0] if row else conn.execute(
+                "INSERT INTO chunk_texts (hash, content) VALUES (?, ?)", (hash_, content)).lastrowid
+            conn.execute("UPDATE chunks SET text_id = ? WHERE text_id = ?", (new_id, old_id))
+            conn.execute("DELETE FROM chunk_texts WHERE id = ?", (old_id,))
+            conn.execute("INSERT OR IGNORE INTO tombstones (vector_id) VALUES (?)", (old_id,))
+            moved[old_id] = new_id
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return moved
+
+# ========== Extracted Text ==========
+def record_extracted_text(hash_, path, loader_version, chars, page_offsets, tags=None):
+    with connect() as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO extracted_text (hash, path, loader_version, chars, page_offsets, timestamp, tags)
+            VALUES (?, ?, ?, ?, ?, datetime('now'), ?)
+        ''', (hash_, str(path), loader_version, chars, json.dumps(page_offsets), join_tags(tags)))
+
+def get_rechunk_sources() -> list[tuple[str, str, int | None]]:
+    """(path, hash, document id or None) for every file with cached text or a document row."""
+    with connect() as conn:
+        rows = conn.execute('''
+            SELECT e.path, e.hash, d.id FROM extracted_text e LEFT JOIN documents d ON d.hash = e.hash
+            UNION
+            SELECT d.path, d.hash, d.id FROM documents d
+            WHERE d.hash NOT IN (SELECT hash FROM extracted_text)
+        ''').fetchall()
+    return rows
+
+# ========== Near-duplicate Fingerprints ==========
+def record_fingerprint(hash_, path, minhash: bytes, quality, chars, bands: list[int],
+                       duplicate_of=None, similarity=None):
+    """Store a document's signature; its LSH bands only when it is a kept copy."""
+    with connect() as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO doc_fingerprints
+                (hash, path, minhash, quality, chars, duplicate_of, similarity, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))
+        ''', (hash_, str(path), minhash, quality, chars, duplicate_of, similarity))
+        conn.execute("DELETE FROM lsh_buckets WHERE hash = ?", (hash_,))
+        if duplicate_of is None:
+            conn.executemany("INSERT OR IGNORE INTO lsh_buckets (band, bucket, hash) VALUES (?, ?, ?)",
+                             [(band, bucket, hash_) for band, bucket in enumerate(bands)])
+
+def mark_duplicate(hash_, duplicate_of, similarity):
+    with connect() as conn:
+        conn.execute("UPDATE doc_fingerprints SET duplicate_of = ?, similarity = ? WHERE hash = ?",
+                     (duplicate_of, similarity, hash_))
+        conn.execute("DELETE FROM lsh_buckets WHERE hash = ?", (hash_,))
+
+def get_lsh_candidates(bands: list[int], exclude_hash=None) -> list[tuple]:
+    """ (hash, path, minhash, quality, chars, document id) of ingested documents
+        sharing at least one LSH band with the signature. """
+    if not bands:
+        return []
+    pairs = ",".join("(?, ?)" for _ in bands)
+    params = [value for band, bucket in enumerate(bands) for value in (band, bucket)]
+    with connect() as conn:
+        return conn.execute(f'''
+            SELECT f.hash, f.path, f.minhash, f.quality, f.chars, d.id
+            FROM doc_fingerprints f
+            JOIN documents d ON d.hash = f.hash
+            WHERE f.hash IN (SELECT hash FROM lsh_buckets WHERE (band, bucket) IN (VALUES {pairs}))
+              AND f.hash != ?
+        ''', params + [exclude_hash or ""]).fetchall()
+
+def get_kept_copy(hash_) -> str | None:
+    """Path of the ingested document a file was skipped in favour of, if it is still there."""
+    with connect() as conn:
+        row = conn.execute('''
+            SELECT d.path FROM doc_fingerprints f
+            JOIN documents d ON d.hash = f.duplicate_of
+            WHERE f.hash = ?
+        ''', (hash_,)).fetchone()
+    return row[0] if row else None
+
+# ========== Converter Failures ==========
+def get_converter_failures(hash_, tool) -> int:
+    with connect() as conn:
+        row = conn.execute("SELECT failures FROM converter_failures WHERE hash = ? AND tool = ?",
+                           (hash_, tool)).fetchone()
+    return row[0] if row else 0
+
+def record_converter_failure(hash_, tool, path, error) -> int:
+    """Count one more failed run and return the total for this file and tool."""
+    with connect() as conn:
+        conn.execute('''
+            INSERT INTO converter_failures (hash, tool, path, failures, last_error, timestamp)
+            VALUES (?, ?, ?, 1, ?, datetime('now'))
+            ON CONFLICT (hash, tool) DO UPDATE SET
+                failures = failures + 1, path = excluded.path,
+                last_error = excluded.last_error, timestamp = excluded.timestamp
+        ''', (hash_, tool, str(path), error))
+    return get_converter_failures(hash_, tool)
+
+def clear_converter_failures(hash_, tool):
+    with connect() as conn:
+        conn.execute("DELETE FROM converter_failures WHERE hash = ? AND tool = ?", (hash_, tool))
+
+# ========== Ingestion Profile ==========
+def insert_ingest_profile(run_id, path, status, wall_seconds, stages: dict, bytes_read,
+                          text_chars, chunks_total, chunks_accepted, peak_rss_mb, chunk_sizes: dict | None = None):
+    with connect() as conn:
+        conn.execute('''
+            INSERT INTO ingest_profile (run_id, path, status, wall_seconds, stages, bytes_read, text_chars,
+                                        chunks_total, chunks_accepted, peak_rss_mb, chunk_sizes, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
+        ''', (run_id, str(path), status, wall_seconds, json.dumps(stages), bytes_read, text_chars,
+              chunks_total, chunks_accepted, peak_rss_mb, json.dumps(chunk_sizes) if chunk_sizes else None))
+
+def get_ingest_profiles(run_id) -> list[dict]:
+    with connect() as conn:
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute("SELECT * FROM ingest_profile WHERE run_id = ?", (run_id,)).fetchall()
+    return [{**dict(row), "stages": json.loads(row["stages"] or "{}"),
+             "chunk_sizes": json.loads(row["chunk_sizes"]) if row["chunk_sizes"] else None} for row in rows]
+
+def _texts_to_documents(rows) -> dict[int, Document]:
+    """ Rows of (text id, content, chunk_index, page_num, section, doc id, path,
+        title), ordered by text id then chunk id, to one Document per text. The
+        first occurrence provides the top-level metadata; "sources" lists them all. """
+    docs = {}
+    for text_id, content, chunk_index, page_num, section, doc_id, path, title in rows:
+        source = {
+            "doc_id": doc_id,
+            "path": path,
+            "title": title,
+            "chunk_index": chunk_index,
+            "page": page_num if page_num is not None else "?",
+        }
+        if section:
+            source.update(json.loads(section))
+        if text_id in docs:
+            docs[text_id].metadata["sources"].append(source)
+        else:
+            docs[text_id] = Document(page_content=content,
+                                     metadata={"text_id": text_id, **source, "sources": [source]})
+    return docs
+
+def get_texts_by_ids(ids) -> dict[int, Document]:
+    """Fetch chunk texts by id as Documents; ids that no longer exist are simply absent."""
+    ids = [int(i) for i in ids]
+    if not ids:
+        return {}
+    placeholders = ",".join("?" * len(ids))
+    with connect() as conn:
+        rows = conn.execute(f'''
+            SELECT t.id, t.content, c.chunk_index, c.page_num, c.section, d.id, d.path, d.title
+            FROM chunk_texts t
+            JOIN chunks c ON c.text_id = t.id
+            JOIN documents d ON c.document_id = d.id
+            WHERE t.id IN ({placeholders})
+            ORDER BY t.id, c.id
+        ''', ids).fetchall()
+    return _texts_to_documents(rows)
+
+def get_filtered_text_ids(where: str, args) -> list[int]:
+    """Text ids (= vector ids) of the chunks of documents d matching a SearchFilter condition."""
+    with connect() as conn:
+        return [row[0] for row in conn.execute(f'''
+            SELECT DISTINCT c.text_id FROM documents d
+            JOIN chunks c ON c.document_id = d.id
+            WHERE {where}
+        ''', args)]
 
 def fetch_metadata_by_content(content_substring):
     conn = init_db()
@@ -144,38 +718,82 @@ def fetch_metadata_by_content(content_substring):
     cur.execute('''
         SELECT d.title, d.timestamp, d.path FROM documents d
         JOIN chunks c ON c.document_id = d.id
-        WHERE c.content LIKE ?
+        JOIN chunk_texts t ON c.text_id = t.id
+        WHERE t.content LIKE ?
         LIMIT 1
     ''', (f"%{content_substring[:50]}%",))
     row = cur.fetchone()
     return {"title": row[0], "timestamp": row[1], "path": row[2]} if row else {}
 
 def get_all_chunks(topic: str) -> list[Document]:
-    """Fetch all chunks from DB as LangChain Document objects with metadata."""
+    """Fetch all unique chunk texts from DB as LangChain Documents, with every source in metadata."""
     db_file = Path("db") / topic / "metadata.db"
     if not db_file.exists():
-        print(f"[Error] metadata.db not found for topic: {topic}")
+        logger.error("metadata.db not found for topic: %s", topic)
         return []
 
     conn = sqlite3.connect(db_file)
     cur = conn.cursor()
     cur.execute('''
-        SELECT c.content, c.chunk_index, d.id, d.path, d.title
-        FROM chunks c
+        SELECT t.id, t.content, c.chunk_index, c.page_num, c.section, d.id, d.path, d.title
+        FROM chunk_texts t
+        JOIN chunks c ON c.text_id = t.id
         JOIN documents d ON c.document_id = d.id
-        ORDER BY d.id, c.chunk_index
+        ORDER BY t.id, c.id
     ''')
+    return list(_texts_to_documents(cur.fetchall()).values())
 
-    rows = cur.fetchall()
-    return [
-        Document(
-            page_content=content,
-            metadata={
-                "doc_id": doc_id,
-                "path": path,
-                "title": title,
-                "chunk_index": chunk_index,
-            }
-        )
-        for content, chunk_index, doc_id, path, title in rows
-    ]
\ No newline at end of file
+# ========== Browsing (keyset pagination) ==========
+# Every page starts after the sort key of the previous page's last row
+# (after=...), so the 1000th page is the same index seek as the first; no
+# OFFSET, no COUNT(*). A page shorter than limit is the last one.
+PAGE_SIZE = 100
+
+def list_documents_page(after_id: int = 0, limit: int = PAGE_SIZE) -> list[tuple]:
+    """(id, path, title, source_type, timestamp) of documents in id order."""
+    with connect() as conn:
+        return conn.execute('''
+            SELECT id, path, title, source_type, timestamp FROM documents
+            WHERE id > ? ORDER BY id LIMIT ?
+        ''', (after_id, limit)).fetchall()
+
+def list_titles_page(source_type: str, after: tuple[str, int] = None, limit: int = PAGE_SIZE) -> list[tuple[int, str]]:
+    """(id, title) of the documents of one type by title; after is the last (title, id) seen."""
+    title, doc_id = after or ("", 0)
+    with connect() as conn:
+        return conn.execute('''
+            SELECT id, title FROM documents
+            WHERE source_type = ? AND (title, id) > (?, ?)
+            ORDER BY title, id LIMIT ?
+        ''', (source_type, title, doc_id, limit)).fetchall()
+
+def query_documents_page(source_type: str = None, date_after: str = None, after: tuple[str, int] = None,
+                         limit: int = PAGE_SIZE) -> list[tuple]:
+    """ (id, path, title, timestamp) of documents added after date_after,
+        oldest first; after is the last (timestamp, id) seen. """
+    clauses, args = [], []
+    if source_type:
+        clauses.append("source_type = ?")
+        args.append(source_type)
+    if date_after:
+        clauses.append("timestamp > ?")
+        args.append(date_after)
+    if after:
+        clauses.append("(timestamp, id) > (?, ?)")
+        args += list(after)
+    with connect() as conn:
+        return conn.execute(f'''
+            SELECT id, path, title, timestamp FROM documents
+            WHERE {" AND ".join(clauses) or "1"}
+            ORDER BY timestamp, id LIMIT ?
+        ''', args + [limit]).fetchall()
+
+def document_chunks_page(doc_id: int, after_index: int = -1, limit: int = PAGE_SIZE) -> list[tuple]:
+    """(chunk_index, page_num, content) of a document's chunks in order, after chunk after_index."""
+    with connect() as conn:
+        return conn.execute('''
+            SELECT c.chunk_index, c.page_num, t.content FROM chunks c
+            JOIN chunk_texts t ON t.id = c.text_id
+            WHERE c.document_id = ? AND c.chunk_index > ?
+            ORDER BY c.chunk_index LIMIT ?
+        ''', (doc_id, after_index, limit)).fetchall()
@@ -1,54 +1,171 @@
 import ftfy
 import langdetect
+import logging
 import os
 import re
+import threading
 import unicodedata
 from datetime import datetime
+from time import perf_counter
 from spellchecker import SpellChecker
 spell = SpellChecker()
-from data.jsonhandler import apply_normalization, load_normalization_map, detect_potential_ocr_errors
+from data.jsonhandler import JSON_PATH, Normalizer, load_normalization_map, detect_potential_ocr_errors
+from server.metrics import count, observe, timed
+
+logger = logging.getLogger(__name__)
 
 # ========== Load Normalization Rules ==========
-_normalization_rules_cache = None
+# (file stamp, rules, compiled rules); reloaded when the file changes, so edits
+# by update_ocr_fixes(), add_normalization_entry() or data/map.py apply to the
+# next file without a restart. Existing chunks: main.py --renormalize.
+_normalization_cache = (None, {}, None)
+_normalization_lock = threading.Lock()
 '''
 The normalization JSON is used here to clean and normalize 
 the entire raw text (fixing ligatures, punctuation, OCR artifacts, etc).
 This filtered text is cleaned and normalized, ready to be chunked.
 '''
-def normalization_rules():
-    global _normalization_rules_cache
-    if _normalization_rules_cache is None:
-        _normalization_rules_cache = load_normalization_map(create_if_missing=False)
-    return _normalization_rules_cache
-
-def normalize_unicode(text: str) -> str:
-    text = ftfy.fix_text(text)
-    text = unicodedata.normalize("NFKC", text)
-    return apply_normalization(text, normalization_rules())
-
-def clean_text(raw: str) -> str:
-    print(f"[Cleaning] Input length: {len(raw)}")
-    text = normalize_unicode(raw)
-    text = text.strip()
+def _map_stamp():
+    try:
+        stat = JSON_PATH.stat()
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def _normalization():
+    global _normalization_cache
+    stamp = _map_stamp()
+    with _normalization_lock:
+        cached_stamp, rules, compiled = _normalization_cache
+        if compiled is None or stamp != cached_stamp:
+            loaded = load_normalization_map(create_if_missing=False)
+            if not loaded and rules:
+                # Mid-write or broken JSON: keep serving the last good map.
+                logger.warning("[Cleaning] Normalization map unreadable, keeping the previous rules")
+            else:
+                if compiled is not None:
+                    logger.info("[Cleaning] Normalization map changed on disk, reloaded (%d OCR rules)",
+                                len(loaded.get("ocr_artifacts", {})))
+                rules, compiled = loaded, Normalizer(loaded)
+            _normalization_cache = (stamp, rules, compiled)
+        return rules, compiled
+
+def normalization_rules() -> dict:
+    """The normalization map, reloaded when the file changes."""
+    return _normalization()[0]
+
+def normalizer() -> Normalizer:
+    """normalization_rules() compiled, for apply-many use."""
+    return _normalization()[1]
+
+# ========== Cleaning ==========
+CLEAN_BLOCK = 1 << 16 # characters per ftfy/NFKC block, cut after a newline
+
+# ASCII that ftfy does more to than fix line breaks: HTML entities, terminal
+# escapes and control characters. ASCII without any of them skips ftfy.
+_FTFY_ASCII = re.compile(r"[&\x00-\x08\x0b\x0e-\x1f\x7f]")
 
-    # Normalize line spacing and inline linebreaks
-    text = re.sub(r"\n\s*\n", "\n", text)
-    text = re.sub(r"(?<![.?!])\n(?![A-Z])", " ", text)
-    
-    # Remove ALL CAPS headers (too aggressive?)
-    text = re.sub(r"^[A-Z\s\.\'\"]{10,}$", "", text, flags=re.MULTILINE)
+# Structural passes, in order. Each starts with a literal where it can, so re
+# searches for it instead of trying the pattern at every position.
+_BLANK_LINES = re.compile(r"\n\s*\n") # normalize line spacing...
+_INLINE_BREAK = re.compile(r"\n(?<![.?!]\n)(?![A-Z])") # ...and inline linebreaks
+_CAPS_HEADER = re.compile(r"^[A-Z\s\.\'\"]{10,}$", re.MULTILINE) # ALL CAPS headers (too aggressive?)
+_BOILERPLATE = re.compile(r"(?:Edited by|Translated by|PENES NOS|MDC.*|©.*)", re.IGNORECASE)
+_BOILERPLATE_PROBES = ("edited by", "translated by", "penes nos", "mdc")
+_DOUBLE_SPACES = re.compile(r"  +")
 
+def _blocks(text: str):
+    # Line-aligned blocks: ftfy fixes text line by line, so block by block is the same.
+    start = 0
+    while start < len(text):
+        end = len(text)
+        if start + CLEAN_BLOCK < end:
+            end = text.rfind("\n", start, start + CLEAN_BLOCK) + 1
+            if end <= start: # one very long line
+                end = text.find("\n", start + CLEAN_BLOCK) + 1 or len(text)
+        yield text[start:end]
+        start = end
+
+def _ascii_fix(text: str) -> str | None:
+    # ftfy.fix_text(text) for the ASCII it only changes line breaks of, else None.
+    if not text.isascii() or _FTFY_ASCII.search(text):
+        return None
+    return text.replace("\r\n", "\n").replace("\r", "\n") if "\r" in text else text
+
+def normalize_unicode(text: str) -> tuple[str, int]:
+    """ ftfy + NFKC in bounded blocks. ASCII that ftfy would not touch skips
+        both, a whole block at a time or else line by line (ftfy's own unit).
+        Returns the text and the number of characters skipped. """
+    with timed("ingest", "normalize"):
+        out, skipped, markup = [], 0, False
+        for block in _blocks(text):
+            plain = _ascii_fix(block)
+            if plain is not None:
+                out.append(plain)
+                skipped += len(block)
+                markup = markup or "<" in block
+                continue
+            fixed = []
+            lines = block.split("\n")
+            for n, line in enumerate(lines, 1):
+                line = line + "\n" if n < len(lines) else line
+                plain = _ascii_fix(line)
+                if plain is not None:
+                    fixed.append(plain)
+                    skipped += len(line)
+                else:
+                    # ftfy stops unescaping HTML entities for good at the first line with a "<".
+                    fixed.append(ftfy.fix_text(line, unescape_html=False if markup else "auto"))
+                markup = markup or "<" in line
+            out.append(unicodedata.normalize("NFKC", "".join(fixed)))
+        return "".join(out), skipped
+
+def _may_have_boilerplate(text: str) -> bool:
+    # Cheaper than the case-insensitive scan. Besides case pairs, re.IGNORECASE
+    # matches İ/ı to i and ſ to s, which str.lower() does not map.
+    if "©" in text or (not text.isascii() and any(c in text for c in "İıſ")):
+        return True
+    lowered = text.lower()
+    return any(probe in lowered for probe in _BOILERPLATE_PROBES)
+
+def clean_text(raw: str, normalize: Normalizer | None = None) -> str:
+    """ Unicode repair and the normalization map (normalizer() unless given),
+        then structural cleanup. Rules see the lines before the caps-header and
+        line-break passes do, so a fix can save or drop a header line. """
+    logger.debug("[Cleaning] Input length: %d", len(raw))
+    start = perf_counter()
+    text, skipped = normalize_unicode(raw)
+    with timed("ingest", "normalize"):
+        text = (normalize or normalizer())(text)
+    regex_start = perf_counter()
+    text = text.strip()
+    text = _BLANK_LINES.sub("\n", text)
+    text = _INLINE_BREAK.sub(" ", text)
+    text = _CAPS_HEADER.sub("", text)
     # Remove common editorial boilerplate
-    text = re.sub(r"(?:Edited by|Translated by|PENES NOS|MDC.*|©.*)", "", text, flags=re.IGNORECASE)
+    if _may_have_boilerplate(text):
+        text = _BOILERPLATE.sub("", text)
+    text = _DOUBLE_SPACES.sub(" ", text)
+    observe("ingest", "clean", perf_counter() - regex_start)
 
-    text = re.sub(r" {2,}", " ", text)  # Remove double spaces
-    print(f"[Cleaning] Output length: {len(text)}")
+    seconds = perf_counter() - start
+    count("clean_chars", len(raw), pipeline="ingest")
+    logger.debug("[Cleaning] Output length: %d, %.1f MB/s (%.0f%% ASCII fast path)", len(text),
+                 len(raw) / 2**20 / seconds if seconds else 0.0, skipped / len(raw) * 100 if raw else 0.0)
     return text
 
+def detect_language(text: str, sample_chars: int = 2000) -> str | None:
+    """ISO 639-1 code of a text from a sample of its middle (past front matter), or None."""
+    start = max(0, len(text) // 2 - sample_chars // 2)
+    try:
+        return langdetect.detect(text[start:start + sample_chars])
+    except langdetect.LangDetectException:
+        return None
+
 def is_clean_text(text: str, max_misspelled_ratio: float = 0.01, sample_size: int = 200) -> bool:
     lang = langdetect.detect(text) # solves Cyrillic false positive problem cleanly and early
     if lang not in ("en", "fr", "de"):  # spellchecker trained on English only
-        print(f"[SKIP] Spellcheck skipped for lang={lang}")
+        logger.debug("[SKIP] Spellcheck skipped for lang=%s", lang)
         return True
     # words = re.findall(r"\b[a-zA-Z]{4,}\b", text)
     # Count real words in any language using \w, and filtering out garbage with .isalpha().
@@ -56,7 +173,7 @@ def is_clean_text(text: str, max_misspelled_ratio: float = 0.01, sample_size: in
     sample = words[:sample_size]
     misspelled = spell.unknown(sample)
     ratio = len(misspelled) / len(sample) if sample else 0
-    print(f"[HEURISTIC] Misspelled ratio: {ratio:.3f}")
+    logger.debug("[HEURISTIC] Misspelled ratio: %.3f", ratio)
     return ratio < max_misspelled_ratio
 
 def process_text_for_chunking(text: str, filename: str = "", enable_ocr: bool = True) -> str:
@@ -64,17 +181,21 @@ def process_text_for_chunking(text: str, filename: str = "", enable_ocr: bool =
     Handles text cleaning and optional OCR artifact detection.
     '''
     is_txt = filename.lower().endswith(".txt")
-    norm_map = normalization_rules()
 
     if is_txt:
-        print(f"[SKIP] OCR skipped for .txt file: {filename}")
-        return apply_normalization(text.strip(), norm_map)
+        logger.debug("[SKIP] OCR skipped for .txt file: %s", filename)
+        with timed("ingest", "normalize"):
+            return normalizer()(text.strip())
 
-    cleaned = clean_text(text)
+    normalize = normalizer()
+    cleaned = clean_text(text, normalize)
 
-    if enable_ocr and not is_clean_text(cleaned):
-        print("[OCR] Text looks noisy, scanning for OCR artifacts...")
-        ocr_fixes = detect_potential_ocr_errors(cleaned)
+    with timed("ingest", "ocr_check"):
+        noisy = enable_ocr and not is_clean_text(cleaned)
+    if noisy:
+        logger.info("[OCR] %s looks noisy, scanning for OCR artifacts...", filename)
+        with timed("ingest", "ocr_detect"):
+            ocr_fixes = detect_potential_ocr_errors(cleaned)
 
         if ocr_fixes:
             log_dir = "logs"
@@ -83,10 +204,12 @@ def process_text_for_chunking(text: str, filename: str = "", enable_ocr: bool =
             log_path = os.path.join(log_dir, f"ocr_artifacts_{timestamp}.txt")
             with open(log_path, "a", encoding="utf-8") as f:
                 for bad, good in sorted(ocr_fixes.items()):
-                    log_msg = f"[OCR] Suggest fix: '{bad}' → '{good}'"
-                    print(log_msg)
-                    f.write(log_msg + "\n")
+                    logger.debug("[OCR] Suggest fix: '%s' → '%s'", bad, good)
+                    f.write(f"[OCR] Suggest fix: '{bad}' → '{good}'\n")
         else:
-            print("[OCR] No significant OCR artifacts found.")
+            logger.debug("[OCR] No significant OCR artifacts found.")
 
-    return apply_normalization(cleaned, norm_map)
\ No newline at end of file
+    # Again for terms the structural passes joined (lines, spaces). Cheap: a rule
+    # whose literal is absent is skipped without running its regex.
+    with timed("ingest", "normalize"):
+        return normalize(cleaned)
\ No newline at end of file
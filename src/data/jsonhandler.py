@@ -1,4 +1,5 @@
 import json
+import os
 import re
 import logging
 from pathlib import Path
@@ -6,6 +7,8 @@ from rapidfuzz import fuzz
 from spellchecker import SpellChecker
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from server.logger import Progress
+
 spell = SpellChecker()
 '''
     Creation of default normalization_map.json
@@ -44,12 +47,8 @@ DEFAULT_STRUCTURE = {
 }
 
 # ========== Logging ==========
+# Handlers and level come from server.logger.setup_logging().
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
-ch = logging.StreamHandler()
-formatter = logging.Formatter('%(message)s')
-ch.setFormatter(formatter)
-logger.addHandler(ch)
 
 # ========== File Handling ==========
 def ensure_normalization_json(path: Path = JSON_PATH, force=False):
@@ -60,33 +59,37 @@ def ensure_normalization_json(path: Path = JSON_PATH, force=False):
         if not path.exists():
             with open(path, "w", encoding="utf-8") as f:
                 json.dump(DEFAULT_STRUCTURE, f, indent=4, ensure_ascii=False)
-            logger.info(f"Normalization map created at {path}")   
+            logger.info("Normalization map created at %s", path)
     except Exception as e:
-        logger.error(f"Error ensuring normalization map at {path}: {e}")
+        logger.error("Error ensuring normalization map at %s: %s", path, e)
 
 def load_normalization_map(path: Path = JSON_PATH, create_if_missing: bool = False) -> dict:
     if create_if_missing:
         ensure_normalization_json(path)
     elif not path.exists():
-        logger.warning(f"Normalization map not found at {path}")
-        print("Run with --rebuild-db to generate it.")
+        logger.warning("Normalization map not found at %s. Run with --rebuild-db to generate it.", path)
         return {}
     try:
         with open(path, "r", encoding="utf-8") as f:
             data = json.load(f)
-        logger.info(f"Normalization map loaded: {path.name}")
+        logger.info("Normalization map loaded: %s", path.name)
         return data
     except Exception as e:
-        logger.error(f"Error loading normalization map from {path}: {e}")
+        logger.error("Error loading normalization map from %s: %s", path, e)
         return {}
 
 def save_normalization_map(data: dict, path: Path = JSON_PATH):
+    # Written aside and renamed: running processes reload the map when it changes
+    # (data.filter), and must never read a half-written file.
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
     try:
-        with open(path, "w", encoding="utf-8") as f:
+        with open(tmp, "w", encoding="utf-8") as f:
             json.dump(data, f, indent=4, ensure_ascii=False)
-        logger.info(f"Normalization map saved to {path}")
+        os.replace(tmp, path)
+        logger.info("Normalization map saved to %s", path)
     except Exception as e:
-        logger.error(f"Error saving normalization map to {path}: {e}")
+        logger.error("Error saving normalization map to %s: %s", path, e)
 
 # ========== Apply Normalization ==========
 def apply_normalization(text: str, norm_map: dict) -> str:
@@ -96,6 +99,33 @@ def apply_normalization(text: str, norm_map: dict) -> str:
     for pattern, repl in norm_map.get("ocr_artifacts", {}).items():
         text = re.sub(pattern, repl, text)
     return text
+
+# An escaped literal, as update_ocr_fixes writes it: \\b{re.escape(bad)}\\b
+_LITERAL_PATTERN = re.compile(r"(?:\\b)?((?:\\\W|[^\\.^$*+?{}\[\]|()])+)(?:\\b)?")
+
+class Normalizer:
+    """ A normalization map compiled once for many texts. Same result as
+        apply_normalization(text, norm_map), but an OCR rule whose pattern is
+        an (escaped) literal only runs its regex when the literal occurs in
+        the text: a \\b-anchored pattern gets no fast literal search from re,
+        and most rules never match a given book. """
+    def __init__(self, norm_map: dict):
+        self.replacements = [(bad, good) for cat in ["ligatures", "punctuation"]
+                             for bad, good in norm_map.get(cat, {}).items()]
+        self.rules = []
+        for pattern, repl in norm_map.get("ocr_artifacts", {}).items():
+            literal = _LITERAL_PATTERN.fullmatch(pattern)
+            probe = re.sub(r"\\(.)", r"\1", literal.group(1), flags=re.DOTALL) if literal else None
+            self.rules.append((re.compile(pattern), repl, probe))
+
+    def __call__(self, text: str) -> str:
+        for bad, good in self.replacements:
+            text = text.replace(bad, good)
+        for regex, repl, probe in self.rules:
+            if probe is None or probe in text:
+                text = regex.sub(repl, text)
+        return text
+
 # NOT USED >
 def apply_regex_normalization(text: str, regex_rules: list[tuple[str, str]]) -> str:
     for pattern, repl in regex_rules:
@@ -108,7 +138,7 @@ def apply_regex_normalization(text: str, regex_rules: list[tuple[str, str]]) ->
 def detect_potential_ocr_errors(text: str, similarity_threshold: float = 0.8, max_workers: int = 8) -> dict[str, str]:
     words = set(re.findall(r"\b[a-zA-Z]{4,}\b", text))
     misspelled = spell.unknown(words)
-    print(f"[OCR] Checking {len(misspelled)} potential OCR artifacts...")
+    logger.debug("[OCR] Checking %d potential OCR artifacts...", len(misspelled))
 
     suggestions = {}
 
@@ -124,9 +154,9 @@ def detect_potential_ocr_errors(text: str, similarity_threshold: float = 0.8, ma
 
     with ThreadPoolExecutor(max_workers=12) as executor:
         future_to_word = {executor.submit(check_word, word): word for word in misspelled}
-        for i, future in enumerate(as_completed(future_to_word)):
-            if i % 100 == 0:
-                print(f"[OCR] Processing {i}/{len(misspelled)}...")
+        progress = Progress(logger, "[OCR] Checked words", total=len(misspelled), level=logging.DEBUG)
+        for future in as_completed(future_to_word):
+            progress.update()
             result = future.result()
             if result:
                 suggestions[result[0]] = result[1]
@@ -138,14 +168,14 @@ def detect_potential_ocr_errors(text: str, similarity_threshold: float = 0.8, ma
     which now includes your updated OCR fixes automatically.
 '''
 def update_ocr_fixes(new_fixes: dict[str, str]) -> None:
-    print("[DEBUG] update_ocr_fixes: start")
+    logger.debug("update_ocr_fixes: start")
 
     if not new_fixes:
         logger.info("No new OCR fixes to update.")
         return
     
     for bad, good in new_fixes.items():
-        logger.info(f"Adding/updating OCR fix: '{bad}' -> '{good}'")
+        logger.info("Adding/updating OCR fix: '%s' -> '%s'", bad, good)
         pattern = fr"\b{re.escape(bad)}\b"
         add_normalization_entry("ocr_artifacts", pattern, good)
 
@@ -153,14 +183,14 @@ def update_ocr_fixes(new_fixes: dict[str, str]) -> None:
 def add_normalization_entry(category: str, bad: str, good: str, path: str = JSON_PATH):
     
     data = load_normalization_map(path, create_if_missing=False)
-    logger.debug(f"Normalization data keys being saved: {list(data.keys())}")
+    logger.debug("Normalization data keys being saved: %s", list(data.keys()))
 
     if category not in data:
         data[category] = {}
     if bad in data[category]:
-        logger.info(f"Updating existing entry in '{category}': '{bad}' -> '{good}'")
+        logger.info("Updating existing entry in '%s': '%s' -> '%s'", category, bad, good)
     else:
-        logger.info(f"Adding new entry in '{category}': '{bad}' -> '{good}'")
+        logger.info("Adding new entry in '%s': '%s' -> '%s'", category, bad, good)
 
     data[category][bad] = good
     save_normalization_map(data, path)
@@ -50,7 +50,8 @@ for log_file in log_files:
 os.makedirs("db", exist_ok=True) # create folder db if it does not exist
 norm_map["ocr_artifacts"] = dict(sorted(ocr_fixes.items()))
 
-with open(MAP_FILE, "w", encoding="utf-8") as f:
+with open(MAP_FILE + ".tmp", "w", encoding="utf-8") as f:
     json.dump(norm_map, f, indent=4, ensure_ascii=False)
+os.replace(MAP_FILE + ".tmp", MAP_FILE) # running processes reload the map when it changes
 
 print(f"[DONE] normalization_map.json updated with {len(ocr_fixes)} OCR fixes.")
\ No newline at end of file
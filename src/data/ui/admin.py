@@ -1,22 +1,25 @@
-from data import init_db
+from data import init_db, delete_document
+from data.db import PAGE_SIZE, list_documents_page
 
 def list_documents():
-    conn = init_db()
-    cur = conn.cursor()
-    cur.execute("SELECT id, path, timestamp FROM documents")
-    for row in cur.fetchall():
-        print(row)
+    init_db().close()
+    after_id = 0
+    while True: # page by id: constant memory, however many documents
+        rows = list_documents_page(after_id)
+        for doc_id, path, _, _, timestamp in rows:
+            print((doc_id, path, timestamp))
+        if len(rows) < PAGE_SIZE:
+            break
+        after_id = rows[-1][0]
 
 def delete_document_by_path(path):
+    # Vectors of texts no other document uses are tombstoned and dropped from FAISS by the next compaction.
     conn = init_db()
     cur = conn.cursor()
     cur.execute("SELECT id FROM documents WHERE path = ?", (path,))
     row = cur.fetchone()
     if row:
-        doc_id = row[0]
-        cur.execute("DELETE FROM chunks WHERE document_id = ?", (doc_id,))
-        cur.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
-        conn.commit()
-        print(f"Deleted: {path}")
+        removed = delete_document(row[0])
+        print(f"Deleted: {path} ({len(removed)} vectors tombstoned)")
     else:
-        print("Document not found.")
\ No newline at end of file
+        print("Document not found.")
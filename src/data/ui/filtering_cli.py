@@ -1,20 +1,11 @@
-import sqlite3
 from data import init_db
+from data.db import PAGE_SIZE, query_documents_page
 
-def query_documents(filetype=None, date_after=None, skip_tags=None):
-    conn = init_db()
-    cur = conn.cursor()
-
-    sql = "SELECT path, title, timestamp FROM documents WHERE 1=1"
-    args = []
-
-    if filetype:
-        sql += " AND source_type = ?"
-        args.append(filetype)
-    if date_after:
-        sql += " AND timestamp > ?"
-        args.append(date_after)
+def query_documents(filetype=None, date_after=None, skip_tags=None, after=None, limit=PAGE_SIZE):
+    """ One page of (path, title, timestamp), oldest first. Pass the cursor
+        returned with the previous page as after; it is None after the last page. """
+    init_db().close()
     # skip_tags is hypothetical for later use (if you store tags)
-
-    cur.execute(sql, args)
-    return cur.fetchall()
\ No newline at end of file
+    rows = query_documents_page(filetype, date_after, after, limit)
+    cursor = (rows[-1][3], rows[-1][0]) if len(rows) == limit else None
+    return [(path, title, timestamp) for _, path, title, timestamp in rows], cursor
@@ -1,31 +1,55 @@
 import gradio as gr
 from data import init_db
+from data.db import PAGE_SIZE, document_chunks_page, list_titles_page
 
-def list_titles_by_type(filetype):
-    conn = init_db()
-    cur = conn.cursor()
-    cur.execute("SELECT title FROM documents WHERE source_type = ?", (filetype,))
-    return [row[0] for row in cur.fetchall()]
-
-def view_document(title):
-    conn = init_db()
-    cur = conn.cursor()
-    cur.execute('''
-        SELECT c.content FROM chunks c
-        JOIN documents d ON d.id = c.document_id
-        WHERE d.title = ? ORDER BY c.chunk_index
-    ''', (title,))
-    chunks = cur.fetchall()
-    return "\n---\n".join(chunk[0] for chunk in chunks)
+# Pages are fetched by keyset (data.db), so browsing stays fast however many
+# books a topic holds; the state components carry the cursor between clicks.
+
+def list_titles_by_type(filetype, after=None):
+    """One page of (title, id) choices of a type, and the cursor for the next page."""
+    rows = list_titles_page(filetype, after) if filetype else []
+    cursor = (rows[-1][1], rows[-1][0]) if len(rows) == PAGE_SIZE else None
+    return [(title, doc_id) for doc_id, title in rows], cursor
+
+def view_document(doc_id, after_index=-1):
+    """One page of a document's chunks, and the last chunk index shown (None at the end)."""
+    rows = document_chunks_page(doc_id, after_index) if doc_id is not None else []
+    text = "\n---\n".join(
+        content if page in (None, "?") else f"[page {page}] {content}" for _, page, content in rows)
+    return text, (rows[-1][0] if len(rows) == PAGE_SIZE else None)
 
 def build_gradio_ui():
+    init_db().close() # schema migrations before the first page query
+
+    def show_types(filetype):
+        choices, cursor = list_titles_by_type(filetype)
+        return gr.update(choices=choices, value=None), choices, cursor
+
+    def more_titles(filetype, choices, cursor):
+        if cursor is None:
+            return gr.update(), choices, None
+        page, cursor = list_titles_by_type(filetype, tuple(cursor))
+        choices = choices + page
+        return gr.update(choices=choices), choices, cursor
+
+    def next_chunks(doc_id, after_index):
+        if after_index is None:
+            return gr.update(), None
+        return view_document(doc_id, after_index)
+
     with gr.Blocks() as demo:
         filetype = gr.Dropdown(choices=["txt", "pdf", "epub"], label="Filetype")
         titles = gr.Dropdown(choices=[], label="Title")
+        more = gr.Button(f"More titles (+{PAGE_SIZE})")
         output = gr.Textbox(label="Contents", lines=20)
+        next_page = gr.Button(f"Next {PAGE_SIZE} chunks")
+        title_choices, title_cursor, chunk_cursor = gr.State([]), gr.State(None), gr.State(None)
 
-        filetype.change(fn=list_titles_by_type, inputs=filetype, outputs=titles)
-        titles.change(fn=view_document, inputs=titles, outputs=output)
+        filetype.change(fn=show_types, inputs=filetype, outputs=[titles, title_choices, title_cursor])
+        more.click(fn=more_titles, inputs=[filetype, title_choices, title_cursor],
+                   outputs=[titles, title_choices, title_cursor])
+        titles.change(fn=view_document, inputs=titles, outputs=[output, chunk_cursor])
+        next_page.click(fn=next_chunks, inputs=[titles, chunk_cursor], outputs=[output, chunk_cursor])
 
     return demo
 
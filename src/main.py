@@ -1,17 +1,29 @@
+import logging
 import os
 import sys
+import torch
 from pathlib import Path
 from langchain_huggingface import HuggingFaceEmbeddings
 
 from data.db import init_db, is_metadata_db_empty, get_existing_hashes, get_all_chunks
-from server.llm import run_rag, parse_args, start_llama_server
-from server.logger import log_exception
+from config import EMBED_DEVICE
+from server.llm import run_rag, parse_args, start_llama_server, log_runtime_info
+from server.logger import log_exception, setup_logging
 from server.ramdisk import mount_ramdisk, copy_to_ramdisk, safe_load
 from server.watchdog import start_watchdog
-from context.retriever import chunk_documents, hash_file, write_stats
-from context.store import create_vector_store, load_vector_store
+from server.ingest import start_ingestion_daemon
+from server.metrics import print_metrics
+from server.profiler import ingest_profiler, query_profiler, print_ingest_report, capture_slowest_files
+from server.batch import run_batch, print_batch_summary
+from context.retriever import chunk_documents, rechunk_documents, hash_file, write_stats
+from context.store import create_vector_store, load_vector_store, print_index_report
+from context.snapshot import export_snapshot, import_snapshot, open_snapshot
+from context.renormalize import renormalize
 from context.chunker import split_into_chunks
 
+logger = logging.getLogger(__name__)
+setup_logging() # before safe_load() below; main() applies --log-level
+
 # from config import EMBED_MODEL_SNAPHOTS, EMBED_MODEL_NAME_PATH, EMBED_MODEL_NAME # imported from .env
 
 # Set fallback env vars somewhere in your environment or config:
@@ -23,56 +35,77 @@ embed_model_dir = safe_load("RAM_EMBED_MODEL_NAME_PATH", "EMBED_MODEL_NAME_PATH"
 # print(">>>" + db_dir)
 # print(">>>" + embed_model_dir)
 
+def split_file(text, path):
+    return split_into_chunks(text, filename=path)
+
+# ========== Embedding Model ==========
+def load_embedding():
+    # Use embed_model_dir from earlier safe_load()
+    if not embed_model_dir:
+        logger.critical("EMBED_MODEL_NAME_PATH not set. Check your .env or environment.")
+        sys.exit(1)
+
+    embedding = HuggingFaceEmbeddings(
+        model_name=embed_model_dir + os.getenv("EMBED_MODEL_SNAPHOTS"),
+        model_kwargs={"device": EMBED_DEVICE or ("cuda" if torch.cuda.is_available() else "cpu")},
+        encode_kwargs={"normalize_embeddings": True},
+        # # This line forces it to use Transformers backend instead of SentenceTransformers
+        # cache_folder=None,  # optional, to prevent slow re-download
+    )
+    logger.info("Loading embedding model: %s", embed_model_dir)
+    logger.info("Embedding dimension: %d", len(embedding.embed_query("test")))
+    return embedding
+
 # ========== RAG loading ==========
-def setup_retriever(args):
+def setup_retriever(args, embedding=None):
+    # embedding may be a DeferredEmbeddings proxy (webui warm-up) so the index
+    # can load while the model is still coming up.
     topic = args.topic
     data_path = os.path.join(args.data_dir, topic)
     db_path = os.path.join(args.db_dir, topic)
 
-    print(f"Using data dir: {data_path}")
-    print(f"Using db dir: {db_path}")
+    if args.snapshot: # everything comes from the file, read-only
+        return open_snapshot(args.snapshot, embedding or load_embedding()).as_retriever()
+
+    logger.info("Using data dir: %s", data_path)
+    logger.info("Using db dir: %s", db_path)
 
     os.makedirs(db_path, exist_ok=True)
 
     # Consistent check for critical files
-    print(f"Checking if metadata DB exists at: {args.db_dir}")
+    logger.debug("Checking if metadata DB exists at: %s", args.db_dir)
     metadata_path = os.path.join(db_path, "metadata.db")
     faiss_path = os.path.join(db_path, "index.faiss")
     metadata_exists = os.path.exists(metadata_path)
     faiss_exists = os.path.exists(faiss_path)
-    print(f"Metadata exists: {metadata_exists}, FAISS index exists: {faiss_exists}")
-
-    # Use embed_model_dir from earlier safe_load()
-    if not embed_model_dir:
-        print("[Fatal] EMBED_MODEL_NAME_PATH not set. Check your .env or environment.")
-        sys.exit(1)
+    logger.info("Metadata exists: %s, FAISS index exists: %s", metadata_exists, faiss_exists)
 
-    embedding = HuggingFaceEmbeddings(
-        model_name=embed_model_dir + os.getenv("EMBED_MODEL_SNAPHOTS"),
-        model_kwargs={"device": "cuda"},
-        encode_kwargs={"normalize_embeddings": True},
-        # # This line forces it to use Transformers backend instead of SentenceTransformers
-        # cache_folder=None,  # optional, to prevent slow re-download
-    )
-    print(f"Loading embedding model: {embed_model_dir}")
-    print(f"Embedding dimension: {len(embedding.embed_query('test'))}")
+    if embedding is None:
+        embedding = load_embedding()
 
     # ========== Step 0: Check if critical files exist ==========
     if not metadata_exists or not faiss_exists:
-        if not (args.rebuild_db or args.rebuild_index):
-            print("[Error] Missing metadata.db or FAISS index.")
-            print("[Hint] Run with --rebuild-db or --rebuild-index to initialize database and index.")
+        if not (args.rebuild_db or args.rebuild_index or (args.rechunk and metadata_exists)):
+            logger.critical("Missing metadata.db or FAISS index.")
+            logger.critical("Run with --rebuild-db or --rebuild-index to initialize database and index.")
             sys.exit(1)
 
     # ========== Step 1: Ensure DB exists ==========
     metadata_empty = not metadata_exists or is_metadata_db_empty()
     need_rebuild = args.rebuild_db or metadata_empty
 
-    print(f"[DB] {'(Re)initializing' if need_rebuild else 'Using existing'} metadata.db")
+    logger.info("[DB] %s metadata.db", "(Re)initializing" if need_rebuild else "Using existing")
     init_db(rebuild=need_rebuild)
 
     # ========== Step 2: Index files if needed ==========
-    if args.rebuild_db or args.rebuild_index:
+    if args.rechunk and not args.rebuild_db:
+        # New chunking/normalization/filter settings over cached extracted text.
+        logger.info("[DB] Re-chunking documents from the extracted-text cache.")
+        run_id = ingest_profiler.start_run() if args.profile else None
+        rechunk_documents(split_file)
+        if run_id:
+            print_ingest_report(run_id)
+    elif args.rebuild_db or args.rebuild_index:
         new_files = []
         existing_hashes = get_existing_hashes()
 
@@ -83,12 +116,17 @@ def setup_retriever(args):
                 new_files.append(path)
 
         if new_files:
-            print(f"[DB] Found {len(new_files)} new files to index.")
-            chunk_documents(data_path, lambda text, path: split_into_chunks(text, filename=path))
+            logger.info("[DB] Found %d new files to index.", len(new_files))
+            run_id = ingest_profiler.start_run() if args.profile else None
+            chunk_documents(data_path, split_file)
+            if run_id:
+                print_ingest_report(run_id)
+                if args.profile_files:
+                    capture_slowest_files(run_id, split_file, args.profile_files)
         else:
-            print("[DB] No new files to index. Skipping chunking.")
+            logger.info("[DB] No new files to index. Skipping chunking.")
     else:
-        print("[Info] No rebuild flags — skipping file scan.")
+        logger.info("No rebuild flags — skipping file scan.")
 
     # === Step 3: Load all chunks from DB ===
     chunks = get_all_chunks(topic)
@@ -97,13 +135,15 @@ def setup_retriever(args):
 
     # === Step 4: Write stats and build index ===
     write_stats(
-        doc_count=len({doc.metadata['doc_id'] for doc in chunks}),
+        doc_count=len({src['doc_id'] for doc in chunks for src in doc.metadata['sources']}),
         chunk_count=len(chunks),
         topic=topic,
         model_name=os.getenv("EMBED_MODEL_SNAPHOTS")
     )
-    print(f"[Info] {len(chunks)} chunks indexed.")
-    return create_vector_store(db_path, chunks, embedding) if args.rebuild_index or not faiss_exists else load_vector_store(db_path, embedding)
+    logger.info("%d unique chunks indexed.", len(chunks))
+    # A rebuilt db has new text ids, so the index (keyed by text id) is rebuilt with it.
+    rebuild = args.rebuild_db or args.rebuild_index or args.rechunk or not faiss_exists
+    return create_vector_store(db_path, chunks, embedding) if rebuild else load_vector_store(db_path, embedding)
     
 # First time (wipe everything):
 # python src/main.py --topic tech --rebuild-db
@@ -111,20 +151,74 @@ def setup_retriever(args):
 # python src/main.py --topic tech --rebuild-index
 # Normal usage (nothing is rebuilt unless missing):
 # python src/main.py --topic tech
+# After changing CHUNK_SIZE, normalization rules or GARBAGE_THRESHOLD (no source parsing):
+# python src/main.py --topic tech --rechunk
+# After adding OCR fixes to the normalization map (only the chunks containing them are re-embedded):
+# python src/main.py --topic tech --renormalize
+# Pick up files added, changed or deleted under DATA_DIR/tech while running:
+# python src/main.py --topic tech --watch
+# Find the files and stages that make a rebuild slow (report + captures in logs/profiles):
+# python src/main.py --topic tech --rebuild-db --profile --profile-files 5
+# Quantize the index to 96 bytes per vector (converted on load; 'recall' in the CLI reports the loss):
+# INDEX_BYTES_PER_VECTOR=96 python src/main.py --topic tech
+# Ship a topic to another machine as one checksummed file (see context/snapshot.py):
+# python src/main.py --topic tech --export-snapshot tech.ragsnap
+# python src/main.py --topic tech --import-snapshot tech.ragsnap   # or serve it as is: --snapshot tech.ragsnap
+# Evaluate or load-test: a JSONL file of questions, or replay the query log (logs/queries.jsonl):
+# python src/main.py --topic tech --batch questions.jsonl --concurrency 8 --retrieve-only
 
 # ========== Ensure setup_retriever() is used ==========
 def main():
     args = parse_args()
+    setup_logging(args.log_level)
+    log_runtime_info()
     os.environ["TOPIC"] = args.topic
-    retriever = setup_retriever(args)
+    if args.renormalize and args.snapshot:
+        sys.exit("[Fatal] --renormalize cannot update a read-only snapshot")
+    if args.watch and args.snapshot:
+        sys.exit("[Fatal] --watch cannot update a read-only snapshot; run it in a separate main.py process")
+    embedding = None
+    if args.import_snapshot:
+        embedding = load_embedding() # the snapshot must match this model
+        import_snapshot(args.import_snapshot, os.path.join(args.db_dir, args.topic), embedding)
+    retriever = setup_retriever(args, embedding)
+    if args.export_snapshot:
+        store = retriever.vectorstore
+        export_snapshot(store, args.export_snapshot, args.topic, store.embedding_function)
+        return retriever
+    if args.renormalize:
+        summary = renormalize(retriever.vectorstore)
+        print(f"[Renormalize] {summary['rules']} rules, {summary['candidates']} candidate texts, "
+              f"{summary['rewritten']} rewritten, {summary['embedded']} embedded in {summary['seconds']}s")
+        return retriever
+    if args.batch:
+        print_batch_summary(run_batch(args.batch, args.batch_out, retriever, args.concurrency,
+                                      args.retrieve_only, args.replay_speed))
+        return retriever
+    if args.profile_queries:
+        query_profiler.arm(args.profile_queries)
+    if args.watch:
+        start_ingestion_daemon(args, lambda: retriever.vectorstore, split_file)
     print("=== Local RAG Client Ready ===")
     print("Use this program to ask questions over your document database.")
-    print("Interactive RAG CLI started. Type 'exit' to quit.")
+    print("Interactive RAG CLI started. Type 'metrics' for pipeline timings, "
+          "'profile N' to profile the next N queries, 'recall' for index memory and recall, 'exit' to quit.")
     while True:
         query = input("\nYou: ")
         if query.lower() in {"exit", "quit"}:
             print("Exiting.")
             break
+        if query.strip().lower() == "metrics": # per-stage latency histograms and counters
+            print_metrics()
+            continue
+        if query.strip().lower() == "recall": # compressed index vs exact search
+            print_index_report(retriever.vectorstore)
+            continue
+        if query.strip().lower().startswith("profile "): # cProfile + tracemalloc for the next N queries
+            n = query.split()[1]
+            if n.isdigit():
+                query_profiler.arm(int(n))
+                continue
         try:
             sources, response = run_rag(query, retriever)
             print("\nw\n", sources)
@@ -136,6 +230,6 @@ def main():
 if __name__ == "__main__":
     start_llama_server()
     mount_ramdisk() # COMMENT TO TURN OFF IF NOT USED   
-    copy_to_ramdisk(["DB_DIR", "EMBED_MODEL_NAME_PATH"])  # Add "DATA_DIR" if you rebuild indexes frequently.
+    copy_to_ramdisk(["DB_DIR", "EMBED_MODEL_NAME_PATH"])  # Incremental; add "DATA_DIR" if you rebuild indexes frequently.
     start_watchdog() # COMMENT TO TURN OFF IF NOT USED
     main()
\ No newline at end of file
@@ -0,0 +1,143 @@
+"""
+    Batch question runner: pushes a JSONL file of questions through the
+    pipeline with BATCH_CONCURRENCY questions in flight and streams one JSON
+    result line per question (answer or hits, seconds, per-stage timings).
+    Prints throughput and latency percentiles at the end.
+
+    Input lines are {"question": ..., "id": ...}, a JSON string or plain text.
+    A query log (QUERY_LOG) is valid input; with --replay-speed its "ts" values
+    set the arrival times (1 = as recorded, 2 = twice as fast).
+
+    python src/main.py --topic tech --batch questions.jsonl --batch-out results.jsonl
+    python src/main.py --topic tech --batch logs/queries.jsonl --replay-speed 1 --retrieve-only
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from time import perf_counter
+
+from context.provenance import hit_record, retrieve_scored, run_rag_with_provenance
+from server.metrics import count, set_recorder, timed
+
+logger = logging.getLogger(__name__)
+
+class QueryRecord:
+    """Stage timings of one question (installed with set_recorder in its worker thread)."""
+    def __init__(self):
+        self.stages = {}
+
+    def stage(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def count(self, kind, amount):
+        pass
+
+def read_questions(path):
+    """Yield (line number, record dict) for every non-empty line."""
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                item = line
+            if isinstance(item, str):
+                item = {"question": item}
+            question = item.get("question") or item.get("query")
+            if not question:
+                logger.warning("[Batch] %s:%d has no question, skipped", path, n)
+                continue
+            yield n, {**item, "question": question}
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))] if ordered else None
+
+def _retrieve(question: str, retriever) -> list[dict]:
+    # Retrieval only: same filters and search as a RAG query, plus scores.
+    count("queries", pipeline="query")
+    with timed("query", "total"):
+        _, hits = retrieve_scored(question, retriever)
+    return [hit_record(doc, score) for doc, score in hits]
+
+def _run_one(item: dict, retriever, retrieve_only: bool, arrived: float) -> dict:
+    record = QueryRecord()
+    previous = set_recorder(record)
+    result = {key: item[key] for key in ("id", "line", "question") if key in item}
+    try:
+        if retrieve_only:
+            result["hits"] = _retrieve(item["question"], retriever)
+        else:
+            result["sources"], result["answer"] = run_rag_with_provenance(item["question"], retriever, record=False)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        set_recorder(previous)
+    # From arrival, so a saturated replay shows its queueing delay.
+    result["seconds"] = round(perf_counter() - arrived, 6)
+    result["stages"] = {stage: round(s, 6) for stage, s in record.stages.items()}
+    return result
+
+def run_batch(questions_path, out_path, retriever, concurrency: int, retrieve_only: bool = False,
+              replay_speed: float = 0.0) -> dict:
+    """Run every question in questions_path; results stream to out_path. Returns the summary."""
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    lock = threading.Lock()
+    in_flight = threading.BoundedSemaphore(concurrency * 2) # read ahead, not the whole file
+    latencies, stages, errors = [], {}, 0
+
+    with open(out_path, "w", encoding="utf-8") as out, ThreadPoolExecutor(concurrency) as pool:
+        def done(future):
+            nonlocal errors
+            result = future.result()
+            with lock:
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                latencies.append(result["seconds"])
+                errors += "error" in result
+                for stage, seconds in result["stages"].items():
+                    stages.setdefault(stage, []).append(seconds)
+            in_flight.release()
+
+        start = perf_counter()
+        first_ts = None
+        for n, item in read_questions(questions_path):
+            if replay_speed > 0 and "ts" in item:
+                first_ts = item["ts"] if first_ts is None else first_ts
+                delay = (item["ts"] - first_ts) / replay_speed - (perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            in_flight.acquire()
+            pool.submit(_run_one, {**item, "line": n}, retriever, retrieve_only, perf_counter()).add_done_callback(done)
+        pool.shutdown(wait=True)
+        wall = perf_counter() - start
+
+    summary = {
+        "questions": len(latencies),
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput_qps": round(len(latencies) / wall, 3) if wall else None,
+        "concurrency": concurrency,
+        "mode": "retrieve" if retrieve_only else "rag",
+    }
+    for q in (0.5, 0.9, 0.99):
+        summary[f"latency_p{int(q * 100)}_ms"] = round(percentile(latencies, q) * 1000, 2) if latencies else None
+    summary["stages_ms"] = {stage: {"p50": round(percentile(s, 0.5) * 1000, 2), "p99": round(percentile(s, 0.99) * 1000, 2)}
+                            for stage, s in sorted(stages.items())}
+    logger.info("[Batch] %d questions (%d errors) in %.1fs: %.2f q/s, results in %s",
+                summary["questions"], errors, wall, summary["throughput_qps"] or 0, out_path)
+    return summary
+
+def print_batch_summary(summary: dict):
+    print(f"=== Batch: {summary['questions']} questions, {summary['errors']} errors, "
+          f"{summary['wall_seconds']}s, {summary['throughput_qps']} q/s "
+          f"({summary['mode']}, concurrency {summary['concurrency']}) ===")
+    print(f"latency ms  p50 {summary['latency_p50_ms']}  p90 {summary['latency_p90_ms']}  p99 {summary['latency_p99_ms']}")
+    width = max((len(stage) for stage in summary["stages_ms"]), default=0)
+    for stage, ms in summary["stages_ms"].items():
+        print(f"  {stage:<{width}}  p50 {ms['p50']:>9.2f}  p99 {ms['p99']:>9.2f}")
@@ -0,0 +1,244 @@
+"""
+    Live ingestion daemon: watches a topic's data directory and applies new,
+    modified and deleted files to SQLite and the live FAISS index while the
+    service keeps answering queries.
+
+    Documents are stored once per content hash. A renamed or moved file keeps
+    its document (the path is re-pointed, nothing is re-embedded), and so does
+    a file whose copy elsewhere in the tree outlives it.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+
+from config import INGEST_QUIET_SECONDS, INGEST_MAX_DELAY, INGEST_SAVE_INTERVAL
+from context.retriever import ingest_file, hash_file
+from data import get_document_by_path, get_document_by_hash, set_document_path, delete_document
+from server.watchdog import TrailingDebouncer
+
+logger = logging.getLogger(__name__)
+
+def _watched(path) -> bool:
+    # Hidden files and editor backups are never ingested.
+    return not os.path.basename(path).startswith(".") and not path.endswith("~")
+
+class _DataDirHandler(FileSystemEventHandler):
+    def __init__(self, daemon):
+        self.daemon = daemon
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        if event.event_type == "moved":
+            # One ordered rename, not a delete and a create debounced apart:
+            # whichever ran first would re-embed or drop the document.
+            if _watched(event.src_path) and _watched(event.dest_path):
+                self.daemon.notify_move(event.src_path, event.dest_path)
+            elif _watched(event.src_path): # renamed to a backup name: gone
+                self.daemon.notify(event.src_path)
+            elif _watched(event.dest_path): # temp file saved into place
+                self.daemon.notify(event.dest_path)
+        elif _watched(event.src_path):
+            self.daemon.notify(event.src_path)
+
+class IngestionDaemon:
+    def __init__(self, data_path, db_path, get_vectorstore, split_func):
+        self.data_path = str(data_path)
+        self.db_path = str(db_path)
+        self.get_vectorstore = get_vectorstore # callable, so retriever swaps are honoured
+        self.split_func = split_func
+        self.debouncer = TrailingDebouncer(INGEST_QUIET_SECONDS, INGEST_MAX_DELAY)
+        self.queue = queue.Queue()
+        self.observer = None
+        self._first_seen = {}
+        self._copies = {} # content hash -> other paths seen with that content
+        self._last_save = time.time()
+        self._dirty = False
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "files_ingested": 0, "files_deleted": 0, "files_moved": 0, "files_skipped": 0, "errors": 0,
+            "chunks_added": 0, "last_lag_seconds": None, "max_lag_seconds": 0.0,
+            "last_error": None, "last_file": None,
+        }
+
+    # ========== Events ==========
+    def notify(self, path):
+        # Lag is measured from the first event of a burst until the file is searchable.
+        self._first_seen.setdefault(path, time.time())
+        self.debouncer.trigger(path, self._enqueue, path)
+
+    def notify_move(self, src, dest):
+        # Events still pending for either path are superseded by the move: the
+        # content src had is now at dest.
+        now = time.time()
+        seen_at = min(self._first_seen.pop(src, now), self._first_seen.pop(dest, now))
+        self.debouncer.cancel(src)
+        self.debouncer.cancel(dest)
+        self.queue.put((src, dest, seen_at))
+
+    def _enqueue(self, path):
+        self.queue.put((path, None, self._first_seen.pop(path, time.time())))
+
+    # ========== Worker ==========
+    def _worker(self):
+        while True:
+            path, dest, seen_at = self.queue.get()
+            try:
+                if dest:
+                    self._move(Path(path), Path(dest))
+                else:
+                    self._apply(Path(path))
+                self._record(dest or path, seen_at)
+            except Exception as e:
+                with self._stats_lock:
+                    self._stats["errors"] += 1
+                    self._stats["last_error"] = f"{path}: {e}"
+                logger.error("[Ingest] Failed to apply %s: %s", path, e)
+            finally:
+                self.queue.task_done()
+            if self._dirty and (self.queue.empty() or time.time() - self._last_save > INGEST_SAVE_INTERVAL):
+                self._save()
+
+    def _apply(self, path: Path):
+        vectorstore = self.get_vectorstore()
+        existing = get_document_by_path(path)
+
+        if not path.is_file():
+            self._discard_copy(path)
+            if existing:
+                self._release(existing, path)
+            return
+
+        file_hash = hash_file(path)
+        if existing and existing[1] == file_hash:
+            self._bump("files_skipped")
+            return
+        if existing: # changed file: the old version goes unless a copy keeps it
+            self._release(existing, path)
+
+        owner = get_document_by_hash(file_hash)
+        if owner:
+            if Path(owner[1]).is_file():
+                # A copy: the document stays with the first path, this one can take over.
+                self._copies.setdefault(file_hash, set()).add(str(path))
+                self._bump("files_skipped")
+            else:
+                # Renamed before the old path's delete was applied.
+                self._repoint(owner[0], owner[1], path, file_hash)
+            return
+
+        docs = ingest_file(path, self.split_func, file_hash, removed=vectorstore.mark_removed)
+        if not docs:
+            self._bump("files_skipped")
+            return
+        vectorstore.add_documents(docs)
+        self._bump("files_ingested")
+        self._bump("chunks_added", len(docs))
+        self._dirty = True
+
+    def _move(self, src: Path, dest: Path):
+        existing = get_document_by_path(src)
+        if not existing or not dest.is_file():
+            self._apply(src)
+            self._apply(dest)
+            return
+        overwritten = get_document_by_path(dest)
+        if overwritten and overwritten[0] != existing[0]:
+            self._discard_copy(dest)
+            self._release(overwritten, dest)
+        if hash_file(dest) != existing[1]: # changed again since the move
+            self._apply(src)
+            self._apply(dest)
+            return
+        self._repoint(existing[0], src, dest, existing[1])
+
+    def _repoint(self, doc_id, old_path, path: Path, file_hash):
+        set_document_path(doc_id, path)
+        self._discard_copy(path, file_hash)
+        self._bump("files_moved")
+        logger.info("[Ingest] Moved %s -> %s (kept its vectors)", old_path, path)
+
+    def _release(self, existing, path: Path):
+        # The file no longer holds this document's content: hand the document
+        # to a surviving copy, otherwise delete it and tombstone its vectors.
+        doc_id, file_hash = existing
+        survivor = self._surviving_copy(file_hash)
+        if survivor:
+            self._repoint(doc_id, path, survivor, file_hash)
+            return
+        removed = delete_document(doc_id)
+        self.get_vectorstore().mark_removed(removed)
+        self._bump("files_deleted")
+        self._dirty = True
+        logger.info("[Ingest] Removed %s (%d vectors tombstoned)", path, len(removed))
+
+    def _surviving_copy(self, file_hash) -> Path | None:
+        for copy in sorted(self._copies.get(file_hash, ())):
+            copy = Path(copy)
+            if copy.is_file() and hash_file(copy) == file_hash:
+                return copy
+            self._discard_copy(copy, file_hash)
+        return None
+
+    def _discard_copy(self, path, file_hash=None):
+        hashes = [file_hash] if file_hash else list(self._copies)
+        for h in hashes:
+            copies = self._copies.get(h)
+            if copies:
+                copies.discard(str(path))
+                if not copies:
+                    del self._copies[h]
+
+    def _save(self):
+        start = time.time()
+        self.get_vectorstore().save(self.db_path)
+        self._dirty = False
+        self._last_save = time.time()
+        logger.info("[Ingest] Index saved to %s in %.2fs", self.db_path, self._last_save - start)
+
+    def _bump(self, key, n=1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def _record(self, path, seen_at):
+        lag = time.time() - seen_at
+        with self._stats_lock:
+            self._stats["last_lag_seconds"] = lag
+            self._stats["max_lag_seconds"] = max(self._stats["max_lag_seconds"], lag)
+            self._stats["last_file"] = path
+        logger.info("[Ingest] %s applied %.2fs after first event, %d queued", path, lag, self.queue.qsize())
+
+    # ========== Observability ==========
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats.update(queue_length=self.queue.qsize(), debouncing=self.debouncer.pending())
+        return stats
+
+    # ========== Lifecycle ==========
+    def start(self):
+        threading.Thread(target=self._worker, name="ingest-worker", daemon=True).start()
+        self.observer = Observer()
+        self.observer.schedule(_DataDirHandler(self), path=self.data_path, recursive=True)
+        self.observer.start()
+        logger.info("[Ingest] Watching %s for new, changed and deleted files", self.data_path)
+        return self
+
+    def stop(self):
+        if self.observer:
+            self.observer.stop()
+            self.observer.join()
+        self.debouncer.flush()
+        self.queue.join()
+        if self._dirty:
+            self._save()
+
+def start_ingestion_daemon(args, get_vectorstore, split_func) -> IngestionDaemon:
+    data_path = os.path.join(args.data_dir, args.topic)
+    db_path = os.path.join(args.db_dir, args.topic)
+    return IngestionDaemon(data_path, db_path, get_vectorstore, split_func).start()
@@ -1,10 +1,13 @@
 import argparse
 import datetime
+import json
+import logging
 import os
 from pydantic import Field
 import requests
 import subprocess
 import sys
+import time
 import torch
 from typing import Optional, List, Mapping, Any
 from langchain.llms.base import LLM
@@ -12,30 +15,49 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
 from context.provenance import run_rag_with_provenance
-from config import DATA_DIR, DB_DIR, START_LAMMA
+from config import BATCH_CONCURRENCY, DATA_DIR, DB_DIR, START_LAMMA, API_WORKERS
+from server.metrics import timed
 
-LLAMA_SERVER_HOST = "127.0.0.1"
-LLAMA_SERVER_PORT = "8080"
+LLAMA_SERVER_HOST = os.getenv("LLAMA_SERVER_HOST", "127.0.0.1")
+LLAMA_SERVER_PORT = os.getenv("LLAMA_SERVER_PORT", "8080")
 SERVER_URL = "http://" + LLAMA_SERVER_HOST + ":" + LLAMA_SERVER_PORT
+LLM_TIMEOUT = 30 # seconds without a response (streaming: between pieces)
 
-print(f"Connecting to llama server at {LLAMA_SERVER_HOST}:{LLAMA_SERVER_PORT}...")
-# print(f"Using model: {model_name} ({model_size} params) on device: {device_name}")
-# print(f"Context size: {LLAMA_CPP_PARAMS['n_ctx']}")
-# print(f"GPU layers: {LLAMA_CPP_PARAMS['n_gpu_layers']}")
-# print(f"Batch size: {LLAMA_CPP_PARAMS['n_batch']}")
-# print(f"FAISS index loaded from: {DB_DIR}, documents indexed: {num_docs}")
-print(f"Start time: {datetime.datetime.now().isoformat()}")
-print(f"Python version: {sys.version.split()[0]}")
-# print(f"Running on host: {os.uname().nodename}")
-print(f"CUDA available: {torch.cuda.is_available()}")  # True
-print(torch.cuda.get_device_name(0)) 
-print("Loading...")
+PROMPT = (
+    "<|begin_of_text|><|start_header_id|>user<|end_header_id|>\n"
+    "You are an insightful research assistant. Use the context below to construct a thoughtful, multi-layered answer. "
+    "Do not speculate. If unsure, admit it honestly. Use [doc#] to cite sources.\n"
+    "Question: {question} \n"
+    "Context: {context} \n"
+    "<|start_header_id|>assistant<|end_header_id|>\n"
+)
+
+# Pooled keep-alive connections to llama-server: no TCP handshake per query.
+_session = requests.Session()
+
+logger = logging.getLogger(__name__)
+
+def log_runtime_info():
+    # Called once logging is set up (main.py / webui.py), not at import.
+    logger.info("Connecting to llama server at %s:%s...", LLAMA_SERVER_HOST, LLAMA_SERVER_PORT)
+    # logger.info(f"Using model: {model_name} ({model_size} params) on device: {device_name}")
+    # logger.info(f"Context size: {LLAMA_CPP_PARAMS['n_ctx']}")
+    # logger.info(f"GPU layers: {LLAMA_CPP_PARAMS['n_gpu_layers']}")
+    # logger.info(f"Batch size: {LLAMA_CPP_PARAMS['n_batch']}")
+    # logger.info(f"FAISS index loaded from: {DB_DIR}, documents indexed: {num_docs}")
+    logger.info("Start time: %s", datetime.datetime.now().isoformat())
+    logger.info("Python version: %s", sys.version.split()[0])
+    # logger.info(f"Running on host: {os.uname().nodename}")
+    logger.info("CUDA available: %s", torch.cuda.is_available())  # True
+    if torch.cuda.is_available():
+        logger.info("CUDA device: %s", torch.cuda.get_device_name(0))
+    logger.info("Loading...")
 
 # ========== Start LLM Server ==========
 def start_llama_server():
     if not os.path.exists(START_LAMMA):
         raise FileNotFoundError(f"Script not found: {START_LAMMA}")
-    print(f"[Info] Launching llama-server using: {START_LAMMA}")
+    logger.info("Launching llama-server using: %s", START_LAMMA)
 
     try:
         subprocess.Popen(
@@ -43,10 +65,22 @@ def start_llama_server():
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE
         )
-        print("[Info] llama-server started in background.")
+        logger.info("llama-server started in background.")
     except Exception as e:
-        print(f"[Error] Failed to start llama-server: {e}")
+        logger.error("Failed to start llama-server: %s", e)
 
+# ========== Wait for LLM Server ==========
+def wait_for_llama_server(timeout: float = None, interval: float = 1.0) -> bool:
+    # llama-server answers /health with 503 while the model loads and 200 once ready.
+    deadline = None if timeout is None else time.time() + timeout
+    while deadline is None or time.time() < deadline:
+        try:
+            if requests.get(f"{SERVER_URL}/health", timeout=5).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(interval)
+    raise TimeoutError(f"llama-server not ready at {SERVER_URL} after {timeout}s")
 
 # ========== Connect LLM Server ==========
 class LlamaCppServerClient(LLM):
@@ -66,28 +100,49 @@ class LlamaCppServerClient(LLM):
             "temperature": self.temperature,
             "stop": stop or [],
         }
-        response = requests.post(f"{self.server_url}/v1/completions", json=payload, timeout=30)
-        response.raise_for_status()
+        with timed("query", "llm_request"):
+            response = _session.post(f"{self.server_url}/v1/completions", json=payload, timeout=LLM_TIMEOUT)
+            response.raise_for_status()
         data = response.json()
         # This depends on your server's JSON format; adjust as necessary
         return data["choices"][0]["text"]
 
+    def stream_text(self, prompt: str, stop: Optional[List[str]] = None):
+        # Same request with "stream": true; llama-server answers with SSE
+        # "data: {...}" lines and a final "data: [DONE]".
+        payload = {
+            "prompt": prompt,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "stop": stop or [],
+            "stream": True,
+        }
+        with _session.post(f"{self.server_url}/v1/completions", json=payload, stream=True, timeout=LLM_TIMEOUT) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    break
+                text = json.loads(data)["choices"][0].get("text")
+                if text:
+                    yield text
+
 # ========== LLM Generation ==========
 def generate_answer(question, context):
-    prompt = ChatPromptTemplate.from_template(
-        "<|begin_of_text|><|start_header_id|>user<|end_header_id|>\n"
-        "You are an insightful research assistant. Use the context below to construct a thoughtful, multi-layered answer. "
-        "Do not speculate. If unsure, admit it honestly. Use [doc#] to cite sources.\n"
-        "Question: {question} \n"
-        "Context: {context} \n"
-        "<|start_header_id|>assistant<|end_header_id|>\n"
-    )
+    prompt = ChatPromptTemplate.from_template(PROMPT)
 
     llm = LlamaCppServerClient(server_url=SERVER_URL)  # or inject if needed
     chain = prompt | llm | StrOutputParser()
     # print("[DEBUG] Invoking LLM with context length:", len(context))
     return chain.invoke({"question": question, "context": context})
 
+def stream_answer(question, context):
+    # generate_answer() piece by piece, for the HTTP API's streaming endpoints.
+    prompt = ChatPromptTemplate.from_template(PROMPT).format(question=question, context=context)
+    return LlamaCppServerClient(server_url=SERVER_URL).stream_text(prompt)
+
 # ========== RAG Pipeline (Retrieval-Augmented Generation) with PROVENANCE ==========
 def run_rag(question: str, retriever: str) -> tuple[list[str], str]:
     # Run the RAG pipeline with provenance, returning source paths and answer.
@@ -95,7 +150,7 @@ def run_rag(question: str, retriever: str) -> tuple[list[str], str]:
     return sources, answer
 
 # ========== CLI Argument Parsing ==========
-def parse_args():
+def parse_args(known_only=False):
     parser = argparse.ArgumentParser(description="Local RAG CLI with FAISS and LLaMA")
     parser.add_argument("--data-dir", type=str, default=DATA_DIR, help="Directory with input documents")
     parser.add_argument("--db-dir", type=str, default=DB_DIR, help="Directory to store/load FAISS index")
@@ -103,7 +158,25 @@ def parse_args():
     parser.add_argument("--rebuild-index", action="store_true", help="Rebuild FAISS index without wiping DB")
     parser.add_argument("--topic", type=str, default="default", help="Subdirectory for specific topic context")
     parser.add_argument("--ocr-skip", action="store_true", help="Disable OCR artifact detection")
-    return parser.parse_args()
+    parser.add_argument("--rechunk", action="store_true", help="Rebuild chunks and index from cached extracted text (after changing chunking/normalization/filter settings)")
+    parser.add_argument("--renormalize", action="store_true", help="Apply normalization rules added since the last run to the stored chunks, re-embed only those, then exit")
+    parser.add_argument("--watch", action="store_true", help="Ingest new, changed and deleted files in the data dir while running")
+    parser.add_argument("--profile", action="store_true", help="Record per-file ingestion cost by stage and report the slowest files and stages")
+    parser.add_argument("--profile-files", type=int, default=0, metavar="N", help="With --profile: cProfile/tracemalloc capture of the N slowest files")
+    parser.add_argument("--profile-queries", type=int, default=0, metavar="N", help="cProfile/tracemalloc capture of the next N queries")
+    parser.add_argument("--export-snapshot", type=str, default=None, metavar="FILE", help="Write the topic (index, metadata.db, stats) to one snapshot file and exit")
+    parser.add_argument("--import-snapshot", type=str, default=None, metavar="FILE", help="Verify and unpack a snapshot into the topic, then start")
+    parser.add_argument("--snapshot", type=str, default=None, metavar="FILE", help="Serve read-only from a snapshot file without unpacking it")
+    parser.add_argument("--batch", type=str, default=None, metavar="FILE", help="Run the questions in a JSONL file (or a query log) instead of the interactive CLI")
+    parser.add_argument("--batch-out", type=str, default="logs/batch_results.jsonl", metavar="FILE", help="With --batch: JSONL results file")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, metavar="N", help="With --batch: questions in flight")
+    parser.add_argument("--retrieve-only", action="store_true", help="With --batch: retrieval only, no LLM")
+    parser.add_argument("--replay-speed", type=float, default=0.0, metavar="X", help="With --batch: replay query log arrival times X times faster (0: as fast as possible)")
+    parser.add_argument("--workers", type=int, default=API_WORKERS, metavar="N", help="api.py: pre-fork N worker processes sharing one memory-mapped --snapshot")
+    parser.add_argument("--log-level", type=str.upper, default=None, choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="Console and file log level (default: LOG_LEVEL from .env, INFO)")
+    # known_only: for library code (chunker, benchmarks) running under another CLI's argv
+    return parser.parse_known_args()[0] if known_only else parser.parse_args()
 
 # If you want to index documents in data/tech and store vectors in db/tech, run:
 # python main.py \
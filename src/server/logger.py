@@ -1,7 +1,12 @@
+import atexit
+import copy
 import logging
 import os
-from logging.handlers import RotatingFileHandler
-from datetime import datetime
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from time import monotonic
+
+from config import LOG_LEVEL, PROGRESS_INTERVAL
 
 # ========== Config Paths ==========
 LOG_DIR = "logs"
@@ -9,42 +14,137 @@ ROTATING_LOG_FILE = "rag_errors.log"
 MANUAL_LOG_FILE = "log.txt"
 LOG_FILENAME = os.path.join(os.path.dirname(__file__), LOG_DIR, ROTATING_LOG_FILE)
 
-os.makedirs(LOG_DIR, exist_ok=True) # create logs/ directory if it doesn't exist
+CONSOLE_FORMAT = "%(asctime)s %(levelname)-7s %(message)s"
+FILE_FORMAT = "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+
+logger = logging.getLogger("RAG")
+_listener = None
 
-# ========== Rotating File Logger ==========
-handler = RotatingFileHandler(
-    filename=os.path.join(LOG_DIR, ROTATING_LOG_FILE),
-    maxBytes=5 * 1024 * 1024,   # 5 MB
-    backupCount=3               # Keep 3 backup logs
-)
+class _QueueHandler(QueueHandler):
+    # The stock prepare() folds the traceback into the message for every
+    # handler; keep it apart (as exc_text) so each formatter decides.
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
 
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-handler.setFormatter(formatter)
+class _MessageOnly(logging.Formatter):
+    """Drops tracebacks: the terminal and log.txt get the message, rag_errors.log the rest."""
+    def format(self, record):
+        saved = record.exc_info, record.exc_text, record.stack_info
+        record.exc_info = record.exc_text = record.stack_info = None
+        try:
+            return super().format(record)
+        finally:
+            record.exc_info, record.exc_text, record.stack_info = saved
 
-logger = logging.getLogger("RAG")
-logger.setLevel(logging.WARNING)  # Only warnings and errors
-logger.addHandler(handler)
-logger.propagate = False # Avoid duplicate logs if root logger is used elsewhere
+# ========== Setup ==========
+def setup_logging(level: str = None):
+    """ One logging configuration for the process. Loggers only put records on a
+        queue; a QueueListener thread formats them and does the terminal and file
+        I/O. Calling it again just changes the level (e.g. after --log-level). """
+    global _listener
+    root = logging.getLogger()
+    root.setLevel((level or LOG_LEVEL).upper())
+    if _listener is not None:
+        return
+
+    os.makedirs(LOG_DIR, exist_ok=True) # create logs/ directory if it doesn't exist
+    console = logging.StreamHandler()
+    console.setFormatter(_MessageOnly(CONSOLE_FORMAT, datefmt="%H:%M:%S"))
+
+    # Warnings and errors, rotated at 5 MB with 3 backups.
+    errors = RotatingFileHandler(os.path.join(LOG_DIR, ROTATING_LOG_FILE), maxBytes=5 * 1024 * 1024,
+                                 backupCount=3, encoding="utf-8")
+    errors.setLevel(logging.WARNING)
+    errors.setFormatter(logging.Formatter(FILE_FORMAT))
+
+    # Plain timestamped error log (log.txt), as before.
+    manual = logging.FileHandler(os.path.join(LOG_DIR, MANUAL_LOG_FILE), encoding="utf-8")
+    manual.setLevel(logging.ERROR)
+    manual.setFormatter(_MessageOnly("%(asctime)s - %(message)s", datefmt="%Y-%m-%d %H:%M:%S"))
+
+    log_queue = queue.SimpleQueue()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_QueueHandler(log_queue))
+    _listener = QueueListener(log_queue, console, errors, manual, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop) # drain the queue on exit
 
+    for noisy in ("urllib3", "httpx", "watchdog", "PIL", "unstructured"):
+        logging.getLogger(noisy).setLevel(logging.WARNING)
+
+def stop_logging():
+    """Drain the queue; for processes that leave with os._exit() (pre-fork children)."""
+    if _listener is not None:
+        _listener.stop()
+
+def _restart_listener_in_child():
+    # The listener thread does not survive fork(): a forked child gets its own.
+    global _listener
+    if _listener is not None:
+        _listener = QueueListener(_listener.queue, *_listener.handlers, respect_handler_level=True)
+        _listener.start()
+
+os.register_at_fork(after_in_child=_restart_listener_in_child)
 
 # ========== Manual Timestamped Log Function ==========
 def save_manual_log(message: str):
-    
-    # Write a single message to logs/log.txt with timestamp.
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    entry = f"{timestamp} - {message}\n"
-    with open(os.path.join(LOG_DIR, MANUAL_LOG_FILE), "a", encoding="utf-8") as f:
-        f.write(entry)
-
+    # Goes to logs/log.txt through the queue, so callers never wait on disk.
+    logger.error(message)
 
 # ========== Unified Exception Logging Function ==========
 def log_exception(message: str, exception: Exception, context: str = None):
-    error_msg = f"{message}: {str(exception)}"
+    # rag_errors.log gets the traceback as well; log.txt and the terminal the message.
     if context:
-        error_msg += f" | Context: {context}"
+        logger.error("%s: %s | Context: %s", message, exception, context, exc_info=exception)
+    else:
+        logger.error("%s: %s", message, exception, exc_info=exception)
+
+# ========== Progress Reporting ==========
+class Progress:
+    """ Rate-limited progress for long loops: update() is a counter bump and a
+        clock read, and a line is logged at most every PROGRESS_INTERVAL seconds.
+
+        progress = Progress(log, "[Ingest] files", total=len(files))
+        for path in files:
+            ...
+            progress.update()
+        progress.close()
+    """
+    def __init__(self, log: logging.Logger, label: str, total: int = None,
+                 interval: float = PROGRESS_INTERVAL, level: int = logging.INFO):
+        self.log = log
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.level = level
+        self.done = 0
+        self._start = monotonic()
+        self._next = self._start + interval
+
+    def update(self, n: int = 1):
+        self.done += n
+        if monotonic() >= self._next:
+            self._next = monotonic() + self.interval
+            self._emit()
 
-    # Log to rotating logger (rag_errors.log)
-    logger.error(error_msg)
+    def _emit(self, final=False):
+        elapsed = monotonic() - self._start
+        rate = self.done / elapsed if elapsed else 0.0
+        if final:
+            self.log.log(self.level, "%s: %d done in %.1fs (%.1f/s)", self.label, self.done, elapsed, rate)
+        elif self.total:
+            eta = (self.total - self.done) / rate if rate else float("inf")
+            self.log.log(self.level, "%s: %d/%d (%.0f%%, %.1f/s, ETA %.0fs)", self.label, self.done,
+                         self.total, self.done / self.total * 100, rate, eta)
+        else:
+            self.log.log(self.level, "%s: %d (%.1f/s)", self.label, self.done, rate)
 
-    # Also log manually with timestamp in plain .txt
-    save_manual_log(error_msg)
\ No newline at end of file
+    def close(self):
+        self._emit(final=True)
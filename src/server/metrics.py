@@ -0,0 +1,194 @@
+"""
+    In-process metrics for the query and ingestion pipelines: per-stage latency
+    histograms and counters, labelled by pipeline, stage, topic and file type.
+    Exposed as Prometheus text (GET /metrics) and as JSON (CLI `metrics`).
+    Recording costs two perf_counter() calls, a bisect and a short lock.
+"""
+import json
+import os
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from time import perf_counter
+
+# Seconds; covers sub-millisecond FAISS searches up to multi-minute OCR/LLM calls.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+# Chunk lengths, in tokens or characters.
+SIZE_BUCKETS = (16, 32, 64, 128, 192, 256, 320, 384, 448, 512, 768, 1024, 2048)
+
+_context = threading.local()
+
+def _labels(labels: dict) -> tuple:
+    # Labels set with metrics_context() apply to everything recorded in this thread.
+    merged = {"topic": os.getenv("TOPIC", "default")}
+    merged.update(getattr(_context, "labels", {}))
+    merged.update({k: v for k, v in labels.items() if v is not None})
+    return tuple(sorted(merged.items()))
+
+@contextmanager
+def metrics_context(**labels):
+    previous = getattr(_context, "labels", {})
+    _context.labels = {**previous, **{k: v for k, v in labels.items() if v is not None}}
+    try:
+        yield
+    finally:
+        _context.labels = previous
+
+# ========== Metric Types ==========
+class Counter:
+    def __init__(self, name, help_text):
+        self.name, self.help = name, help_text
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return list(self._values.items())
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name, self.help = name, help_text
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {} # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, **labels):
+        key = _labels(labels)
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 2)
+            series[slot] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            return [(key, list(series)) for key, series in self._values.items()]
+
+REGISTRY: list = []
+
+def counter(name, help_text) -> Counter:
+    metric = Counter(name, help_text)
+    REGISTRY.append(metric)
+    return metric
+
+def histogram(name, help_text, buckets=LATENCY_BUCKETS) -> Histogram:
+    metric = Histogram(name, help_text, buckets)
+    REGISTRY.append(metric)
+    return metric
+
+# ========== Pipeline Metrics ==========
+STAGE_SECONDS = histogram("rag_stage_seconds", "Wall time per pipeline stage")
+STAGE_ERRORS = counter("rag_stage_errors_total", "Exceptions raised inside a pipeline stage")
+ITEMS = counter("rag_items_total", "Items processed (queries, files, chunks, bytes)")
+CHUNK_SIZE = histogram("rag_chunk_size", "Chunk length in tokens or characters (unit label)", SIZE_BUCKETS)
+
+@contextmanager
+def timed(pipeline: str, stage: str, **labels):
+    """ with timed("query", "faiss_search"): ...  - records into rag_stage_seconds. """
+    start = perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(pipeline=pipeline, stage=stage, **labels)
+        raise
+    finally:
+        observe(pipeline, stage, perf_counter() - start, **labels)
+
+def observe(pipeline: str, stage: str, seconds: float, **labels):
+    """ For stages timed by hand; timed() ends up here too. """
+    STAGE_SECONDS.observe(seconds, pipeline=pipeline, stage=stage, **labels)
+    recorder = getattr(_context, "recorder", None)
+    if recorder is not None:
+        recorder.stage(stage, seconds)
+
+def count(kind: str, amount=1, **labels):
+    ITEMS.inc(amount, kind=kind, **labels)
+    recorder = getattr(_context, "recorder", None)
+    if recorder is not None:
+        recorder.count(kind, amount)
+
+def observe_chunk_sizes(sizes, unit: str, **labels):
+    """ Lengths of one file's chunks; the recorder gets the whole list. """
+    for size in sizes:
+        CHUNK_SIZE.observe(size, unit=unit, **labels)
+    recorder = getattr(_context, "recorder", None)
+    if recorder is not None and hasattr(recorder, "chunk_sizes"):
+        recorder.chunk_sizes(sizes, unit)
+
+# ========== Profiling Hook ==========
+def set_recorder(recorder):
+    """ Install a per-thread recorder (server.profiler.FileProfile) that also
+        receives every stage timing and count of this thread. Returns the previous one. """
+    previous = getattr(_context, "recorder", None)
+    _context.recorder = recorder
+    return previous
+
+# ========== Export ==========
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _fmt_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+def render_prometheus() -> str:
+    lines = []
+    for metric in REGISTRY:
+        if isinstance(metric, Histogram):
+            lines += [f"# HELP {metric.name} {metric.help}", f"# TYPE {metric.name} histogram"]
+            for key, series in metric.samples():
+                cumulative = 0
+                for bound, n in zip(metric.buckets, series):
+                    cumulative += n
+                    lines.append(f"{metric.name}_bucket{_fmt_labels(key, [('le', bound)])} {cumulative}")
+                cumulative += series[len(metric.buckets)]
+                lines.append(f"{metric.name}_bucket{_fmt_labels(key, [('le', '+Inf')])} {cumulative}")
+                lines.append(f"{metric.name}_sum{_fmt_labels(key)} {series[-1]}")
+                lines.append(f"{metric.name}_count{_fmt_labels(key)} {cumulative}")
+        else:
+            lines += [f"# HELP {metric.name} {metric.help}", f"# TYPE {metric.name} counter"]
+            for key, value in metric.samples():
+                lines.append(f"{metric.name}{_fmt_labels(key)} {value}")
+    return "\n".join(lines) + "\n"
+
+def _quantile(buckets, series, q):
+    total = sum(series[:-1])
+    if not total:
+        return None
+    rank, cumulative = q * total, 0
+    for bound, n in zip(buckets + (float("inf"),), series[:-1]):
+        cumulative += n
+        if cumulative >= rank:
+            return bound
+    return None
+
+def dump_json() -> dict:
+    out = {}
+    for metric in REGISTRY:
+        rows = []
+        for key, value in metric.samples():
+            row = dict(key)
+            if isinstance(metric, Histogram):
+                n = sum(value[:-1])
+                row.update(count=n, sum=round(value[-1], 6),
+                           mean=round(value[-1] / n, 6) if n else None,
+                           p50_le=_quantile(metric.buckets, value, 0.5),
+                           p99_le=_quantile(metric.buckets, value, 0.99))
+            else:
+                row["value"] = value
+            rows.append(row)
+        out[metric.name] = rows
+    return out
+
+def print_metrics():
+    print(json.dumps(dump_json(), indent=2, default=str))
@@ -0,0 +1,241 @@
+"""
+    Pre-fork serving: api.py --workers N --snapshot FILE.
+
+    The front process binds the listening socket and forks:
+    - one embedding process, the only one that loads the embedding model. It
+      answers workers over a Unix socket and batches queries that arrive
+      within EMBED_SERVER_BATCH_WAIT_MS into one forward pass;
+    - N workers, each a full HTTP API accepting on the shared socket, so the
+      kernel hands every connection to an idle worker. Stateless requests are
+      what makes this work: the Gradio web UI keeps sessions per process and
+      is not served this way. Workers serve the snapshot read-only: FAISS maps the index section zero-copy and
+      SQLite opens it immutable, so all of them share one copy in the page
+      cache and memory grows by little more than one interpreter per worker.
+
+    The front process only supervises: it restarts children that die and
+    stops them all on SIGINT/SIGTERM.
+"""
+import logging
+import os
+import queue
+import secrets
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Listener
+from multiprocessing import AuthenticationError
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from config import EMBED_BATCH_SIZE, EMBED_SERVER_BATCH_WAIT_MS, EMBED_SERVER_WAIT, API_HOST, API_PORT
+from server.logger import stop_logging
+from server.metrics import count, observe
+
+logger = logging.getLogger(__name__)
+
+RESTART_DELAY = 1.0 # seconds before a crashed child is replaced
+
+# ========== Embedding Process ==========
+class EmbeddingServer:
+    """ Serves embed requests from the workers. Requests that arrive while a
+        batch is being gathered share one embed_documents() call. """
+    def __init__(self, embedding: Embeddings, address: str, authkey: bytes):
+        self.embedding = embedding
+        self.address = address
+        self.authkey = authkey
+        self._requests = queue.Queue()
+
+    def serve_forever(self):
+        threading.Thread(target=self._batch_loop, name="embed-batch", daemon=True).start()
+        # A predecessor killed with SIGKILL (OOM killer) leaves its socket file
+        # behind, and binding would fail with EADDRINUSE on every restart.
+        # Only the supervisor's single embedding process binds this address.
+        try:
+            os.unlink(self.address)
+        except FileNotFoundError:
+            pass
+        with Listener(self.address, family="AF_UNIX", authkey=self.authkey) as listener:
+            logger.info("[Prefork] Embedding server listening on %s", self.address)
+            while True:
+                try:
+                    conn = listener.accept()
+                except (AuthenticationError, OSError) as e:
+                    logger.warning("[Prefork] Rejected embedding client: %s", e)
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), name="embed-conn", daemon=True).start()
+
+    def _handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    texts = conn.recv()
+                except (EOFError, OSError): # worker closed the connection
+                    return
+                future = Future()
+                self._requests.put((texts, future))
+                try:
+                    conn.send(("ok", future.result()))
+                except Exception as e:
+                    conn.send(("error", f"{type(e).__name__}: {e}"))
+
+    def _batch_loop(self):
+        wait = EMBED_SERVER_BATCH_WAIT_MS / 1000
+        while True:
+            batch = [self._requests.get()]
+            size = len(batch[0][0])
+            deadline = time.perf_counter() + wait
+            while size < EMBED_BATCH_SIZE:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+                size += len(batch[-1][0])
+            texts = [text for request, _ in batch for text in request]
+            start = time.perf_counter()
+            try:
+                vectors = np.asarray(self.embedding.embed_documents(texts), dtype="float32")
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            observe("query", "embed_batch", time.perf_counter() - start)
+            count("embed_batches", pipeline="query")
+            offset = 0
+            for request, future in batch:
+                future.set_result(vectors[offset:offset + len(request)])
+                offset += len(request)
+
+class RemoteEmbeddings(Embeddings):
+    """ Embeddings computed by the embedding process; one connection per thread. """
+    def __init__(self, address: str, authkey: bytes):
+        self.address = address
+        self.authkey = authkey
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+        return conn
+
+    def wait_ready(self, timeout: float = EMBED_SERVER_WAIT) -> "RemoteEmbeddings":
+        """Block until the embedding process answers (its model may still be loading)."""
+        deadline = time.time() + timeout
+        while True:
+            try:
+                self.embed_query("ping")
+                return self
+            except (FileNotFoundError, ConnectionRefusedError, EOFError):
+                self._local.conn = None
+                if time.time() > deadline:
+                    raise TimeoutError(f"Embedding process did not answer within {timeout:.0f}s")
+                time.sleep(0.5)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        conn = self._conn()
+        try:
+            conn.send(list(texts))
+            status, result = conn.recv()
+        except (EOFError, OSError): # embedding process restarted: reconnect next time
+            self._local.conn = None
+            raise
+        if status != "ok":
+            raise RuntimeError(f"Embedding process failed: {result}")
+        return result.tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+# ========== Supervisor ==========
+def _fork(name: str, target, *args) -> int:
+    pid = os.fork()
+    if pid:
+        return pid
+    # Child: default signal handling (uvicorn installs its own), never return.
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    code = 0
+    try:
+        target(*args)
+    except KeyboardInterrupt:
+        pass
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else 1
+    except BaseException as e:
+        logger.error("[Prefork] %s exited with error: %s", name, e)
+        code = 1
+    finally:
+        stop_logging()
+        os._exit(code)
+
+def _embedding_main(load_embedding, address, authkey):
+    EmbeddingServer(load_embedding(), address, authkey).serve_forever()
+
+def serve(args, load_embedding, run_worker, host: str = API_HOST, port: int = API_PORT):
+    """ Run the pre-fork server on host:port until SIGINT/SIGTERM. load_embedding()
+        is called in the embedding process; run_worker(args, embedding, sock)
+        serves one worker on the shared listening socket. """
+    if not args.snapshot:
+        sys.exit("[Fatal] --workers needs --snapshot FILE (workers share one read-only index); "
+                 "create it with main.py --export-snapshot")
+    if args.watch:
+        sys.exit("[Fatal] --watch cannot update a read-only snapshot; run it in a separate main.py process")
+
+    sock = socket.create_server((host, port), backlog=2048)
+    runtime = tempfile.mkdtemp(prefix="rag_prefork_")
+    address = os.path.join(runtime, "embed.sock")
+    authkey = secrets.token_bytes(16)
+
+    def start_embedding():
+        return _fork("embedding", _embedding_main, load_embedding, address, authkey)
+
+    def start_worker(n):
+        embedding = RemoteEmbeddings(address, authkey)
+        return _fork(f"worker {n}", run_worker, args, embedding, sock)
+
+    children = {start_embedding(): "embedding"}
+    for n in range(args.workers):
+        children[start_worker(n)] = n
+    logger.info("[Prefork] Serving %s on %s:%s with %d workers (pids %s)", args.snapshot, host, port,
+                args.workers, ", ".join(str(pid) for pid, role in children.items() if role != "embedding"))
+
+    stopping = False
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    try:
+        while children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            role = children.pop(pid, None)
+            if role is None or stopping:
+                continue
+            logger.error("[Prefork] %s (pid %d) died with status %d; restarting",
+                         "Embedding process" if role == "embedding" else f"Worker {role}", pid, status)
+            time.sleep(RESTART_DELAY)
+            children[start_embedding() if role == "embedding" else start_worker(role)] = role
+    finally:
+        sock.close()
+        shutil.rmtree(runtime, ignore_errors=True)
+    logger.info("[Prefork] All workers stopped")
@@ -0,0 +1,236 @@
+"""
+    On-demand profiling. With --profile every ingested file gets a row in
+    metadata.db (ingest_profile): wall time by stage, bytes read, chunk counts,
+    chunk sizes (chars or tokens) and peak RSS, followed by "slowest files" and "slowest stages" reports.
+    cProfile + tracemalloc captures are available for the N slowest files
+    (replayed after ingestion) and for the next N queries.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+
+from config import PROFILE_DIR, PROFILE_REPORT_TOP
+from data.db import get_ingest_profiles, insert_ingest_profile
+from server.metrics import set_recorder
+
+logger = logging.getLogger(__name__)
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def rss_mb() -> float:
+    # Resident set size from /proc/self/statm: one small read, cheap enough per stage.
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / 2**20
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+# ========== Per-file Ingestion Profile ==========
+class FileProfile:
+    """ Receives the stage timings and counts recorded while one file is ingested.
+        Peak RSS is sampled at the end of every stage. """
+    def __init__(self, path):
+        self.path = Path(path)
+        self.stages = {}
+        self.counts = {}
+        self.sizes, self.size_unit = [], None
+        self.peak_rss_mb = rss_mb()
+
+    def stage(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        self.peak_rss_mb = max(self.peak_rss_mb, rss_mb())
+
+    def count(self, kind, amount):
+        self.counts[kind] = self.counts.get(kind, 0) + amount
+
+    def chunk_sizes(self, sizes, unit):
+        self.sizes += sizes
+        self.size_unit = unit
+
+    def size_summary(self) -> dict | None:
+        if not self.sizes:
+            return None
+        ordered = sorted(self.sizes)
+        return {"unit": self.size_unit, "min": ordered[0], "p50": ordered[len(ordered) // 2],
+                "p90": ordered[int(0.9 * (len(ordered) - 1))], "max": ordered[-1]}
+
+    def status(self) -> str:
+        if self.counts.get("files_failed"):
+            return "load_failed"
+        if self.counts.get("files_garbage"):
+            return "garbage"
+        if self.counts.get("files_near_duplicate"):
+            return "near_dup"
+        if not self.counts.get("files"):
+            return "unsupported"
+        return "ok" if self.counts.get("chunks_accepted") else "no_chunks"
+
+class IngestProfiler:
+    def __init__(self):
+        self.run_id = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.run_id is not None
+
+    def start_run(self) -> str:
+        self.run_id = datetime.now().strftime("%Y-%m-%d_%H%M%S")
+        logger.info("[Profile] Recording per-file ingestion cost, run %s", self.run_id)
+        return self.run_id
+
+    @contextmanager
+    def file(self, path):
+        if not self.enabled:
+            yield None
+            return
+        profile = FileProfile(path)
+        previous = set_recorder(profile)
+        start = perf_counter()
+        status = None
+        try:
+            yield profile
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            set_recorder(previous)
+            # file_total is the file's wall time, not a stage of its own.
+            wall = profile.stages.pop("file_total", perf_counter() - start)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = None
+            insert_ingest_profile(
+                self.run_id, path, status or profile.status(), round(wall, 6),
+                {stage: round(s, 6) for stage, s in profile.stages.items()},
+                size, profile.counts.get("bytes", 0),
+                profile.counts.get("chunks_accepted", 0) + profile.counts.get("chunks_rejected", 0),
+                profile.counts.get("chunks_accepted", 0), round(profile.peak_rss_mb, 1), profile.size_summary())
+
+# ========== Reports ==========
+def ingest_report(run_id, top: int = PROFILE_REPORT_TOP) -> str:
+    rows = get_ingest_profiles(run_id)
+    if not rows:
+        return f"[Profile] No files were ingested in run {run_id}."
+    total_wall = sum(r["wall_seconds"] for r in rows)
+    total_bytes = sum(r["bytes_read"] or 0 for r in rows)
+    lines = [f"=== Ingestion profile {run_id}: {len(rows)} files, {total_wall:.1f}s, "
+             f"{total_bytes / 2**20:.1f} MB read ===", "",
+             f"Slowest files (top {top}):",
+             f"{'seconds':>9} {'MB':>8} {'chunks':>7} {'size p50/max':>13} {'rss MB':>8}  {'status':<11} "
+             f"{'slowest stage':<22} path"]
+    for r in sorted(rows, key=lambda r: r["wall_seconds"], reverse=True)[:top]:
+        stage, seconds = max(r["stages"].items(), key=lambda kv: kv[1], default=("-", 0.0))
+        sizes = r["chunk_sizes"]
+        size = f"{sizes['p50']}/{sizes['max']}" if sizes else "-"
+        lines.append(f"{r['wall_seconds']:>9.2f} {(r['bytes_read'] or 0) / 2**20:>8.2f} "
+                     f"{r['chunks_accepted']:>7} {size:>13} "
+                     f"{r['peak_rss_mb']:>8.1f}  {r['status']:<11} {stage + f' {seconds:.2f}s':<22} {r['path']}")
+
+    totals, worst = {}, {}
+    for r in rows:
+        # Time outside any timed stage (hashing, logging, Python overhead).
+        other = max(0.0, r["wall_seconds"] - sum(r["stages"].values()))
+        for stage, seconds in list(r["stages"].items()) + [("other", other)]:
+            totals[stage] = totals.get(stage, 0.0) + seconds
+            if seconds > worst.get(stage, (0.0, None))[0]:
+                worst[stage] = (seconds, r["path"])
+    lines += ["", "Slowest stages:", f"{'seconds':>9} {'share':>6} {'max/file':>9}  stage (worst file)"]
+    for stage, seconds in sorted(totals.items(), key=lambda kv: kv[1], reverse=True):
+        share = seconds / total_wall * 100 if total_wall else 0.0
+        max_s, path = worst.get(stage, (0.0, None))
+        lines.append(f"{seconds:>9.2f} {share:>5.1f}% {max_s:>9.2f}  {stage} ({Path(path).name if path else '-'})")
+    return "\n".join(lines)
+
+def print_ingest_report(run_id, top: int = PROFILE_REPORT_TOP):
+    print(ingest_report(run_id, top))
+
+# ========== cProfile / tracemalloc Capture ==========
+_capture_lock = threading.Lock() # one capture at a time; profilers do not nest well
+
+def profile_call(label, fn, *args, out_dir=PROFILE_DIR, top=25):
+    """ Run fn(*args) under cProfile and tracemalloc. Writes <label>.prof (for
+        snakeviz/pstats) and a <label>.txt summary to out_dir. """
+    os.makedirs(out_dir, exist_ok=True)
+    stamp = datetime.now().strftime("%Y-%m-%d_%H%M%S_%f")
+    base = os.path.join(out_dir, f"{stamp}_{re.sub(r'[^A-Za-z0-9_.-]+', '_', label)[:80]}")
+    with _capture_lock:
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        profiler = cProfile.Profile()
+        start = perf_counter()
+        try:
+            return profiler.runcall(fn, *args)
+        finally:
+            elapsed = perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            if not was_tracing:
+                tracemalloc.stop()
+            profiler.dump_stats(base + ".prof")
+
+            out = io.StringIO()
+            out.write(f"{label}\nwall {elapsed:.3f}s, peak traced memory {peak / 2**20:.1f} MB\n\n")
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(top)
+            out.write("Top allocations by line:\n")
+            for stat in snapshot.statistics("lineno")[:15]:
+                out.write(f"  {stat}\n")
+            Path(base + ".txt").write_text(out.getvalue(), encoding="utf-8")
+            logger.info("[Profile] %s: %.2fs, peak traced %.1f MB -> %s.txt", label, elapsed, peak / 2**20, base)
+
+def _replay_file(path: Path, split_func):
+    # Load and split again without touching the database, page by page as ingestion does.
+    from context.loaders import lazy_load_text
+    from context.retriever import read_file_safely
+    if path.suffix.lower() == ".txt":
+        return split_func(read_file_safely(path), path)
+    pages = lazy_load_text(str(path)) or ()
+    return [chunk for page in pages for chunk in split_func(page.page_content, path)]
+
+def capture_slowest_files(run_id, split_func, n: int):
+    rows = sorted(get_ingest_profiles(run_id), key=lambda r: r["wall_seconds"], reverse=True)[:n]
+    for r in rows:
+        path = Path(r["path"])
+        if path.is_file():
+            profile_call(f"file_{path.name}", _replay_file, path, split_func)
+
+class QueryProfiler:
+    """ Captures the next N queries (CLI `profile N`, POST /profile, --profile-queries). """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._remaining = 0
+
+    def arm(self, n: int):
+        with self._lock:
+            self._remaining = max(0, int(n))
+        logger.info("[Profile] Capturing the next %d queries to %s", n, PROFILE_DIR)
+
+    def remaining(self) -> int:
+        with self._lock:
+            return self._remaining
+
+    def _take(self) -> bool:
+        with self._lock:
+            if self._remaining <= 0:
+                return False
+            self._remaining -= 1
+            return True
+
+    def run(self, fn, question, *args):
+        if not self._take():
+            return fn(question, *args)
+        return profile_call(f"query_{question[:40]}", fn, question, *args)
+
+ingest_profiler = IngestProfiler()
+query_profiler = QueryProfiler()
@@ -0,0 +1,36 @@
+"""
+    Production query log: one JSON line per question asked through the CLI or
+    the web UI ({"ts", "topic", "question"}), appended to QUERY_LOG. Replay
+    it with main.py --batch logs/queries.jsonl (see server.batch).
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from config import QUERY_LOG
+
+logger = logging.getLogger(__name__)
+
+class QueryLog:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def record(self, question: str, **fields):
+        if not self.path:
+            return
+        line = json.dumps({"ts": round(time.time(), 3), "topic": os.getenv("TOPIC", "default"),
+                           "question": question, **fields}, ensure_ascii=False)
+        with self._lock:
+            try:
+                if self._file is None:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    self._file = open(self.path, "a", encoding="utf-8", buffering=1) # line-buffered
+                self._file.write(line + "\n")
+            except OSError as e: # a full disk must not fail the query
+                logger.warning("[QueryLog] Could not write %s: %s", self.path, e)
+
+query_log = QueryLog(QUERY_LOG)
@@ -1,70 +1,239 @@
+import fnmatch
+import hashlib
+import json
+import logging
 import os
 import shutil
 import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from config import STAGE_WORKERS, STAGE_LARGE_FILE_MB, STAGE_BUFFER_MB, STAGE_HOT_PATTERNS
+
+logger = logging.getLogger(__name__)
 
 ramdisk_root = os.getenv("RAMDISK_ROOT") # if you prefer, import from config.py
 
 # ========== Mount RAM Disk ==========
 def mount_ramdisk():
     script_path = os.path.join(os.path.dirname(__file__), 'mount_ramdisk.sh')
-    print(f"Mounting ramdisk using script at: {script_path}")
+    logger.info("Mounting ramdisk using script at: %s", script_path)
     try:
         subprocess.run(['sudo', script_path], check=True)
-        print("RAM disk mounted successfully.")
+        logger.info("RAM disk mounted successfully.")
     except subprocess.CalledProcessError as e:
-        print(f"Failed to mount ramdisk: {e}")
+        logger.error("Failed to mount ramdisk: %s", e)
         exit(1)
 # If you want to run it without sudo prompts, you can allow passwordless execution via /etc/sudoers:
 # your_username ALL=(ALL) NOPASSWD: /full/path/to/mount_ramdisk.sh
 # Then change the Python call to:
 # subprocess.run(['sudo', '/full/path/to/mount_ramdisk.sh'], check=True)
 
+# ========== Incremental Staging ==========
+# A manifest next to each RAM copy records size, mtime and (lazily) a content hash
+# per file, for both the source and the staged copy. Only files whose source or
+# RAM copy changed since the last run are copied, each via a temp file and
+# os.replace(), so the previous copy stays readable until the new one is complete.
+MANIFEST_NAME = ".stage_manifest.json"
+STAGING_SUFFIX = ".staging"
+
+def is_hot(rel_path):
+    name = os.path.basename(rel_path)
+    return any(fnmatch.fnmatch(name, pattern.strip()) for pattern in STAGE_HOT_PATTERNS)
+
+def file_digest(path, buffer_size=STAGE_BUFFER_MB * 1024 * 1024):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(buffer_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def copy_file(src, dst, buffer_size=STAGE_BUFFER_MB * 1024 * 1024):
+    """ Copy src to dst atomically: kernel-side copy_file_range() where available,
+        large buffered I/O otherwise. Preserves mtime like shutil.copy2(). """
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp = dst + STAGING_SUFFIX
+    with open(src, "rb") as fsrc, open(tmp, "wb") as fdst:
+        copied = False
+        if hasattr(os, "copy_file_range"):
+            try:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), min(remaining, 1 << 30))
+                    if n == 0:
+                        break
+                    remaining -= n
+                copied = remaining == 0
+            except OSError: # EXDEV/ENOSYS/EINVAL on older kernels or mixed filesystems
+                fsrc.seek(0)
+                fdst.seek(0)
+                fdst.truncate()
+        if not copied:
+            shutil.copyfileobj(fsrc, fdst, buffer_size)
+    shutil.copystat(src, tmp)
+    os.replace(tmp, dst)
+
+def load_manifest(ram_path):
+    try:
+        with open(os.path.join(ram_path, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(ram_path, manifest):
+    path = os.path.join(ram_path, MANIFEST_NAME)
+    with open(path + STAGING_SUFFIX, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(path + STAGING_SUFFIX, path)
+
+def _stat_entry(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+def plan_staging(src_root, ram_root, manifest):
+    """ Compare the source tree with the manifest and the RAM copy.
+        Returns (to_copy, to_delete, manifest) where manifest holds the unchanged entries. """
+    to_copy, keep, seen = [], {}, set()
+    for root, _, files in os.walk(src_root):
+        for name in files:
+            if name == MANIFEST_NAME or name.endswith(STAGING_SUFFIX):
+                continue
+            src = os.path.join(root, name)
+            rel = os.path.relpath(src, src_root)
+            seen.add(rel)
+            dst = os.path.join(ram_root, rel)
+            src_stat = _stat_entry(src)
+            prev = manifest.get(rel)
+
+            if prev is None or not os.path.exists(dst) or _stat_entry(dst) != prev["dst"]:
+                to_copy.append((rel, src_stat["size"]))  # new, missing or modified in RAM
+                continue
+            if src_stat == prev["src"]:
+                keep[rel] = prev                         # size and mtime unchanged
+                continue
+            if src_stat["size"] == prev["src"]["size"]:
+                # Touched but maybe not changed (e.g. rsync, git checkout): compare content.
+                prev_hash = prev.get("hash") or file_digest(dst)
+                src_hash = file_digest(src)
+                if src_hash == prev_hash:
+                    keep[rel] = dict(prev, src=src_stat, hash=src_hash)
+                    continue
+            to_copy.append((rel, src_stat["size"]))
+
+    to_delete = [rel for rel in manifest if rel not in seen]
+    for root, _, files in os.walk(ram_root): # stray files never staged by us, e.g. the old full copy
+        for name in files:
+            rel = os.path.relpath(os.path.join(root, name), ram_root)
+            if rel not in seen and rel not in manifest and rel != MANIFEST_NAME:
+                to_delete.append(rel)
+    return to_copy, to_delete, keep
+
+def _stage_files(src_root, ram_root, files, manifest, lock):
+    def stage_one(rel):
+        src, dst = os.path.join(src_root, rel), os.path.join(ram_root, rel)
+        copy_file(src, dst)
+        with lock:
+            manifest[rel] = {"src": _stat_entry(src), "dst": _stat_entry(dst), "hash": None}
+        return rel
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=STAGE_WORKERS) as pool:
+        futures = {pool.submit(stage_one, rel): rel for rel, _ in files}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                failed.append(futures[future])
+                logger.warning("[Stage] Failed to copy %s: %s", futures[future], e)
+    with lock:
+        save_manifest(ram_root, manifest)
+    return failed
+
+def stage_directory(src_root, ram_root, wait_cold=False):
+    """ Incrementally mirror src_root into ram_root. Hot and small files are staged
+        before returning; large cold files continue in a background thread
+        (returned, or None) unless wait_cold is set. """
+    os.makedirs(ram_root, exist_ok=True)
+    start = time.time()
+    to_copy, to_delete, manifest = plan_staging(src_root, ram_root, load_manifest(ram_root))
+
+    large = STAGE_LARGE_FILE_MB * 1024 * 1024
+    # Hot files first, largest first, so the long copies start immediately.
+    to_copy.sort(key=lambda item: (not is_hot(item[0]), -item[1]))
+    foreground = [f for f in to_copy if is_hot(f[0]) or f[1] < large]
+    background = [f for f in to_copy if f not in foreground]
+
+    total = sum(size for _, size in to_copy)
+    logger.info("[Stage] %s -> %s: %d changed (%.1f MB), %d unchanged, %d removed",
+                src_root, ram_root, len(to_copy), total / 1e6, len(manifest), len(to_delete))
+
+    lock = threading.Lock()
+    _stage_files(src_root, ram_root, foreground, manifest, lock)
+    for rel in to_delete:
+        try:
+            os.remove(os.path.join(ram_root, rel))
+        except FileNotFoundError:
+            pass
+    save_manifest(ram_root, manifest)
+    logger.info("[Stage] Hot files ready in %.2fs", time.time() - start)
+
+    if not background:
+        return None
+    def stage_cold():
+        _stage_files(src_root, ram_root, background, manifest, lock)
+        logger.info("[Stage] %d cold files staged in %.2fs", len(background), time.time() - start)
+    if wait_cold:
+        stage_cold()
+        return None
+    t = threading.Thread(target=stage_cold, name="stage-cold", daemon=True)
+    t.start()
+    return t
+
 # ========== Copy Specific Directories to RAM Disk ==========
-def copy_to_ramdisk(env_vars, ramdisk_path=ramdisk_root):
+def copy_to_ramdisk(env_vars, ramdisk_path=ramdisk_root, wait_cold=False):
+    cold_threads = []
     for var in env_vars:
         original_path = os.getenv(var)
         if original_path is None:
-            print(f"[Warning] Environment variable {var} is not set; skipping.")
+            logger.warning("Environment variable %s is not set; skipping.", var)
             continue
 
         if not os.path.exists(original_path):
-            print(f"[SKIP] {var} does not point to a real path: {original_path}")
+            logger.warning("%s does not point to a real path: %s", var, original_path)
             continue
 
         base_name = os.path.basename(original_path.rstrip("/"))
         ram_path = os.path.join(ramdisk_path, base_name)
 
-        print(f"Copying {var} from {original_path} to RAM disk at {ram_path}...")
-        # If destination exists, remove it first to avoid copytree errors
+        logger.info("Staging %s from %s to RAM disk at %s...", var, original_path, ram_path)
         try:
+            thread = stage_directory(original_path, ram_path, wait_cold=wait_cold)
+            if thread:
+                cold_threads.append(thread)
 
-            if os.path.exists(ram_path):
-                print(f"RAM path {ram_path} exists, removing before copy...")
-                shutil.rmtree(ram_path)
-
-            shutil.copytree(original_path, ram_path)
-                        
             ram_var = "RAM_" + var # Set separate RAM var
             os.environ[ram_var] = ram_path # Override environment variable to RAM disk => RAM_
-            print(f"{ram_var} set to {ram_path}")
-            print(f"{var} copied to RAM disk successfully.")
+            logger.debug("%s set to %s", ram_var, ram_path)
+            logger.info("%s staged to RAM disk successfully.", var)
         except Exception as e:
-            print(f"Failed to copy {original_path} to RAM disk: {e}")
+            logger.error("Failed to copy %s to RAM disk: %s", original_path, e)
+    return cold_threads
 
 # ========== Fallback to HDD if RAM Disk Fails ==========
 def safe_load(path_var, fallback_env):
     path = os.getenv(path_var)
-    print(f"Trying to load from {path_var}: {path}")
+    logger.debug("Trying to load from %s: %s", path_var, path)
     if path and os.path.exists(path):
-        print(f"Successfully found {path_var} at: {path}")
+        logger.info("Using %s: %s", path_var, path)
         return path
     else:
-        print(f"[Warning] {path_var} not found or path does not exist: {path}")
+        logger.warning("%s not found or path does not exist: %s", path_var, path)
         fallback_path = os.getenv(fallback_env)
-        print(f"Trying fallback path {fallback_env}: {fallback_path}")
+        logger.debug("Trying fallback path %s: %s", fallback_env, fallback_path)
         if fallback_path and os.path.exists(fallback_path):
-            print(f"Successfully found fallback {fallback_env} at: {fallback_path}")
+            logger.info("Using fallback %s: %s", fallback_env, fallback_path)
             return fallback_path
         else:
-            print(f"[Error] Neither {path_var} nor fallback {fallback_env} paths exist.")
+            logger.error("Neither %s nor fallback %s paths exist.", path_var, fallback_env)
             return None
\ No newline at end of file
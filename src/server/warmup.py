@@ -0,0 +1,160 @@
+"""
+    Background warm-up for the web UI: the embedding model, FAISS index and
+    llama-server connection come up concurrently while the UI and the
+    health/readiness endpoints already accept connections.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# ========== Per-component Readiness ==========
+class Readiness:
+    def __init__(self, components: list[str]):
+        self._cond = threading.Condition()
+        self._state = {
+            name: {"status": "pending", "error": None, "started": None, "seconds": None}
+            for name in components
+        }
+
+    @contextmanager
+    def track(self, name: str):
+        # Mark a component as loading, then ready or failed when the block exits.
+        with self._cond:
+            self._state[name].update(status="loading", started=time.time())
+        try:
+            yield
+        except BaseException as e: # sys.exit() inside a loader must not kill silently
+            self._finish(name, "failed", f"{type(e).__name__}: {e}")
+            logger.error("[Warmup] %s failed: %s", name, e)
+        else:
+            self._finish(name, "ready")
+            logger.info("[Warmup] %s ready in %.2fs", name, self._state[name]["seconds"])
+
+    def _finish(self, name: str, status: str, error: str = None):
+        with self._cond:
+            entry = self._state[name]
+            entry.update(status=status, error=error,
+                         seconds=time.time() - (entry["started"] or time.time()))
+            self._cond.notify_all()
+
+    def is_ready(self, names: list[str] = None) -> bool:
+        with self._cond:
+            return all(self._state[n]["status"] == "ready" for n in (names or self._state))
+
+    def pending(self, names: list[str] = None) -> list[str]:
+        with self._cond:
+            return [n for n in (names or self._state) if self._state[n]["status"] != "ready"]
+
+    def failed(self) -> list[str]:
+        with self._cond:
+            return [n for n, s in self._state.items() if s["status"] == "failed"]
+
+    def wait(self, names: list[str] = None, timeout: float = None) -> bool:
+        # Block until the components are ready, one of them failed, or timeout expires.
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while True:
+                states = [self._state[n]["status"] for n in (names or self._state)]
+                if all(s == "ready" for s in states):
+                    return True
+                if "failed" in states:
+                    return False
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {
+                "ready": all(s["status"] == "ready" for s in self._state.values()),
+                "components": {n: dict(s) for n, s in self._state.items()},
+            }
+
+# ========== Atomic Retriever Holder ==========
+class RetrieverHolder:
+    """ Queries take a reference with get(); swap() replaces it in one step,
+        so in-flight queries finish on the old retriever. """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._retriever = None
+        self._generation = 0
+
+    def get(self):
+        with self._lock:
+            return self._retriever
+
+    def swap(self, retriever):
+        with self._lock:
+            old, self._retriever = self._retriever, retriever
+            self._generation += 1
+        return old
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+# ========== Embedding Proxy ==========
+class DeferredEmbeddings(Embeddings):
+    """ Lets the FAISS index load while the embedding model is still warming up.
+        Embedding calls block until set() provides the real model, or raise
+        once fail() reports that it will never come. """
+    def __init__(self, timeout: float = None):
+        self._ready = threading.Event()
+        self._target = None
+        self._error = None
+        self._timeout = timeout
+
+    def set(self, embedding: Embeddings):
+        self._target = embedding
+        self._ready.set()
+
+    def fail(self, error: BaseException):
+        self._error = error
+        self._ready.set()
+
+    def load(self, loader):
+        """set(loader()), or fail() with its error (re-raised for Readiness.track)."""
+        try:
+            self.set(loader())
+        except BaseException as e:
+            self.fail(e)
+            raise
+
+    def _get(self) -> Embeddings:
+        if not self._ready.wait(self._timeout):
+            raise TimeoutError("Embedding model is still loading.")
+        if self._error is not None:
+            raise RuntimeError(f"Embedding model failed to load: {self._error}") from self._error
+        return self._target
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._get().embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._get().embed_query(text)
+
+# ========== Launch Helpers ==========
+def start_component(readiness: Readiness, name: str, fn, *args):
+    def runner():
+        with readiness.track(name):
+            fn(*args)
+    t = threading.Thread(target=runner, name=f"warmup-{name}", daemon=True)
+    t.start()
+    return t
+
+def stop_on_failure(readiness: Readiness, names: list[str], server):
+    """ Pre-fork workers: stop the uvicorn server when one of the components
+        fails, so the worker exits and the supervisor starts a fresh one
+        instead of it answering 503 forever. """
+    def watch():
+        if not readiness.wait(names):
+            logger.error("[Warmup] %s failed; stopping this worker", ", ".join(readiness.failed()))
+            server.should_exit = True
+    t = threading.Thread(target=watch, name="warmup-watch", daemon=True)
+    t.start()
+    return t
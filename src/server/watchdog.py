@@ -1,10 +1,13 @@
 # Multiple file types: .faiss, .db, .log, .json
 # Recursive monitoring: /mnt/ramdisk/folder
 # Atomic write via temp + os.replace()
-# Per-file debouncing: avoids rapid-fire re-syncs
-# Format-aware validation before overwriting disk
+# Trailing-edge per-file debouncing: the last write of a burst is always synced
+# SQLite snapshots through the online backup API, never raw copies of a live db
+# Cheap header/quick_check validation, full validation on a schedule
+import atexit
+import logging
 import os
-import shutil
+import pickle
 import time
 import faiss
 import sqlite3
@@ -12,6 +15,9 @@ import threading
 import json
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
+
+from config import SYNC_QUIET_SECONDS, SYNC_MAX_DELAY, SYNC_FULL_VALIDATE_INTERVAL
+from server.ramdisk import MANIFEST_NAME, STAGING_SUFFIX, copy_file
 # pip install watchdog
 RAMDISK_ROOT = os.path.expanduser(os.environ["RAMDISK_ROOT"])
 SRC_DIR = os.path.join(RAMDISK_ROOT, "db")
@@ -19,27 +25,39 @@ USER_DIR = os.path.expanduser(os.environ["USER_DIR"])
 DST_DIR = os.path.join(USER_DIR, "db")
 TEMP_DIR = os.path.join(DST_DIR, ".tmp_sync")
 
-print(f"Watchdog resolved DST_DIR: {DST_DIR}")
+logger = logging.getLogger(__name__)
 
 # ========== Validation Logic ==========
-def is_valid_faiss(path):
+# Cheap checks read a few bytes; full checks parse the whole file and only run
+# every SYNC_FULL_VALIDATE_INTERVAL seconds per path.
+SQLITE_HEADER = b"SQLite format 3\x00"
+
+def is_valid_faiss(path, full=False):
     try:
-        _ = faiss.read_index(path)
-        return True
+        if full:
+            _ = faiss.read_index(path)
+            return True
+        with open(path, "rb") as f:
+            fourcc = f.read(4)
+        # Every FAISS index starts with a 4-char type code such as IxF2, IwFl, IxM2.
+        return len(fourcc) == 4 and fourcc[:1] == b"I" and fourcc.isascii() and fourcc.isalnum()
     except:
         return False
 
-def is_valid_sqlite(path):
+def is_valid_sqlite(path, full=False):
     try:
+        with open(path, "rb") as f:
+            if f.read(len(SQLITE_HEADER)) != SQLITE_HEADER:
+                return False
         conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
-        cur = conn.execute("PRAGMA integrity_check;")
+        cur = conn.execute("PRAGMA integrity_check;" if full else "PRAGMA quick_check;")
         result = cur.fetchone()[0]
         conn.close()
         return result == "ok"
     except:
         return False
 
-def is_valid_json(path):
+def is_valid_json(path, full=False):
     try:
         with open(path, "r") as f:
             json.load(f)
@@ -47,10 +65,49 @@ def is_valid_json(path):
     except:
         return False
 
+def is_valid_pickle(path, full=False):
+    try:
+        with open(path, "rb") as f:
+            if full:
+                _ = pickle.load(f)
+                return True
+            head = f.read(2)
+            f.seek(-1, os.SEEK_END)
+            tail = f.read(1)
+        # Protocol 2+ pickles start with PROTO (0x80) and end with STOP (".").
+        return head[:1] == b"\x80" and tail == b"."
+    except:
+        return False
+
+VALIDATORS = {
+    ".faiss": is_valid_faiss,
+    ".db": is_valid_sqlite,
+    ".json": is_valid_json,
+    ".pkl": is_valid_pickle,
+    ".log": lambda path, full=False: True,
+}
+
+_last_full_validation = {}
+
+def validate_file(path, rel_path=None):
+    validator = VALIDATORS.get(os.path.splitext(path)[1])
+    if validator is None:
+        logger.debug("⚠️ Ignored file type: %s", path)
+        return False
+    key = rel_path or path
+    now = time.time()
+    full = now - _last_full_validation.get(key, 0) >= SYNC_FULL_VALIDATE_INTERVAL
+    ok = validator(path, full=full)
+    if ok and full:
+        _last_full_validation[key] = now
+    return ok
+
 # ========== Sync Logic ==========
 def initial_sync():
     for root, _, files in os.walk(SRC_DIR):
         for f in files:
+            if f == MANIFEST_NAME:
+                continue
             full_path = os.path.join(root, f)
             sync_file_to_disk(full_path)
 
@@ -61,101 +118,167 @@ def has_file_changed(src, dst): # checks both size and mtime, avoiding slow hash
     dst_stat = os.stat(dst)
     return src_stat.st_size != dst_stat.st_size or src_stat.st_mtime > dst_stat.st_mtime
 
-def validate_file(path):
-    if path.endswith(".faiss"):
-        return is_valid_faiss(path)
-    elif path.endswith(".db"):
-        return is_valid_sqlite(path)
-    elif path.endswith(".json"):
-        return is_valid_json(path)
-    elif path.endswith(".pkl"):
-        return is_valid_pickle(path)
-    elif path.endswith(".log"):
-        return True
-    else:
-        print(f"⚠️ Ignored file type: {path}")
-        return False
-    
-def is_valid_pickle(path):
+def snapshot_sqlite(src_path, tmp_path):
+    # Online backup API: a consistent snapshot even while the RAM db is being written.
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    src = sqlite3.connect(f"file:{src_path}?mode=ro", uri=True)
+    dst = sqlite3.connect(tmp_path)
     try:
-        import pickle
-        with open(path, "rb") as f:
-            _ = pickle.load(f)
-        return True
-    except:
-        return False
-    
+        with dst:
+            src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+    st = os.stat(src_path)
+    os.utime(tmp_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+
 def sync_file_to_disk(src_path):
     abs_src = os.path.abspath(src_path)
     if abs_src.startswith(os.path.abspath(DST_DIR)) or ".tmp_sync" in abs_src:
-        print(f"🚫 Skipping self-triggered or temp path: {abs_src}")
+        logger.debug("🚫 Skipping self-triggered or temp path: %s", abs_src)
         return
+    if not os.path.exists(src_path):
+        return # deleted or renamed before the timer fired
 
     rel_path = os.path.relpath(src_path, SRC_DIR)
     tmp_path = os.path.join(TEMP_DIR, rel_path)
     dst_path = os.path.join(DST_DIR, rel_path)
 
     if not has_file_changed(src_path, dst_path):
-        print(f"⚖️ Skipping unchanged: {rel_path}")
+        logger.debug("⚖️ Skipping unchanged: %s", rel_path)
+        return
+
+    if os.path.splitext(src_path)[1] not in VALIDATORS:
+        logger.debug("⚠️ Ignored file type: %s", src_path)
         return
 
     os.makedirs(os.path.dirname(tmp_path), exist_ok=True)
-    shutil.copy2(src_path, tmp_path)
+    try:
+        if src_path.endswith(".db"):
+            snapshot_sqlite(src_path, tmp_path)
+        else:
+            copy_file(src_path, tmp_path)
+    except (OSError, sqlite3.Error) as e:
+        logger.error("❌ Copy failed for %s: %s", rel_path, e)
+        return
 
-    if not validate_file(tmp_path):
-        print(f"❌ Validation failed for {rel_path}. Skipping sync.")
+    if not validate_file(tmp_path, rel_path):
+        logger.error("❌ Validation failed for %s. Skipping sync.", rel_path)
         os.remove(tmp_path)
         return
 
     os.makedirs(os.path.dirname(dst_path), exist_ok=True)
     os.replace(tmp_path, dst_path)
-    print(f"✅ Synced: {rel_path}")
+    logger.info("✅ Synced: %s", rel_path)
+
+# ========== Trailing-edge Debounce ==========
+class TrailingDebouncer:
+    """ One timer per key. Every event restarts the key's timer, so the callback
+        runs once the key has been quiet for `quiet` seconds - after the last
+        write of a burst, not the first. A key that never goes quiet still fires
+        at most `max_delay` seconds after its first pending event. """
+    def __init__(self, quiet, max_delay=None):
+        self.quiet = quiet
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._timers = {}
+        self._first_event = {}
+
+    def trigger(self, key, fn, *args):
+        with self._lock:
+            now = time.time()
+            first = self._first_event.setdefault(key, now)
+            timer = self._timers.get(key)
+            if timer:
+                timer.cancel()
+            delay = self.quiet
+            if self.max_delay is not None:
+                delay = max(0.0, min(delay, first + self.max_delay - now))
+            timer = threading.Timer(delay, self._fire, args=(key, fn, args))
+            timer.daemon = True
+            self._timers[key] = timer
+            timer.start()
+
+    def _fire(self, key, fn, args):
+        with self._lock:
+            if self._timers.get(key) is not threading.current_thread():
+                return # superseded by a later event or flushed
+            del self._timers[key]
+            del self._first_event[key]
+        fn(*args)
+
+    def cancel(self, key) -> bool:
+        # Drop a key's pending callback; True if there was one.
+        with self._lock:
+            timer = self._timers.pop(key, None)
+            self._first_event.pop(key, None)
+        if timer:
+            timer.cancel()
+        return timer is not None
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._timers)
+
+    def flush(self):
+        # Run every pending callback now, e.g. on shutdown.
+        with self._lock:
+            timers = list(self._timers.values())
+            self._timers.clear()
+            self._first_event.clear()
+        for timer in timers:
+            timer.cancel()
+            _, fn, args = timer.args
+            fn(*args)
 
 # ========== Watchdog Handler ==========
 class RagSyncHandler(FileSystemEventHandler):
     def __init__(self):
-        self.last_synced = {}
-        self.min_interval = 5  # seconds per-file
+        self.debouncer = TrailingDebouncer(SYNC_QUIET_SECONDS, SYNC_MAX_DELAY)
+        self._sync_lock = threading.Lock() # one sync at a time keeps I/O small
 
     def _should_skip(self, path):
         return (
             path.endswith("~") or
+            path.endswith(STAGING_SUFFIX) or
+            os.path.basename(path) == MANIFEST_NAME or
             ".tmp_sync" in path or
             not path.startswith(SRC_DIR)
         )
 
+    def _sync(self, path):
+        with self._sync_lock:
+            sync_file_to_disk(path)
+
     def on_any_event(self, event):
-        if event.is_directory or self._should_skip(event.src_path):
+        if event.is_directory:
             return
-
-        rel_path = os.path.relpath(event.src_path, SRC_DIR)
-        now = time.time()
-
-        # Debounce rapid writes
-        if rel_path in self.last_synced and now - self.last_synced[rel_path] < self.min_interval:
-            # print(f"⏱️ Skipping rapid re-sync of {rel_path}")
+        # Renames (atomic saves) land on dest_path.
+        path = getattr(event, "dest_path", None) or event.src_path
+        if self._should_skip(path):
             return
-
-        self.last_synced[rel_path] = now
-        sync_file_to_disk(event.src_path)
+        rel_path = os.path.relpath(path, SRC_DIR)
+        self.debouncer.trigger(rel_path, self._sync, path)
 
 # ========== Entry Point ==========
 def start_watchdog(path=SRC_DIR):
     if not os.path.ismount(RAMDISK_ROOT):
-        print(f"❌ Watchdog source path does not exist: {SRC_DIR}")
-        print("⚠️ RAMDISK not mounted. Falling back to HDD.")
+        logger.warning("❌ Watchdog source path does not exist: %s", SRC_DIR)
+        logger.warning("⚠️ RAMDISK not mounted. Falling back to HDD.")
         return
 
     os.makedirs(DST_DIR, exist_ok=True)
     os.makedirs(TEMP_DIR, exist_ok=True)
 
-    print(f"👁️ Watching: {path}")
-    print(f"📤 Backing up to: {DST_DIR}")
+    logger.info("👁️ Watching: %s", path)
+    logger.info("📤 Backing up to: %s", DST_DIR)
 
     initial_sync()  # one-time sync
 
+    handler = RagSyncHandler()
     observer = Observer()
-    observer.schedule(RagSyncHandler(), path=path, recursive=True)
+    observer.schedule(handler, path=path, recursive=True)
     observer.start()
 
     def monitor():
@@ -168,6 +291,9 @@ def start_watchdog(path=SRC_DIR):
 
     t = threading.Thread(target=monitor, daemon=True)
     t.start()
+    atexit.register(handler.debouncer.flush) # persist the final state of pending writes
 
 if __name__ == "__main__":
-    start_watchdog()
\ No newline at end of file
+    from server.logger import setup_logging
+    setup_logging()
+    start_watchdog()
@@ -1,36 +1,100 @@
 import gradio as gr
+import logging
+import os
 import socket
-import threading
-import time
+import sys
+import uvicorn
+from fastapi import FastAPI, Query
+from fastapi.responses import JSONResponse, PlainTextResponse
 
-from config import MODEL_PATH
-from main import setup_retriever
+from config import WEBUI_HOST, WEBUI_PORT, QUERY_WAIT_TIMEOUT, LLM_WARMUP_TIMEOUT
+from main import setup_retriever, load_embedding, split_file
 from context.provenance import run_rag_with_provenance
+from server.ingest import start_ingestion_daemon
+from server.llm import parse_args, wait_for_llama_server, log_runtime_info
+from server.logger import setup_logging
+from server.metrics import render_prometheus, dump_json
+from server.profiler import query_profiler
+from server.warmup import Readiness, RetrieverHolder, DeferredEmbeddings, start_component
 
-retriever = None
+logger = logging.getLogger(__name__)
+
+# Components a query needs before it can be answered.
+COMPONENTS = ["embedding", "index", "llm"]
+
+readiness = Readiness(COMPONENTS)
+retriever_holder = RetrieverHolder()
+ingestion = None
 
 def print_local_ip():
     hostname = socket.gethostname()
     local_ip = socket.gethostbyname(hostname)
-    print(f"Web UI running at http://{local_ip}:7860")
+    logger.info("Web UI running at http://%s:%s", local_ip, WEBUI_PORT)
+
+# ========== Warm-up ==========
+def warm_up(args, embedding_loader=load_embedding):
+    # Index, embedding model and LLM connection load concurrently. The index only
+    # needs the embedding when it has to be (re)built, so it gets a proxy.
+    embedding = DeferredEmbeddings()
+
+    def load_index():
+        global ingestion
+        retriever_holder.swap(setup_retriever(args, embedding))
+        if args.watch:
+            ingestion = start_ingestion_daemon(args, lambda: retriever_holder.get().vectorstore, split_file)
+
+    start_component(readiness, "embedding", embedding.load, embedding_loader)
+    start_component(readiness, "index", load_index)
+    start_component(readiness, "llm", wait_for_llama_server, LLM_WARMUP_TIMEOUT)
 
 def gradio_rag(query, history):
+    # Queue the query for up to QUERY_WAIT_TIMEOUT while warming up, then reject.
+    if not readiness.wait(COMPONENTS, timeout=QUERY_WAIT_TIMEOUT):
+        failed = readiness.failed()
+        if failed:
+            return f"Service unavailable, failed to load: {', '.join(failed)}"
+        return f"Still warming up ({', '.join(readiness.pending())}). Please retry shortly."
     try:
-        print(f"Got query: {query}")
-        sources, answer = run_rag_with_provenance(query, retriever, MODEL_PATH)
+        logger.info("Got query: %s", query)
+        sources, answer = run_rag_with_provenance(query, retriever_holder.get())
     except Exception as e:
-        print(f"[ERROR] Failed to run RAG: {e}")
+        logger.error("Failed to run RAG: %s", e)
         sources, answer = "Error:", str(e)
     return answer + "\n\nSources: " + sources
 
-iface = gr.ChatInterface(
-    fn=gradio_rag,
-    title="Local RAG OCR",
-    description="Ask questions over your local documents using a LLaMA-backed RAG system.",
-    theme="soft",
-)
+# ========== Health / Readiness ==========
+def build_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/health")
+    def health():
+        # Liveness: the process accepts connections.
+        return {"status": "ok"}
+
+    @app.get("/ready")
+    def ready():
+        snapshot = readiness.snapshot()
+        return JSONResponse(snapshot, status_code=200 if snapshot["ready"] else 503)
+
+    @app.get("/metrics")
+    def metrics():
+        return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+    @app.get("/metrics.json")
+    def metrics_json():
+        return dump_json()
+
+    @app.get("/ingest")
+    def ingest_stats():
+        # Live ingestion lag and queue length (only with --watch).
+        return ingestion.stats() if ingestion else {"enabled": False}
+
+    @app.post("/profile")
+    def profile_queries(queries: int = Query(1, ge=0, le=100)):
+        # cProfile + tracemalloc for the next N queries, written to PROFILE_DIR.
+        query_profiler.arm(queries)
+        return {"armed": query_profiler.remaining()}
 
-def launch_gradio():
     chat = gr.Chatbot()
     iface = gr.ChatInterface(
         fn=gradio_rag,
@@ -39,20 +103,25 @@ def launch_gradio():
         description="Ask questions over your local documents using a LLaMA-backed RAG system.",
         theme="soft",
     )
+    return gr.mount_gradio_app(app, iface, path="/")
 
+def launch_gradio():
+    app = build_app()
     print_local_ip()
-    iface.launch()
+    uvicorn.run(app, host=WEBUI_HOST, port=WEBUI_PORT)
 
 if __name__ == "__main__":
-    def retriever_loader():
-        global retriever
-        retriever = setup_retriever()
-
-    thread = threading.Thread(target=retriever_loader)
-    thread.start()
-
-    while retriever is None:
-        print("Waiting for retriever...")
-        time.sleep(1)
-
-    launch_gradio()
\ No newline at end of file
+    args = parse_args()
+    setup_logging(args.log_level)
+    log_runtime_info()
+    os.environ["TOPIC"] = args.topic
+    if args.watch and args.snapshot:
+        sys.exit("[Fatal] --watch cannot update a read-only snapshot; run it in a separate main.py process")
+    if args.workers > 1:
+        # Gradio keeps its event queue and chat sessions in the process that
+        # opened them; behind a shared socket they would land on other workers.
+        sys.exit("[Fatal] --workers needs a stateless server: use api.py (Gradio sessions live in one process)")
+    if args.profile_queries:
+        query_profiler.arm(args.profile_queries)
+    warm_up(args)
+    launch_gradio()